@@ -0,0 +1,268 @@
+"""
+Banco de pruebas de rendimiento sobre los estudios de data/cis_studies.
+
+Para cada libro (y su PDF de estimación, si existe) mide las operaciones del
+núcleo: crear_estudio, cada método extraer_* de EstudioCIS, _extraer_estimacion_cis_pdf,
+calcular_aldabon_gemini, cis_analyzer.analyze_cis_professional y engine_v2.get_cis_data.
+
+Cada operación se ejecuta `--calentamiento` veces sin medir y `--repeticiones` veces
+cronometradas, en frío (se vacía la caché de hojas antes de cada llamada salvo con
+--cache-caliente). Una pasada aparte, con tracemalloc y la instrumentación de
+cis_instrumentacion activas, mide el pico de memoria y las filas leídas/recorridas,
+para que ese coste no contamine los tiempos.
+
+No necesita red: la conexión de sockets queda bloqueada mientras se mide.
+
+Uso:
+    python benchmark_cis.py                              # tabla por archivo y operación
+    python benchmark_cis.py --guardar base.json          # guarda la línea base (JSON)
+    python benchmark_cis.py --comparar base.json         # marca regresiones, exit 1 si hay
+    python benchmark_cis.py data/cis_studies/3543-multi_A.xlsx -r 10 --umbral 0.1
+"""
+
+import argparse
+import contextlib
+import glob
+import io
+import json
+import os
+import platform
+import re
+import socket
+import statistics
+import sys
+import time
+import tracemalloc
+
+import pandas as pd
+
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(ROOT_DIR, 'web_app'))
+
+import cis_analyzer
+import cis_instrumentacion
+from cis_cache import firma_archivo, es_libro_valido
+from cis_estudios import crear_estudio, HOJAS
+from engine_v2 import get_cis_data
+
+PATRON_CORPUS = os.path.join(ROOT_DIR, "data", "cis_studies", "*.xlsx")
+
+# Versión del formato del JSON de línea base
+VERSION_BASE = 1
+
+# Contadores de cis_instrumentacion que se agregan por operación
+CONTADORES = ('filas_leidas', 'filas_recorridas', 'celdas_leidas', 'paginas_pdf')
+
+
+def pdf_asociado(path: str) -> str:
+    """PDF de estimación del estudio (mismo criterio que tipo_estudio), o None."""
+    base_id = re.split(r'[_-]', os.path.basename(path))[0]
+    for suf in ['_Estimacion.pdf', '-Estimacion.pdf']:
+        candidato = os.path.join(os.path.dirname(path), f"{base_id}{suf}")
+        if os.path.exists(candidato):
+            return candidato
+    return None
+
+
+def operaciones(path: str) -> list:
+    """[(nombre, función sin argumentos)] a medir sobre un libro."""
+    estudio = crear_estudio(path)
+
+    def metodo(nombre):
+        def llamar():
+            estudio._inferred_data = None
+            return getattr(estudio, nombre)()
+        return llamar
+
+    ops = [('crear_estudio', lambda: crear_estudio(path))]
+    ops += [(n, metodo(n)) for n in sorted(dir(estudio))
+            if n.startswith('extraer_') and callable(getattr(estudio, n))]
+    if pdf_asociado(path):
+        ops.append(('_extraer_estimacion_cis_pdf', metodo('_extraer_estimacion_cis_pdf')))
+    ops += [
+        ('calcular_aldabon_gemini', metodo('calcular_aldabon_gemini')),
+        ('analyze_cis_professional', lambda: cis_analyzer.analyze_cis_professional(path)),
+        ('get_cis_data', lambda: get_cis_data(path)),
+    ]
+    return ops
+
+
+def _llamar(func) -> str:
+    """Ejecuta la operación sin su salida por consola. Devuelve 'ok' o 'error: ...'."""
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            resultado = func()
+    except Exception as e:
+        return f"error: {e}"
+    if resultado is None:
+        return "error: sin resultado"
+    if isinstance(resultado, dict) and resultado.get('status') == 'error':
+        return f"error: {resultado.get('message')}"
+    return "ok"
+
+
+def _pasada_perfil(func, en_frio) -> dict:
+    """Pico de memoria (tracemalloc) y contadores de filas de una llamada."""
+    traza_previa = cis_instrumentacion.ACTIVO
+    tracemalloc_previo = tracemalloc.is_tracing()
+    en_frio()
+    cis_instrumentacion.reiniciar()
+    cis_instrumentacion.activar()
+    if not tracemalloc_previo:
+        tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+    tracemalloc.reset_peak()
+    try:
+        with cis_instrumentacion.tramo('benchmark'):
+            _llamar(func)
+        pico = tracemalloc.get_traced_memory()[1] - base
+    finally:
+        if not tracemalloc_previo:
+            tracemalloc.stop()
+        if not traza_previa:
+            cis_instrumentacion.desactivar()
+    perfil = {'pico_bytes': max(0, pico)}
+    filas = cis_instrumentacion.resumen()
+    for c in CONTADORES:
+        perfil[c] = sum(f['contadores'].get(c, 0) for f in filas)
+    cis_instrumentacion.reiniciar()
+    return perfil
+
+
+def medir(func, repeticiones: int, calentamiento: int, en_frio) -> dict:
+    for _ in range(calentamiento):
+        en_frio()
+        _llamar(func)
+    tiempos = []
+    estado = "ok"
+    for _ in range(repeticiones):
+        en_frio()
+        t0 = time.perf_counter()
+        estado = _llamar(func)
+        tiempos.append((time.perf_counter() - t0) * 1000)
+    return {
+        'estado': estado,
+        'ms': {'min': min(tiempos), 'mediana': statistics.median(tiempos),
+               'media': statistics.fmean(tiempos), 'max': max(tiempos)},
+        **_pasada_perfil(func, en_frio)
+    }
+
+
+@contextlib.contextmanager
+def sin_red():
+    """Bloquea las conexiones de red: el banco de pruebas debe correr offline."""
+    def denegar(*args, **kwargs):
+        raise OSError("benchmark_cis: acceso a red bloqueado")
+    original_connect, original_create = socket.socket.connect, socket.create_connection
+    socket.socket.connect, socket.create_connection = denegar, denegar
+    try:
+        yield
+    finally:
+        socket.socket.connect, socket.create_connection = original_connect, original_create
+
+
+def ejecutar(archivos: list, repeticiones: int, calentamiento: int, cache_caliente: bool = False) -> dict:
+    """Mide todas las operaciones de todos los archivos y devuelve el documento de línea base."""
+    en_frio = (lambda: None) if cache_caliente else HOJAS.clear
+    resultados = []
+    with sin_red():
+        for path in archivos:
+            nombre = os.path.basename(path)
+            print(f"{nombre}...", flush=True)
+            try:
+                with contextlib.redirect_stdout(io.StringIO()):
+                    ops = operaciones(path)
+            except Exception as e:
+                print(f"  ERROR preparando {nombre}: {e}")
+                continue
+            firma = list(firma_archivo(path))
+            for op, func in ops:
+                r = medir(func, repeticiones, calentamiento, en_frio)
+                r.update({'archivo': nombre, 'operacion': op, 'firma': firma})
+                resultados.append(r)
+                print(f"  {op:<42} {r['ms']['mediana']:>9.1f} ms  {r['estado'][:60]}", flush=True)
+    return {
+        'version': VERSION_BASE,
+        'fecha': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'entorno': {'python': platform.python_version(), 'pandas': pd.__version__,
+                    'plataforma': platform.platform(), 'procesador': platform.processor()},
+        'parametros': {'repeticiones': repeticiones, 'calentamiento': calentamiento,
+                       'cache_caliente': cache_caliente},
+        'resultados': resultados
+    }
+
+
+def tabla(doc: dict) -> str:
+    lineas = [f"{'Archivo':<20} {'Operación':<42} {'Mediana ms':>10} {'Mín ms':>9} {'Pico MB':>8} "
+              f"{'Filas leídas':>12} {'Recorridas':>10}  Estado", "-" * 130]
+    for r in doc['resultados']:
+        lineas.append(f"{r['archivo'][:20]:<20} {r['operacion'][:42]:<42} {r['ms']['mediana']:>10.1f} "
+                      f"{r['ms']['min']:>9.1f} {r['pico_bytes'] / 1048576:>8.1f} {r['filas_leidas']:>12} "
+                      f"{r['filas_recorridas']:>10}  {r['estado'][:40]}")
+    return "\n".join(lineas)
+
+
+def comparar(base: dict, actual: dict, umbral: float, minimo_ms: float) -> list:
+    """
+    Regresiones de `actual` frente a `base`: [(archivo, operación, métrica, antes, después)].
+    Tiempo (mediana) y pico de memoria cuentan si crecen más de `umbral` (fracción);
+    los tiempos además deben crecer más de `minimo_ms` para no marcar ruido en operaciones
+    muy cortas. Una operación que pasa de 'ok' a error también es regresión.
+    Las entradas cuyo libro ha cambiado (firma distinta) no se comparan.
+    """
+    anteriores = {(r['archivo'], r['operacion']): r for r in base['resultados']}
+    regresiones = []
+    for r in actual['resultados']:
+        a = anteriores.get((r['archivo'], r['operacion']))
+        if a is None or a.get('firma') != r.get('firma'):
+            continue
+        clave = (r['archivo'], r['operacion'])
+        if a['estado'] == 'ok' and r['estado'] != 'ok':
+            regresiones.append(clave + ('estado', a['estado'], r['estado']))
+        antes, despues = a['ms']['mediana'], r['ms']['mediana']
+        if despues > antes * (1 + umbral) and despues - antes > minimo_ms:
+            regresiones.append(clave + ('ms', round(antes, 1), round(despues, 1)))
+        antes, despues = a['pico_bytes'], r['pico_bytes']
+        if despues > antes * (1 + umbral) and despues - antes > 1048576:
+            regresiones.append(clave + ('pico_bytes', antes, despues))
+    return regresiones
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Banco de pruebas de rendimiento del corpus CIS")
+    parser.add_argument('archivos', nargs='*', help="Libros a medir (por defecto, todo data/cis_studies)")
+    parser.add_argument('-r', '--repeticiones', type=int, default=5)
+    parser.add_argument('-c', '--calentamiento', type=int, default=1)
+    parser.add_argument('--cache-caliente', action='store_true',
+                        help="No vaciar la caché de hojas entre llamadas")
+    parser.add_argument('--guardar', metavar='JSON', help="Guardar los resultados como línea base")
+    parser.add_argument('--comparar', metavar='JSON', help="Comparar con una línea base guardada")
+    parser.add_argument('--umbral', type=float, default=0.2,
+                        help="Crecimiento relativo que cuenta como regresión (0.2 = 20%%)")
+    parser.add_argument('--minimo-ms', type=float, default=5.0,
+                        help="Crecimiento absoluto mínimo del tiempo para marcar regresión")
+    args = parser.parse_args()
+
+    archivos = args.archivos or sorted(p for p in glob.glob(PATRON_CORPUS) if es_libro_valido(p))
+    doc = ejecutar(archivos, args.repeticiones, args.calentamiento, args.cache_caliente)
+    print("\n" + tabla(doc))
+
+    if args.guardar:
+        with open(args.guardar, 'w', encoding='utf-8') as f:
+            json.dump(doc, f, ensure_ascii=False, indent=2)
+        print(f"\nLínea base guardada en {args.guardar}")
+
+    if args.comparar:
+        with open(args.comparar, encoding='utf-8') as f:
+            base = json.load(f)
+        regresiones = comparar(base, doc, args.umbral, args.minimo_ms)
+        print(f"\nComparación con {args.comparar} ({base['fecha']}), umbral {args.umbral:.0%}:")
+        if not regresiones:
+            print("  Sin regresiones.")
+        for archivo, op, metrica, antes, despues in regresiones:
+            print(f"  REGRESIÓN {archivo} {op} [{metrica}]: {antes} -> {despues}")
+        sys.exit(1 if regresiones else 0)
+
+
+if __name__ == "__main__":
+    main()
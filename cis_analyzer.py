@@ -3,11 +3,14 @@ import sys
 import os
 import re
 
+from cis_instrumentacion import tramo, contar, instrumentar
+
 try:
     from cis_pdf_processor import extract_official_data_from_pdf
 except ImportError:
     extract_official_data_from_pdf = None
 
+@instrumentar()
 def detect_ambito_y_ficha(xl):
     """Analiza las hojas RV y la ficha técnica para determinar el ámbito real."""
     meta = {
@@ -118,6 +121,7 @@ def get_baseline_results(ambito, region=None):
         }
     return {}
 
+@instrumentar()
 def find_rv_sheet(xl):
     """Localiza la hoja de Recuerdo de Voto por contenido."""
     # Prioridad 1: Nombres directos
@@ -142,6 +146,7 @@ def normalize_name(val):
     FALLBACK: Si no hay match en el mapeo y no es categoría excluida,
     devuelve el nombre capitalizado para capturar partidos regionales.
     """
+    contar('normalizaciones_partido')
     if pd.isna(val): return ""
     p = str(val).replace('*','').upper().strip()
     
@@ -180,11 +185,13 @@ def normalize_name(val):
     # FALLBACK: devolver nombre capitalizado para partidos regionales desconocidos
     return p.strip().title()
 
+@instrumentar()
 def analyze_cis_professional(file_path, study_type=None):
     print(f"--- ANALISIS PROFESIONAL: {os.path.basename(file_path)} ---", flush=True)
     
     try:
-        xl = pd.ExcelFile(file_path)
+        with tramo('abrir_libro', archivo=os.path.basename(file_path)):
+            xl = pd.ExcelFile(file_path)
         meta = detect_ambito_y_ficha(xl)
         
         # Usar baselines OFICIALES verificados (Ministerio del Interior / Gobierno de Aragón)
@@ -197,7 +204,8 @@ def analyze_cis_professional(file_path, study_type=None):
         print(f"  Baseline oficial: {list(voto_real_ref.keys())[:5]}...", flush=True)
         
         # Cargar hoja RV para uso posterior
-        df_rv = pd.read_excel(xl, sheet_name=rv_sheet) if rv_sheet else None
+        with tramo('leer_hoja', hoja=rv_sheet):
+            df_rv = pd.read_excel(xl, sheet_name=rv_sheet) if rv_sheet else None
 
         df_estim_official = None
         df_raw_source = None
@@ -205,7 +213,8 @@ def analyze_cis_professional(file_path, study_type=None):
         # Búsqueda de Estimación Oficial
         estim_sheet = next((s for s in xl.sheet_names if any(x in s.upper() for x in ['ESTIMACI', 'AVANCE', 'VOTO_EST'])), None)
         if estim_sheet:
-            df_estim_official = pd.read_excel(xl, sheet_name=estim_sheet)
+            with tramo('leer_hoja', hoja=estim_sheet):
+                df_estim_official = pd.read_excel(xl, sheet_name=estim_sheet)
             # Ampliar a 50 filas para archivos con notas metodológicas extensas
             content = " ".join(df_estim_official.iloc[:50].astype(str).values.flatten()).upper()
             if "VOTO DIRECTO" in content or "VOTO + SIMPATÍA" in content: 
@@ -229,7 +238,8 @@ def analyze_cis_professional(file_path, study_type=None):
         for pv in pdf_variants:
              pdf_path = os.path.join(os.path.dirname(file_path), pv)
              if os.path.exists(pdf_path) and extract_official_data_from_pdf:
-                  df_pdf = extract_official_data_from_pdf(pdf_path)
+                  with tramo('extraer_texto_pdf', pdf=pv):
+                       df_pdf = extract_official_data_from_pdf(pdf_path)
                   if df_pdf is not None and len(df_pdf) > 0:
                        # El PDF retorna DataFrame con ['Partido', 'Estimación']
                        # Convertir directamente a diccionario (NO usar extract_from_dataframe)
@@ -254,16 +264,13 @@ def analyze_cis_professional(file_path, study_type=None):
                   print(f"  Excel Voto Directo: {list(voto_directo_excel.keys())[:4]}...", flush=True)
                   print(f"  Excel Estimación CIS: {list(cis_oficial.keys())[:4]}...", flush=True)
              
-             # Fallback: Escanear todas las hojas si falla
+             # Fallback: buscar en las hojas candidatas según el pre-índice (no en todas)
              if not cis_oficial:
-                  for sheet in xl.sheet_names:
-                       if sheet == estim_sheet: continue
-                       df_alt = pd.read_excel(xl, sheet_name=sheet)
-                       extracted = extract_from_dataframe(df_alt, voto_real_ref)
-                       if extracted.get('estimacion_cis'):
-                            voto_directo_excel = extracted.get('voto_directo', {})
-                            cis_oficial = extracted.get('estimacion_cis', {})
-                            break
+                  hoja_alt, extracted = buscar_estimacion_alternativa(xl, voto_real_ref, excluir=[estim_sheet])
+                  if hoja_alt:
+                       voto_directo_excel = extracted.get('voto_directo', {})
+                       cis_oficial = extracted.get('estimacion_cis', {})
+                       print(f"  Fallback Estimación CIS: hoja '{hoja_alt}'", flush=True)
 
         # B. Extraer Intención de Voto desde hoja RV (Fuente unificada para Barómetros y Avances)
         # La tabla RV tiene: fila con nombres de partidos (PP, PSOE...) y fila (N) con totales ABSOLUTOS
@@ -272,6 +279,7 @@ def analyze_cis_professional(file_path, study_type=None):
              # Buscar fila con nombres de partidos
              party_row = -1
              for i in range(min(50, len(df_rv))):
+                  contar('filas_recorridas')
                   row_str = ' '.join([str(x).upper() for x in df_rv.iloc[i].values])
                   if 'PP' in row_str and 'PSOE' in row_str and 'VOX' in row_str:
                        party_row = i
@@ -307,51 +315,54 @@ def analyze_cis_professional(file_path, study_type=None):
                                       voto_simp[p_key] = (val / total_abs) * 100
 
         # 4. Extracción de Recuerdo de Voto (porcentajes, no absolutos)
-        recuerdo_enc = {}
-        if df_rv is not None:
-             # Buscar fila con nombres de partidos
-             party_row = -1
-             for i in range(min(50, len(df_rv))):
-                  row_str = ' '.join([str(x).upper() for x in df_rv.iloc[i].values])
-                  if 'PP' in row_str and 'PSOE' in row_str:
-                       party_row = i
-                       break
+        with tramo('recuerdo_voto'):
+            recuerdo_enc = {}
+            if df_rv is not None:
+                 # Buscar fila con nombres de partidos
+                 party_row = -1
+                 for i in range(min(50, len(df_rv))):
+                      contar('filas_recorridas')
+                      row_str = ' '.join([str(x).upper() for x in df_rv.iloc[i].values])
+                      if 'PP' in row_str and 'PSOE' in row_str:
+                           party_row = i
+                           break
              
-             if party_row >= 0:
-                  # Buscar fila de porcentajes (suele estar justo después de (N))
-                  n_rows = df_rv[df_rv.iloc[:, 0].astype(str).str.contains(r"\(N\)", na=False, regex=True)].index
-                  if len(n_rows) > 0:
-                       n_idx = n_rows[0]
-                       # Los porcentajes están en la fila (N) como proporción del total
-                       total = 0
-                       for col_idx, val in enumerate(df_rv.iloc[party_row].values):
-                            p_key = normalize_name(val)
-                            if p_key in voto_real_ref:
-                                 v = try_float(df_rv.iloc[n_idx, col_idx])
-                                 if v: total += v
+                 if party_row >= 0:
+                      # Buscar fila de porcentajes (suele estar justo después de (N))
+                      n_rows = df_rv[df_rv.iloc[:, 0].astype(str).str.contains(r"\(N\)", na=False, regex=True)].index
+                      if len(n_rows) > 0:
+                           n_idx = n_rows[0]
+                           # Los porcentajes están en la fila (N) como proporción del total
+                           total = 0
+                           for col_idx, val in enumerate(df_rv.iloc[party_row].values):
+                                p_key = normalize_name(val)
+                                if p_key in voto_real_ref:
+                                     v = try_float(df_rv.iloc[n_idx, col_idx])
+                                     if v: total += v
                        
-                       if total > 0:
-                            for col_idx, val in enumerate(df_rv.iloc[party_row].values):
-                                 p_key = normalize_name(val)
-                                 if p_key in voto_real_ref:
-                                      v = try_float(df_rv.iloc[n_idx, col_idx])
-                                      if v: recuerdo_enc[p_key] = (v / total) * 100
+                           if total > 0:
+                                for col_idx, val in enumerate(df_rv.iloc[party_row].values):
+                                     p_key = normalize_name(val)
+                                     if p_key in voto_real_ref:
+                                          v = try_float(df_rv.iloc[n_idx, col_idx])
+                                          if v: recuerdo_enc[p_key] = (v / total) * 100
 
         # 5. Metodología Aldabón-Gemini (Solo si hay Recuerdo de Voto)
-        final = {}
-        if df_rv is not None:
-             sum_rec = sum([recuerdo_enc.get(p, 0) for p in voto_real_ref])
-             k_factors = {p: (voto_real_ref[p] / (recuerdo_enc.get(p, 0) / sum_rec * 100) if (sum_rec > 0 and recuerdo_enc.get(p, 0) > 0) else 1.0) for p in voto_real_ref}
+        with tramo('metodologia_aldabon'):
+            final = {}
+            if df_rv is not None:
+                 sum_rec = sum([recuerdo_enc.get(p, 0) for p in voto_real_ref])
+                 k_factors = {p: (voto_real_ref[p] / (recuerdo_enc.get(p, 0) / sum_rec * 100) if (sum_rec > 0 and recuerdo_enc.get(p, 0) > 0) else 1.0) for p in voto_real_ref}
 
-             ajustes = {'PSOE': 0.94, 'PP': 0.93, 'VOX': 0.85, 'SUMAR': 0.88, 'PODEMOS': 0.82, 'SALF': 1.10}
-             estim_aj = {}
-             for p in voto_simp:
-                  k = k_factors.get(p, 1.0)
-                  if p == 'PODEMOS' and 'SUMAR' in k_factors: k = k_factors['SUMAR']
-                  estim_aj[p] = voto_simp[p] * k * ajustes.get(p, 1.0)
+                 ajustes = {'PSOE': 0.94, 'PP': 0.93, 'VOX': 0.85, 'SUMAR': 0.88, 'PODEMOS': 0.82, 'SALF': 1.10}
+                 estim_aj = {}
+                 for p in voto_simp:
+                      k = k_factors.get(p, 1.0)
+                      if p == 'PODEMOS' and 'SUMAR' in k_factors: k = k_factors['SUMAR']
+                      estim_aj[p] = voto_simp[p] * k * ajustes.get(p, 1.0)
 
-             total = sum(estim_aj.values())
-             final = {p: round(v * 100 / total, 1) for p, v in estim_aj.items()} if total > 0 else {}
+                 total = sum(estim_aj.values())
+                 final = {p: round(v * 100 / total, 1) for p, v in estim_aj.items()} if total > 0 else {}
 
         # Usar voto_directo_excel si está disponible, sino usar voto_simp
         raw_to_use = voto_directo_excel if voto_directo_excel else {p: round(voto_simp.get(p,0), 1) for p in (final if final else cis_oficial)}
@@ -365,6 +376,74 @@ def analyze_cis_professional(file_path, study_type=None):
     except Exception as e:
         print(f"Error Crítico: {e}"); return None
 
+# Filas que lee extract_from_dataframe (100 + 1 de anticipación para los saltos de 3543)
+FILAS_ESTIMACION = 101
+
+# Indicios de tabla de estimación en el nombre de la hoja o en sus etiquetas de columna 0
+CLAVES_ESTIMACION = ['ESTIMACI', 'VOTO DIRECTO', 'VOTO + SIMPAT', 'INTERVALO DE CONFIANZA']
+
+def partidos_busqueda(voto_real_ref):
+    """Lista de partidos que extract_from_dataframe reconoce en la columna 0."""
+    return list(voto_real_ref.keys()) + ['SALF', 'PODEMOS', 'SE ACABÓ', 'TERUEL EXISTE', 'IU-MOVIMIENTO SUMAR', 'PODEMOS-AV']
+
+def es_fila_partido(p_name, search_list):
+    """Mismo criterio que extract_from_dataframe para considerar una fila como partido."""
+    p_key = normalize_name(p_name)
+    return bool(p_key) and (p_key in search_list or any(s in p_name for s in ['PP', 'PSOE', 'VOX', 'CHA', 'SUMAR', 'PODEMOS', 'TERUEL', 'PAR']))
+
+def etiquetas_columna0(xl, sheet, max_filas=FILAS_ESTIMACION + 1):
+    """Etiquetas de la columna 0 de las primeras filas, sin parsear la hoja completa."""
+    book = getattr(xl, 'book', None)
+    if hasattr(book, 'sheetnames'):
+        # openpyxl (pandas lo abre en modo read_only): se leen solo las celdas de la columna A
+        try:
+            rows = book[sheet].iter_rows(max_row=max_filas, max_col=1, values_only=True)
+            return [r[0] for r in rows if r and r[0] is not None]
+        except Exception:
+            pass
+    df = pd.read_excel(xl, sheet_name=sheet, header=None, nrows=max_filas, usecols=[0])
+    return df.iloc[:, 0].dropna().tolist() if df.shape[1] else []
+
+@instrumentar()
+def indexar_hojas(xl, voto_real_ref, excluir=()):
+    """Pre-índice por hoja para el fallback de estimación, ordenado de más a menos probable.
+    
+    Descarta las hojas sin ninguna fila de partido en la columna 0 (extract_from_dataframe
+    no podría extraer nada de ellas) y prioriza por palabras clave y nº de partidos.
+    """
+    search_list = partidos_busqueda(voto_real_ref)
+    indice = []
+    for orden, sheet in enumerate(xl.sheet_names):
+        if sheet in excluir: continue
+        etiquetas = [str(e).upper().strip() for e in etiquetas_columna0(xl, sheet)]
+        filas_partido = [e for e in etiquetas if es_fila_partido(e, search_list)]
+        if not filas_partido: continue
+        texto = sheet.upper() + " " + " ".join(etiquetas)
+        indice.append({
+            'hoja': sheet,
+            'claves': sum(1 for c in CLAVES_ESTIMACION if c in texto),
+            'partidos': len({normalize_name(e) for e in filas_partido} & set(search_list)),
+            'orden': orden
+        })
+    indice.sort(key=lambda h: (-h['claves'], -h['partidos'], h['orden']))
+    return indice
+
+@instrumentar()
+def buscar_estimacion_alternativa(xl, voto_real_ref, excluir=(), max_candidatas=3):
+    """Fallback de la hoja de Estimación: parsea solo las mejores candidatas del pre-índice.
+    
+    Se detiene en la primera (por orden de probabilidad) con Estimación CIS válida.
+    Retorna (hoja, extracted) o (None, {}).
+    """
+    for h in indexar_hojas(xl, voto_real_ref, excluir)[:max_candidatas]:
+        with tramo('leer_hoja', hoja=h['hoja']):
+            df = pd.read_excel(xl, sheet_name=h['hoja'], nrows=FILAS_ESTIMACION)
+        extracted = extract_from_dataframe(df, voto_real_ref)
+        if extracted.get('estimacion_cis'):
+            return h['hoja'], extracted
+    return None, {}
+
+@instrumentar()
 def extract_from_dataframe(df, voto_real_ref):
     """Extrae Voto Directo (col 1) y Estimación CIS (col 3) de la hoja de Estimación."""
     try:
@@ -372,14 +451,15 @@ def extract_from_dataframe(df, voto_real_ref):
         estimacion_cis = {}
         
         # Lista de partidos a buscar
-        search_list = list(voto_real_ref.keys()) + ['SALF', 'PODEMOS', 'SE ACABÓ', 'TERUEL EXISTE', 'IU-MOVIMIENTO SUMAR', 'PODEMOS-AV']
+        search_list = partidos_busqueda(voto_real_ref)
         
         for i in range(min(100, len(df))):
+            contar('filas_recorridas')
             row = df.iloc[i]
             p_name = str(row.iloc[0]).upper().strip() if pd.notna(row.iloc[0]) else ""
             p_key = normalize_name(p_name)
             
-            if p_key and (p_key in search_list or any(s in p_name for s in ['PP', 'PSOE', 'VOX', 'CHA', 'SUMAR', 'PODEMOS', 'TERUEL', 'PAR'])):
+            if es_fila_partido(p_name, search_list):
                 # Normalizar nombre de partido
                 if 'SUMAR' in p_name: p_key = 'SUMAR'
                 elif 'PODEMOS' in p_name: p_key = 'PODEMOS'
@@ -429,6 +509,7 @@ def extract_from_dataframe(df, voto_real_ref):
         return {}
 
 def try_float(val):
+    contar('celdas_convertidas')
     try:
         if isinstance(val, str): 
              val = val.replace('%', '').replace(',', '.').strip()
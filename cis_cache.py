@@ -0,0 +1,28 @@
+"""
+Caché en disco de artefactos derivados de los Excel del CIS (índices, huellas...).
+
+Cada artefacto se guarda por libro en data/cache/<tipo>/ junto con la firma del
+Excel (mtime + tamaño): si el libro cambia, el artefacto se regenera.
+"""
+
+import os
+
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "cache")
+
+
+def firma_archivo(path: str) -> tuple:
+    """(mtime_ns, tamaño) del archivo; cambia con cualquier re-descarga o edición."""
+    st = os.stat(path)
+    return (st.st_mtime_ns, st.st_size)
+
+
+def ruta_artefacto(tipo: str, path: str, extension: str) -> str:
+    """Ruta del artefacto `tipo` para el libro `path` (crea la carpeta si no existe)."""
+    carpeta = os.path.join(CACHE_DIR, tipo)
+    os.makedirs(carpeta, exist_ok=True)
+    return os.path.join(carpeta, os.path.basename(path) + extension)
+
+
+def es_libro_valido(path: str) -> bool:
+    """Excluye los ficheros de bloqueo de Excel (~$...) que aparecen con el libro abierto."""
+    return not os.path.basename(path).startswith('~$')
@@ -0,0 +1,320 @@
+"""
+Catálogo de estudios de data/cis_studies con manifiesto de metadatos persistente.
+
+Un escaneo registra por estudio (id del CIS) sus variantes de archivo, la clase
+detectada, comunidad, hoja de RV, fechas de campo, N, el PDF de estimación y el
+hash del contenido, y lo guarda en data/cache/catalogo.json. La actualización es
+incremental: solo se abre un libro nuevo o cuyo contenido cambió (se mira la firma
+mtime + tamaño y, si difiere, el hash); el resto sale del manifiesto.
+
+Listar y resolver estudios (cis_data_manager, streamlit_app, web_app) lee solo el
+último manifiesto publicado y hace stat de la carpeta: los libros nuevos o cambiados
+aparecen como pendientes y se actualizan en un hilo en segundo plano, que publica el
+manifiesto nuevo al terminar. Ninguna petición abre un libro ni espera a un escaneo.
+
+Uso:
+    python cis_catalogo.py                  # actualizar y mostrar el catálogo
+    python cis_catalogo.py --reconstruir    # ignorar el manifiesto guardado
+"""
+
+import argparse
+import contextlib
+import hashlib
+import io
+import json
+import os
+import re
+import threading
+
+from cis_cache import CACHE_DIR, firma_archivo, es_libro_valido
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "cis_studies")
+RUTA_MANIFIESTO = os.path.join(CACHE_DIR, "catalogo.json")
+
+# Versión del formato del manifiesto (cambiarla fuerza un escaneo completo)
+VERSION_CATALOGO = 1
+
+# Variantes de libro por prioridad (la primera presente es la principal del estudio)
+VARIANTES = [
+    ('-multi_A.xlsx', 'AVANCE'), ('_multi_A.xlsx', 'AVANCE'),
+    ('-multi.xlsx', 'BAROMETRO'), ('_multi.xlsx', 'BAROMETRO'),
+]
+SUFIJOS_PDF = ['_Estimacion.pdf', '-Estimacion.pdf']
+
+_lock = threading.Lock()        # solo para leer o publicar _memo/_vistas/_en_curso
+_escaneo = threading.Lock()     # serializa los escaneos (abren libros) sin bloquear las lecturas
+_memo = {}      # directorio -> (estado de la carpeta, manifiesto publicado)
+_vistas = {}    # directorio -> (estado, manifiesto, vista con pendientes) de la última lectura
+_en_curso = set()               # directorios con una actualización en segundo plano
+
+
+def id_estudio(nombre: str) -> str:
+    """Id del CIS al inicio del nombre de archivo ('3543-multi_A.xlsx' -> '3543')."""
+    return re.split(r'[_-]', os.path.splitext(nombre)[0])[0]
+
+
+def variante(nombre: str) -> str:
+    """'AVANCE', 'BAROMETRO' o None si el nombre no sigue la convención del CIS (subidas a mano)."""
+    for sufijo, tipo in VARIANTES:
+        if nombre.endswith(sufijo):
+            return tipo
+    return None
+
+
+def hash_contenido(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for bloque in iter(lambda: f.read(1 << 20), b''):
+            h.update(bloque)
+    return h.hexdigest()
+
+
+def _n_entrevistas(texto) -> int:
+    match = re.search(r'\d+', str(texto))
+    return int(match.group()) if match else None
+
+
+def describir_libro(path: str) -> dict:
+    """Metadatos de un libro (abre el Excel: solo se llama para libros nuevos o cambiados)."""
+    from cis_estudios import clasificar, crear_estudio
+    entrada = {'firma': list(firma_archivo(path)), 'sha256': hash_contenido(path)}
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            entrada.update(clasificar(path))
+            estudio = crear_estudio(path, clasificacion=entrada)
+            ficha = estudio.extraer_ficha_tecnica()
+        entrada.update({
+            'hoja_rv': estudio.get_hoja_rv(),
+            'referencia': ficha.get('referencia'),
+            'campo': ficha.get('campo'),
+            'n': _n_entrevistas(ficha.get('n')),
+            'ambito': ficha.get('ambito'),
+            'hojas': len(estudio.sheet_names),
+        })
+    except Exception as e:
+        entrada['error'] = str(e)
+    return entrada
+
+
+def estado_carpeta(data_dir: str) -> dict:
+    """{nombre: firma} de los libros y PDFs de la carpeta (solo stat, sin abrir nada)."""
+    estado = {}
+    if not os.path.isdir(data_dir):
+        return estado
+    for nombre in os.listdir(data_dir):
+        path = os.path.join(data_dir, nombre)
+        if not es_libro_valido(path) or not (nombre.endswith('.xlsx') or nombre.endswith('.pdf')):
+            continue
+        try:
+            estado[nombre] = list(firma_archivo(path))
+        except OSError:
+            pass
+    return estado
+
+
+def _cargar_manifiesto(data_dir: str) -> dict:
+    try:
+        with open(RUTA_MANIFIESTO, encoding='utf-8') as f:
+            manifiesto = json.load(f)
+        if manifiesto.get('version') == VERSION_CATALOGO and manifiesto.get('directorio') == data_dir:
+            return manifiesto
+    except Exception:
+        pass
+    return {'version': VERSION_CATALOGO, 'directorio': data_dir, 'libros': {}, 'estudios': {}}
+
+
+def _guardar_manifiesto(manifiesto: dict):
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    temporal = RUTA_MANIFIESTO + '.tmp'
+    with open(temporal, 'w', encoding='utf-8') as f:
+        json.dump(manifiesto, f, ensure_ascii=False, indent=1, sort_keys=True)
+    os.replace(temporal, RUTA_MANIFIESTO)
+
+
+def _agrupar(libros: dict, pdfs: list) -> dict:
+    """Vista por estudio: variantes, libro principal (por prioridad) y sus metadatos."""
+    prioridad = {sufijo: i for i, (sufijo, _) in enumerate(VARIANTES)}
+    estudios = {}
+    for nombre in libros:
+        estudios.setdefault(id_estudio(nombre), []).append(nombre)
+    resultado = {}
+    for sid, nombres in estudios.items():
+        nombres.sort(key=lambda n: next((p for s, p in prioridad.items() if n.endswith(s)), len(VARIANTES)))
+        principal = libros[nombres[0]]
+        pdf = next((f"{sid}{suf}" for suf in SUFIJOS_PDF if f"{sid}{suf}" in pdfs), None)
+        resultado[sid] = {
+            'id': sid,
+            'archivo': nombres[0],
+            'variante': variante(nombres[0]),
+            'variantes': nombres,
+            'pdf': pdf,
+            **{k: v for k, v in principal.items() if k != 'firma'},
+        }
+    return resultado
+
+
+def actualizar(data_dir: str = DATA_DIR, reconstruir: bool = False) -> dict:
+    """
+    Sincroniza el manifiesto con la carpeta, lo publica y lo devuelve. Solo abre los libros
+    nuevos o cuyo contenido (hash) cambió; los borrados salen del catálogo. El escaneo se
+    hace fuera de _lock (las lecturas siguen viendo el manifiesto anterior) y el candado
+    solo se toma para publicar el nuevo.
+    """
+    data_dir = os.path.abspath(data_dir)
+    with _escaneo:
+        estado = estado_carpeta(data_dir)
+        with _lock:
+            memo = _memo.get(data_dir)
+        if memo and memo[0] == estado and not reconstruir:
+            return memo[1]
+
+        manifiesto = _cargar_manifiesto(data_dir)
+        anteriores = {} if reconstruir else manifiesto['libros']
+        libros = {}
+        cambios = reconstruir
+        for nombre, firma in sorted(estado.items()):
+            if not nombre.endswith('.xlsx'):
+                continue
+            previo = anteriores.get(nombre)
+            path = os.path.join(data_dir, nombre)
+            if previo and previo.get('firma') == firma:
+                libros[nombre] = previo
+            elif previo and previo.get('sha256') == hash_contenido(path):
+                # Misma copia con otra fecha (re-descarga, touch): no se reabre
+                libros[nombre] = {**previo, 'firma': firma}
+                cambios = True
+            else:
+                libros[nombre] = describir_libro(path)
+                cambios = True
+        cambios = cambios or set(libros) != set(anteriores)
+
+        pdfs = [n for n in estado if n.endswith('.pdf')]
+        estudios = _agrupar(libros, pdfs)
+        if cambios or estudios != manifiesto.get('estudios'):
+            manifiesto.update({'libros': libros, 'estudios': estudios})
+            try:
+                _guardar_manifiesto(manifiesto)
+            except OSError as e:
+                print(f"Aviso: no se pudo guardar el catálogo ({e})")
+        with _lock:
+            _memo[data_dir] = (estado, manifiesto)
+        return manifiesto
+
+
+def _actualizar_en_segundo_plano(data_dir: str):
+    try:
+        actualizar(data_dir)
+    except Exception as e:
+        print(f"Aviso: no se pudo actualizar el catálogo ({e})")
+    finally:
+        with _lock:
+            _en_curso.discard(data_dir)
+
+
+def refrescar(data_dir: str = DATA_DIR) -> bool:
+    """Lanza la actualización del catálogo en un hilo (una a la vez por carpeta). True si la lanzó."""
+    data_dir = os.path.abspath(data_dir)
+    with _lock:
+        if data_dir in _en_curso:
+            return False
+        _en_curso.add(data_dir)
+    threading.Thread(target=_actualizar_en_segundo_plano, args=(data_dir,),
+                     name='cis-catalogo', daemon=True).start()
+    return True
+
+
+def _con_pendientes(manifiesto: dict, estado: dict) -> dict:
+    """El manifiesto sobre el estado actual de la carpeta: los libros nuevos o cambiados
+    se marcan 'pendiente' (con los metadatos de su versión anterior, si la hay)."""
+    anteriores = manifiesto['libros']
+    libros = {}
+    for nombre, firma in sorted(estado.items()):
+        if not nombre.endswith('.xlsx'):
+            continue
+        previo = anteriores.get(nombre)
+        if previo and previo.get('firma') == firma:
+            libros[nombre] = previo
+        else:
+            libros[nombre] = {**(previo or {'firma': firma}), 'pendiente': True}
+    pdfs = [n for n in estado if n.endswith('.pdf')]
+    return {**manifiesto, 'libros': libros, 'estudios': _agrupar(libros, pdfs)}
+
+
+def publicado(data_dir: str = DATA_DIR) -> dict:
+    """
+    Último manifiesto publicado, visto sobre la carpeta actual (solo stat, no abre libros
+    ni espera a un escaneo). Si la carpeta cambió desde la última actualización, los libros
+    nuevos o cambiados salen como pendientes y se lanza la actualización en segundo plano.
+    """
+    data_dir = os.path.abspath(data_dir)
+    estado = estado_carpeta(data_dir)
+    with _lock:
+        memo = _memo.get(data_dir)
+        vista = _vistas.get(data_dir)
+    if memo is None:
+        # Primer acceso del proceso: el manifiesto guardado, aún sin contrastar con la carpeta
+        cargado = ({}, _cargar_manifiesto(data_dir))
+        with _lock:
+            memo = _memo.setdefault(data_dir, cargado)
+    estado_publicado, manifiesto = memo
+    if estado_publicado == estado:
+        return manifiesto
+
+    refrescar(data_dir)
+    if vista and vista[0] == estado and vista[1] is manifiesto:
+        return vista[2]
+    resultado = _con_pendientes(manifiesto, estado)
+    with _lock:
+        _vistas[data_dir] = (estado, manifiesto, resultado)
+    return resultado
+
+
+def estudios(data_dir: str = DATA_DIR) -> list:
+    """Entradas del catálogo publicado, del estudio más reciente (id mayor) al más antiguo."""
+    return sorted(publicado(data_dir)['estudios'].values(), key=lambda e: e['id'], reverse=True)
+
+
+def buscar(study_id: str, data_dir: str = DATA_DIR) -> dict:
+    """Entrada del catálogo publicado para un id del CIS, o None."""
+    return publicado(data_dir)['estudios'].get(str(study_id))
+
+
+def ruta(entrada: dict, data_dir: str = DATA_DIR) -> str:
+    return os.path.join(os.path.abspath(data_dir), entrada['archivo'])
+
+
+def clasificacion(path: str) -> dict:
+    """
+    {'clase', 'comunidad'} de un libro: la del manifiesto publicado si el libro está en
+    data/cis_studies y no ha cambiado; si no (o está pendiente), cis_estudios.clasificar
+    (milisegundos, sin pandas).
+    """
+    path = os.path.abspath(path)
+    entrada = None
+    if os.path.dirname(path) == os.path.abspath(DATA_DIR):
+        entrada = publicado()['libros'].get(os.path.basename(path))
+    try:
+        if entrada and entrada.get('clase') and entrada['firma'] == list(firma_archivo(path)):
+            return {'clase': entrada['clase'], 'comunidad': entrada.get('comunidad')}
+    except OSError:
+        pass
+    from cis_estudios import clasificar
+    return clasificar(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Catálogo de estudios del CIS")
+    parser.add_argument('--reconstruir', action='store_true', help="Reabrir todos los libros")
+    args = parser.parse_args()
+
+    actualizar(reconstruir=args.reconstruir)
+    print(f"{'Id':<6} {'Archivo':<20} {'Clase':<18} {'Comunidad':<16} {'Hoja RV':<8} {'N':>6} {'PDF':<4} Campo")
+    for e in estudios():
+        print(f"{e['id']:<6} {e['archivo']:<20} {str(e.get('clase')):<18} {str(e.get('comunidad') or '-'):<16} "
+              f"{str(e.get('hoja_rv')):<8} {str(e.get('n') or '-'):>6} {'sí' if e['pdf'] else 'no':<4} "
+              f"{e.get('campo') or e.get('error', '')}")
+    print(f"Manifiesto: {RUTA_MANIFIESTO}")
+
+
+if __name__ == "__main__":
+    main()
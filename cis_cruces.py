@@ -0,0 +1,310 @@
+"""
+Cubo de cruces de un libro del CIS en formato largo (pregunta, categoría, segmento, valor, N).
+
+Las hojas de cruces ("Tamaño de municipio", "Escala de ideología", "RV EG23"...) y
+las de marginales ("Resultados", "Marginales") repiten el mismo patrón por pregunta:
+fila "Pregunta X", enunciado, cabecera de segmentos (TOTAL + categorías de la
+variable de cruce; en marginales no hay cabecera y el único segmento es TOTAL),
+filas de categorías y la fila (N). El cubo convierte cada bloque a filas largas
+sin índices de columna fijos (las columnas con N = 0 desaparecen de algunas
+cabeceras, así que las posiciones cambian de un bloque a otro).
+
+La conversión es por bloques: el índice de preguntas de una hoja sale solo de la
+columna 0 y los valores de un bloque se convierten la primera vez que se consulta.
+El cubo (índice y bloques ya convertidos) se guarda por libro en data/cache/cruces/
+junto a la firma del Excel; cis_ingesta lo completa al llegar un libro nuevo, así
+que las consultas (CuboCruces.crosstab, CuboCruces.n) son filtros sobre columnas.
+
+Uso:
+    python cis_cruces.py data/cis_studies/3543-multi_A.xlsx                      # preguntas por hoja
+    python cis_cruces.py data/cis_studies/3543-multi_A.xlsx 11R --cruce "Tamaño de municipio"
+"""
+
+import argparse
+import re
+
+import numpy as np
+import pandas as pd
+
+from cis_cache import firma_archivo, ruta_artefacto
+from cis_instrumentacion import contar
+
+# Versión del formato del cubo (cambiarla fuerza reconvertir todas las hojas)
+VERSION_CRUCES = 1
+
+COLUMNAS = ['hoja', 'pregunta', 'categoria', 'segmento', 'valor', 'n']
+COLUMNAS_INDICE = ['hoja', 'pregunta', 'enunciado', 'inicio', 'fin', 'convertida']
+
+# Filas de pie de bloque con la N de cada segmento
+ETIQUETAS_N = ('(N)', 'N')
+
+
+def _numero(valor) -> float:
+    """float de una celda (número o texto con coma decimal); NaN si no es numérica."""
+    if isinstance(valor, bool) or valor is None:
+        return np.nan
+    if isinstance(valor, (int, float)):
+        return float(valor)
+    try:
+        return float(str(valor).strip().replace(',', '.'))
+    except ValueError:
+        return np.nan
+
+
+def _etiqueta(valor) -> str:
+    """Texto de una cabecera o categoría (5.0 -> '5'); None si la celda está vacía."""
+    if valor is None or (isinstance(valor, float) and np.isnan(valor)):
+        return None
+    if isinstance(valor, float) and valor.is_integer():
+        return str(int(valor))
+    texto = str(valor).strip()
+    return texto if texto and texto != 'nan' else None
+
+
+def indexar_hoja(df: pd.DataFrame, hoja: str) -> pd.DataFrame:
+    """Bloques "Pregunta X" de una hoja (solo lee la columna 0): pregunta, enunciado y filas."""
+    bloques = []
+    if df.shape[1] >= 2:
+        primera = [_etiqueta(v) for v in df.iloc[:, 0].tolist()]
+        inicios = [i for i, v in enumerate(primera) if v and v.startswith('Pregunta')]
+        for inicio, fin in zip(inicios, inicios[1:] + [len(primera)]):
+            enunciado = primera[inicio + 1] if inicio + 1 < fin and primera[inicio + 1] else ''
+            bloques.append([hoja, primera[inicio], enunciado, inicio, fin, False])
+    return pd.DataFrame(bloques, columns=COLUMNAS_INDICE)
+
+
+def parsear_bloque(df: pd.DataFrame, hoja: str, pregunta: str, inicio: int, fin: int) -> list:
+    """
+    Filas largas [hoja, pregunta, categoria, segmento, valor, n] de un bloque. La N de
+    cada fila es la de su segmento (fila (N) del bloque) o la de la columna (N) de las
+    tablas de ítems de los marginales.
+    """
+    filas = []
+    segmentos = {1: 'TOTAL'}    # columna -> segmento (marginales: solo TOTAL)
+    col_n = None                # columna (N) de las tablas de ítems
+    tramo = []                  # filas a la espera de su fila (N): [..., columna, n]
+    celdas = 0
+    primera_fila = inicio + 1
+    if primera_fila < fin and _etiqueta(df.iat[primera_fila, 0]):
+        primera_fila += 1       # enunciado
+    for k in range(primera_fila, fin):
+        etiqueta = _etiqueta(df.iat[k, 0])
+        if etiqueta is None:
+            cabecera = {j: _etiqueta(df.iat[k, j]) for j in range(1, df.shape[1])}
+            cabecera = {j: v for j, v in cabecera.items() if v is not None}
+            if len(cabecera) >= 2:
+                col_n = next((j for j, v in cabecera.items() if v == '(N)'), None)
+                segmentos = {j: v for j, v in cabecera.items() if j != col_n}
+            continue
+        if etiqueta in ETIQUETAS_N:
+            n_segmento = {j: _numero(df.iat[k, j]) for j in segmentos}
+            for f in tramo:
+                if np.isnan(f[-1]):
+                    f[-1] = n_segmento[f[-2]]
+            filas.extend(tramo)
+            tramo = []
+            continue
+        n_fila = _numero(df.iat[k, col_n]) if col_n is not None else np.nan
+        for j, segmento in segmentos.items():
+            valor = _numero(df.iat[k, j])
+            celdas += 1
+            if not np.isnan(valor):
+                tramo.append([hoja, pregunta, etiqueta, segmento, valor, j, n_fila])
+    filas.extend(tramo)     # tablas sin fila (N): N de su columna (o NaN)
+    contar('celdas_convertidas', celdas)
+    return [f[:5] + f[6:] for f in filas]
+
+
+class CuboCruces:
+    """Cruces de un libro en formato largo con columnas categóricas e índice de bloques."""
+
+    def __init__(self, datos: pd.DataFrame = None, indice: pd.DataFrame = None):
+        self.datos = datos if datos is not None else pd.DataFrame(columns=COLUMNAS)
+        self.indice = indice if indice is not None else pd.DataFrame(columns=COLUMNAS_INDICE)
+        self._categorizar()
+
+    def _categorizar(self):
+        self.datos = self.datos.astype({'valor': float, 'n': float})
+        for c in COLUMNAS[:4]:
+            self.datos[c] = self.datos[c].astype('category')
+        self.indice = self.indice.astype({'inicio': int, 'fin': int, 'convertida': bool})
+
+    def __len__(self):
+        return len(self.datos)
+
+    @property
+    def hojas(self) -> list:
+        """Hojas indexadas, en orden de conversión."""
+        return list(dict.fromkeys(self.indice['hoja'].astype(str)))
+
+    def pendiente(self, hoja: str, preguntas: list = None) -> bool:
+        """La hoja falta en el índice o alguno de los bloques pedidos (todos si None) no está convertido."""
+        if hoja not in self.hojas:
+            return True
+        bloques = self.indice[self.indice['hoja'] == hoja]
+        if preguntas is not None:
+            bloques = bloques[bloques['pregunta'].isin(preguntas)]
+        return not bloques['convertida'].all()
+
+    def anadir(self, hoja: str, df: pd.DataFrame, preguntas: list = None) -> bool:
+        """
+        Indexa la hoja (si hace falta) y convierte sus bloques pendientes: los de
+        `preguntas` o todos si es None ([] solo indexa). Devuelve si el cubo cambió.
+        """
+        cambios = False
+        if hoja not in self.hojas:
+            nuevos = indexar_hoja(df, hoja)
+            self.indice = pd.concat([self.indice, nuevos], ignore_index=True) if len(self.indice) else nuevos
+            cambios = True
+        pendientes = self.indice[(self.indice['hoja'] == hoja) & ~self.indice['convertida'].astype(bool)]
+        if preguntas is not None:
+            pendientes = pendientes[pendientes['pregunta'].isin(preguntas)]
+        filas = []
+        for pos, bloque in pendientes.iterrows():
+            filas += parsear_bloque(df, hoja, bloque['pregunta'], int(bloque['inicio']), int(bloque['fin']))
+            self.indice.at[pos, 'convertida'] = True
+            cambios = True
+        if filas:
+            nuevas = pd.DataFrame(filas, columns=COLUMNAS)
+            actuales = self.datos.astype({c: object for c in COLUMNAS[:4]})
+            self.datos = pd.concat([actuales, nuevas], ignore_index=True) if len(actuales) else nuevas
+        if cambios:
+            self._categorizar()
+        return cambios
+
+    def enunciados(self, hoja: str = None) -> dict:
+        """{pregunta: enunciado} en orden de aparición (de una hoja o de todo el libro)."""
+        bloques = self.indice if hoja is None else self.indice[self.indice['hoja'] == hoja]
+        bloques = bloques.drop_duplicates('pregunta')
+        return dict(zip(bloques['pregunta'].astype(str), bloques['enunciado'].astype(str)))
+
+    def preguntas(self, hoja: str = None) -> list:
+        return list(self.enunciados(hoja))
+
+    def buscar(self, referencia: str, hoja: str = None) -> str:
+        """
+        Pregunta a partir de una referencia: 'Pregunta 11R', '11R', 'P11R' o un fragmento
+        del enunciado (sin distinguir mayúsculas). None si no hay ninguna.
+        """
+        enunciados = self.enunciados(hoja)
+        ref = str(referencia).strip().upper()
+        codigo = re.sub(r'^(PREGUNTA\s*|P)', '', ref)
+        for p in enunciados:
+            if p.upper() == ref or p.upper().replace('PREGUNTA ', '') == codigo:
+                return p
+        for p, texto in enunciados.items():
+            if ref in texto.upper():
+                return p
+        return None
+
+    def consultar(self, pregunta: str = None, hoja: str = None, categoria: str = None,
+                  segmento: str = None) -> pd.DataFrame:
+        """Filas largas que cumplen todos los filtros indicados."""
+        mascara = np.ones(len(self.datos), dtype=bool)
+        for columna, valor in (('pregunta', pregunta), ('hoja', hoja), ('categoria', categoria), ('segmento', segmento)):
+            if valor is not None:
+                mascara &= (self.datos[columna] == valor).to_numpy()
+        return self.datos[mascara]
+
+    def crosstab(self, pregunta: str, hoja: str) -> pd.DataFrame:
+        """Tabla categorías × segmentos (porcentajes) de una pregunta en una hoja, en el orden del libro."""
+        filas = self.consultar(pregunta=pregunta, hoja=hoja).astype({'categoria': str, 'segmento': str})
+        if filas.empty:
+            return pd.DataFrame()
+        categorias = list(dict.fromkeys(filas['categoria']))
+        segmentos = list(dict.fromkeys(filas['segmento']))
+        tabla = filas.pivot_table(index='categoria', columns='segmento', values='valor', aggfunc='first')
+        return tabla.reindex(index=categorias, columns=segmentos)
+
+    def n(self, pregunta: str, hoja: str) -> pd.Series:
+        """N (entrevistas ponderadas) de cada segmento de una pregunta."""
+        filas = self.consultar(pregunta=pregunta, hoja=hoja).astype({'segmento': str})
+        return filas.groupby('segmento', sort=False)['n'].first()
+
+
+def _firma_real(path: str, firma) -> bool:
+    """La firma es la del libro en disco (los lectores de cis_fixtures usan firmas propias)."""
+    try:
+        return tuple(firma) == firma_archivo(path)
+    except (OSError, TypeError):
+        return False
+
+
+def cargar(path: str, firma) -> CuboCruces:
+    """Cubo guardado del libro si corresponde a `firma`; si no, uno vacío."""
+    if _firma_real(path, firma):
+        try:
+            with np.load(ruta_artefacto('cruces', path, '.npz')) as npz:
+                if np.array_equal(npz['firma'], np.array(firma, dtype=np.int64)) \
+                        and int(npz['version']) == VERSION_CRUCES:
+                    datos = pd.DataFrame({c: pd.Categorical.from_codes(npz[c], npz[c + '_etiquetas'])
+                                          for c in COLUMNAS[:4]})
+                    datos['valor'], datos['n'] = npz['valor'], npz['n']
+                    indice = pd.DataFrame({c: npz['indice_' + c] for c in COLUMNAS_INDICE})
+                    return CuboCruces(datos, indice.astype({c: str for c in COLUMNAS_INDICE[:3]}))
+        except Exception:
+            pass  # sin caché, corrupta o de otra versión
+    return CuboCruces()
+
+
+def guardar(path: str, firma, cubo: CuboCruces):
+    """Persiste el cubo (solo para el libro real: las fixtures no escriben en data/cache)."""
+    if not _firma_real(path, firma):
+        return
+    arrays = {'firma': np.array(firma, dtype=np.int64), 'version': np.array(VERSION_CRUCES),
+              'valor': cubo.datos['valor'].to_numpy(dtype=float), 'n': cubo.datos['n'].to_numpy(dtype=float)}
+    for c in COLUMNAS[:4]:
+        arrays[c] = cubo.datos[c].cat.codes.to_numpy(dtype=np.int32)
+        arrays[c + '_etiquetas'] = np.array(cubo.datos[c].cat.categories.astype(str), dtype=str)
+    for c in COLUMNAS_INDICE:
+        arrays['indice_' + c] = np.array(cubo.indice[c].tolist(), dtype=str if c in COLUMNAS_INDICE[:3] else None)
+    try:
+        np.savez(ruta_artefacto('cruces', path, '.npz'), **arrays)
+    except OSError as e:
+        print(f"Aviso: no se pudo guardar el cubo de cruces ({e})")
+
+
+def cargar_libro(path: str, reconstruir: bool = False) -> CuboCruces:
+    """Cubo completo de un libro (todas sus hojas), desde la caché si el Excel no cambió."""
+    firma = firma_archivo(path)
+    cubo = CuboCruces() if reconstruir else cargar(path, firma)
+    excel = pd.ExcelFile(path)
+    cambios = False
+    for hoja in excel.sheet_names:
+        if cubo.pendiente(hoja):
+            cambios |= cubo.anadir(hoja, pd.read_excel(excel, sheet_name=hoja, header=None))
+    if cambios:
+        guardar(path, firma, cubo)
+    return cubo
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cubo de cruces de un libro del CIS")
+    parser.add_argument('libro', help="Excel del CIS")
+    parser.add_argument('pregunta', nargs='?', help="Pregunta ('11R') o fragmento del enunciado")
+    parser.add_argument('--cruce', help="Hoja de cruce (por defecto, la primera que tenga la pregunta)")
+    parser.add_argument('--reconstruir', action='store_true', help="Ignorar la caché en disco")
+    args = parser.parse_args()
+
+    cubo = cargar_libro(args.libro, args.reconstruir)
+    if not args.pregunta:
+        for hoja in cubo.hojas:
+            preguntas = cubo.preguntas(hoja)
+            if preguntas:
+                print(f"{hoja:<28} {len(preguntas):>4} preguntas")
+        print(f"{len(cubo)} filas en el cubo")
+        return
+
+    pregunta = cubo.buscar(args.pregunta, args.cruce)
+    if pregunta is None:
+        print(f"Sin pregunta para '{args.pregunta}'")
+        return
+    hoja = args.cruce or str(cubo.consultar(pregunta=pregunta)['hoja'].iloc[0])
+    print(f"{pregunta} x {hoja}")
+    with pd.option_context('display.width', 200, 'display.max_columns', 30, 'display.max_rows', 100):
+        print(cubo.crosstab(pregunta, hoja).round(1))
+        print(cubo.n(pregunta, hoja).round(0).to_frame('(N)').T)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,8 @@
 import os
 import pandas as pd
 
+import cis_catalogo
+
 # Mapping of Month-Year to Study ID (Approximate/Known)
 # Mapping of Month-Year to Study ID (Approximate/Known)
 # Source: CIS Barometer Search (2024-2025)
@@ -16,48 +18,50 @@ STUDY_MAP = {
     "Septiembre 2025": "3524"
 }
 
-# Carpeta de datos
-DATA_DIR = "data/cis_studies"
+# Carpeta de datos (absoluta: web_app se ejecuta desde su propio directorio)
+DATA_DIR = cis_catalogo.DATA_DIR
 
 def get_study_file(study_name):
     """
     Returns (path_to_excel, status_or_type).
     Status types: 'AVANCE', 'BAROMETRO', or error message.
     """
-    study_id = STUDY_MAP.get(study_name)
+    study_id = STUDY_MAP.get(study_name) or dict(list_study_ids()).get(study_name)
     if not study_id:
         return None, "Estudio no identificado."
-    
-    # Priority 1: Avance (Self-contained) -> XXXX-multi_A.xlsx
-    avance_name = f"{study_id}-multi_A.xlsx"
-    
-    # Priority 2: Barometro (Needs PDF usually) -> XXXX-multi.xlsx or XXXX_multi.xlsx
-    baro_names = [f"{study_id}-multi.xlsx", f"{study_id}_multi.xlsx"]
+    return get_study_file_by_id(study_id)
 
+def get_study_file_by_id(study_id):
+    """Same as get_study_file but keyed by CIS study id (e.g. '3543'). Reads the catalogue manifest, no workbook I/O."""
     if not os.path.exists(DATA_DIR):
         try:
             os.makedirs(DATA_DIR)
         except Exception:
             pass # Ignorar si no hay permisos (normal en Cloud si el dir ya debería estar en Git)
-        
-    # Check Avance
-    path = os.path.join(DATA_DIR, avance_name)
-    if os.path.exists(path):
-        return os.path.abspath(path), "AVANCE"
-    if os.path.exists(avance_name): # Root fallback
-        return os.path.abspath(avance_name), "AVANCE"
-
-    # Check Barometro
-    for b_name in baro_names:
-        path = os.path.join(DATA_DIR, b_name)
-        if os.path.exists(path):
-             return os.path.abspath(path), "BAROMETRO"
-        if os.path.exists(b_name): # Root fallback
-             return os.path.abspath(b_name), "BAROMETRO"
+
+    # Prioridad: Avance (XXXX-multi_A.xlsx) sobre Barómetro (XXXX-multi.xlsx), ver cis_catalogo.VARIANTES
+    entrada = cis_catalogo.buscar(study_id, DATA_DIR)
+    if entrada and entrada['variante']:
+        return cis_catalogo.ruta(entrada, DATA_DIR), entrada['variante']
 
     # If not found
-    cis_url = f"https://www.cis.es/cis/opencms/ES/11_barometros/estudio.html?id={study_id}"
     return None, f"Archivos no encontrados para estudio {study_id}. Se requiere '{study_id}-multi_A.xlsx' (Avance) o '{study_id}-multi.xlsx' (Barómetro)."
 
+def study_name(study_id, entrada=None):
+    """Display name: STUDY_MAP label, or one built from the catalogue for studies added later."""
+    for name, sid in STUDY_MAP.items():
+        if sid == str(study_id):
+            return name
+    entrada = entrada or cis_catalogo.buscar(study_id, DATA_DIR)
+    campo = entrada.get('campo') if entrada else None
+    return f"Estudio {study_id} ({campo})" if campo and campo != 'N/A' else f"Estudio {study_id}"
+
 def list_available_studies():
-    return list(STUDY_MAP.keys())
+    return [name for name, _ in list_study_ids()]
+
+def list_study_ids():
+    """Returns [(study_name, study_id)]: STUDY_MAP order, then catalogued studies not in it (newest first)."""
+    conocidos = set(STUDY_MAP.values())
+    nuevos = [(study_name(e['id'], e), e['id']) for e in cis_catalogo.estudios(DATA_DIR)
+              if e['id'] not in conocidos and e['variante']]
+    return list(STUDY_MAP.items()) + nuevos
@@ -0,0 +1,533 @@
+"""
+Descarga concurrente y reanudable de estudios del CIS (Excel de resultados y PDF de estimación).
+
+Para cada id se prueban las variantes de nombre del catálogo (XXXX-multi_A.xlsx,
+XXXX_multi.xlsx... y XXXX_Estimacion.pdf) bajo una URL base. Las descargas comparten
+un cliente HTTP con conexiones keep-alive reutilizadas por host (http.client) y van en
+paralelo en un pool de hilos. Cada archivo:
+  - se escribe en <archivo>.part y, si se corta, la siguiente pasada lo reanuda con
+    Range/If-Range en vez de empezar de cero;
+  - se pide condicionado (If-None-Match / If-Modified-Since) si ya se descargó: un 304
+    no transfiere nada;
+  - se verifica (Content-Length, cabecera Digest sha-256 si el servidor la manda, hash
+    esperado opcional y que sea un zip/PDF válido) antes de moverlo a su sitio;
+  - queda registrado en data/cache/descargas.json (ETag, Last-Modified, sha256).
+Los archivos terminados aparecen de forma atómica en la carpeta de estudios, donde los
+recoge cis_ingesta (o se ingieren en el acto con --ingerir).
+
+Incluye un servidor HTTP local que sirve una carpeta de archivos (por defecto
+data/cis_studies) con ETag, Last-Modified, Range y Digest, para probar sin red.
+
+Uso:
+    python cis_descargas.py 3545 3547 --url-base https://.../     # descargar e ingerir después
+    python cis_descargas.py 3547 --ingerir
+    python cis_descargas.py servir --puerto 8765                   # servidor local de pruebas
+    python cis_descargas.py comprobar                              # autocomprobación sin red
+"""
+
+import argparse
+import base64
+import email.utils
+import hashlib
+import http.client
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urljoin, urlsplit
+
+import cis_catalogo
+from cis_cache import CACHE_DIR, es_libro_valido
+
+RUTA_REGISTRO = os.path.join(CACHE_DIR, "descargas.json")
+
+# URL base de los archivos de estudios (configurable: el CIS cambia a menudo la estructura de su web)
+URL_BASE = os.environ.get('CIS_DESCARGAS_URL', 'https://www.cis.es/documents/d/cis/')
+
+# Descargas simultáneas, conexiones libres por host, segundos de espera y reintentos por archivo
+CONCURRENCIA = 4
+CONEXIONES_POR_HOST = 4
+TIMEOUT = 30
+REINTENTOS = 3
+
+TROZO = 1 << 16
+MAX_REDIRECCIONES = 5
+
+
+class ErrorDescarga(Exception):
+    """Archivo descargado que no supera la verificación (se descarta, no se reanuda)."""
+
+
+class ClienteHTTP:
+    """Conexiones http.client keep-alive reutilizadas por (esquema, host); seguro entre hilos."""
+
+    def __init__(self, por_host: int = CONEXIONES_POR_HOST, timeout: float = TIMEOUT):
+        self.por_host = por_host
+        self.timeout = timeout
+        self._libres = {}
+        self._lock = threading.Lock()
+
+    def _nueva(self, esquema: str, host: str):
+        clase = http.client.HTTPSConnection if esquema == 'https' else http.client.HTTPConnection
+        return clase(host, timeout=self.timeout)
+
+    def _conexion(self, esquema: str, host: str):
+        with self._lock:
+            libres = self._libres.get((esquema, host))
+            if libres:
+                return libres.pop()
+        return self._nueva(esquema, host)
+
+    def _devolver(self, esquema: str, host: str, conexion):
+        with self._lock:
+            libres = self._libres.setdefault((esquema, host), [])
+            if len(libres) < self.por_host:
+                libres.append(conexion)
+                return
+        conexion.close()
+
+    @contextmanager
+    def get(self, url: str, cabeceras: dict = None):
+        """Respuesta de un GET (sigue redirecciones). La conexión vuelve al pool si se leyó entera."""
+        for _ in range(MAX_REDIRECCIONES + 1):
+            partes = urlsplit(url)
+            ruta = partes.path + ('?' + partes.query if partes.query else '')
+            conexion = self._conexion(partes.scheme, partes.netloc)
+            try:
+                conexion.request('GET', ruta or '/', headers=cabeceras or {})
+                respuesta = conexion.getresponse()
+            except (http.client.HTTPException, OSError):
+                # Conexión reutilizada que el servidor ya cerró: un intento con una nueva
+                conexion.close()
+                conexion = self._nueva(partes.scheme, partes.netloc)
+                conexion.request('GET', ruta or '/', headers=cabeceras or {})
+                respuesta = conexion.getresponse()
+            if respuesta.status in (301, 302, 303, 307, 308) and respuesta.getheader('Location'):
+                respuesta.read()
+                self._devolver(partes.scheme, partes.netloc, conexion)
+                url = urljoin(url, respuesta.getheader('Location'))
+                continue
+            try:
+                yield respuesta
+            finally:
+                if respuesta.isclosed() and not respuesta.will_close:
+                    self._devolver(partes.scheme, partes.netloc, conexion)
+                else:
+                    conexion.close()
+            return
+        raise ErrorDescarga(f"demasiadas redirecciones: {url}")
+
+    def cerrar(self):
+        with self._lock:
+            for libres in self._libres.values():
+                for conexion in libres:
+                    conexion.close()
+            self._libres.clear()
+
+
+class Registro:
+    """data/cache/descargas.json: validadores y hash de cada URL descargada (guardado atómico)."""
+
+    def __init__(self, ruta: str = RUTA_REGISTRO):
+        self.ruta = ruta
+        self._lock = threading.Lock()
+        try:
+            with open(ruta, encoding='utf-8') as f:
+                self.datos = json.load(f)
+        except Exception:
+            self.datos = {}
+
+    def get(self, url: str) -> dict:
+        with self._lock:
+            return dict(self.datos.get(url, {}))
+
+    def actualizar(self, url: str, **campos):
+        with self._lock:
+            self.datos.setdefault(url, {}).update(campos)
+            os.makedirs(os.path.dirname(self.ruta), exist_ok=True)
+            temporal = self.ruta + '.tmp'
+            with open(temporal, 'w', encoding='utf-8') as f:
+                json.dump(self.datos, f, ensure_ascii=False, indent=1, sort_keys=True)
+            os.replace(temporal, self.ruta)
+
+
+def hash_archivo(path: str):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for bloque in iter(lambda: f.read(1 << 20), b''):
+            h.update(bloque)
+    return h
+
+
+def _digest_sha256(cabecera: str) -> str:
+    """Hex del sha-256 de una cabecera Digest (RFC 3230), o None."""
+    for parte in (cabecera or '').split(','):
+        algoritmo, _, valor = parte.strip().partition('=')
+        if algoritmo.lower() == 'sha-256' and valor:
+            try:
+                return base64.b64decode(valor).hex()
+            except ValueError:
+                return None
+    return None
+
+
+def _validar_formato(path: str, nombre: str):
+    if nombre.endswith('.xlsx') and not zipfile.is_zipfile(path):
+        raise ErrorDescarga("no es un libro xlsx (zip) válido")
+    if nombre.endswith('.pdf'):
+        with open(path, 'rb') as f:
+            if f.read(5) != b'%PDF-':
+                raise ErrorDescarga("no es un PDF válido")
+
+
+def descargar(cliente: ClienteHTTP, url: str, destino: str, registro: Registro, esperado: str = None) -> dict:
+    """
+    Descarga `url` en `destino` (reanudando un .part previo, pidiendo condicionado si ya
+    existe). Devuelve {'url', 'archivo', 'estado', 'bytes', 'sha256', 'reanudado'} con
+    estado 'descargado', 'sin_cambios', 'no_encontrado' o 'error'.
+    """
+    nombre = os.path.basename(destino)
+    parte = destino + '.part'
+    previo = registro.get(url)
+    resultado = {'url': url, 'archivo': nombre, 'estado': 'error', 'bytes': 0, 'reanudado': False}
+
+    cabeceras = {'Accept-Encoding': 'identity'}
+    if os.path.exists(destino) and previo.get('sha256'):
+        if previo.get('etag'):
+            cabeceras['If-None-Match'] = previo['etag']
+        if previo.get('last_modified'):
+            cabeceras['If-Modified-Since'] = previo['last_modified']
+    desde = os.path.getsize(parte) if os.path.exists(parte) else 0
+    validador = previo.get('parcial_etag') or previo.get('parcial_last_modified')
+    if desde and validador:
+        cabeceras['Range'] = f"bytes={desde}-"
+        cabeceras['If-Range'] = validador
+    else:
+        desde = 0
+
+    with cliente.get(url, cabeceras) as respuesta:
+        if respuesta.status == 304:
+            respuesta.read()
+            resultado.update(estado='sin_cambios', sha256=previo['sha256'])
+            return resultado
+        if respuesta.status == 404:
+            respuesta.read()
+            resultado['estado'] = 'no_encontrado'
+            return resultado
+        if respuesta.status == 416:
+            # El .part ya no encaja con el archivo del servidor: empezar de cero
+            respuesta.read()
+            os.remove(parte)
+            registro.actualizar(url, parcial_etag=None, parcial_last_modified=None)
+            return descargar(cliente, url, destino, registro, esperado)
+        if respuesta.status not in (200, 206):
+            respuesta.read()
+            resultado['mensaje'] = f"HTTP {respuesta.status}"
+            return resultado
+
+        etag, modificado = respuesta.getheader('ETag'), respuesta.getheader('Last-Modified')
+        # Validadores del .part para poder reanudar si la conexión se corta
+        registro.actualizar(url, parcial_etag=etag, parcial_last_modified=modificado)
+        h = hashlib.sha256()
+        total = respuesta.getheader('Content-Length')
+        if respuesta.status == 206:
+            inicio = int((respuesta.getheader('Content-Range') or 'bytes 0-').split()[1].split('-')[0])
+            if inicio != desde:
+                raise ErrorDescarga(f"Content-Range inesperado: {respuesta.getheader('Content-Range')}")
+            h = hash_archivo(parte)
+            resultado['reanudado'] = True
+            modo = 'ab'
+        else:
+            desde = 0
+            modo = 'wb'
+        total = int(total) + desde if total is not None else None
+        with open(parte, modo) as f:
+            while True:
+                bloque = respuesta.read(TROZO)
+                if not bloque:
+                    break
+                f.write(bloque)
+                h.update(bloque)
+                resultado['bytes'] += len(bloque)
+        digest = _digest_sha256(respuesta.getheader('Digest'))
+
+    try:
+        tamano = os.path.getsize(parte)
+        if total is not None and tamano < total:
+            raise ConnectionError(f"descarga incompleta ({tamano} de {total} bytes)")
+        sha = h.hexdigest()
+        if total is not None and tamano != total:
+            raise ErrorDescarga(f"tamaño {tamano} distinto de Content-Length {total}")
+        if digest and digest != sha:
+            raise ErrorDescarga("el sha-256 no coincide con la cabecera Digest")
+        if esperado and esperado != sha:
+            raise ErrorDescarga("el sha-256 no coincide con el esperado")
+        _validar_formato(parte, nombre)
+    except ErrorDescarga:
+        os.remove(parte)
+        registro.actualizar(url, parcial_etag=None, parcial_last_modified=None)
+        raise
+    os.replace(parte, destino)
+    registro.actualizar(url, etag=etag, last_modified=modificado, sha256=sha, tamano=tamano,
+                        fecha=time.strftime('%Y-%m-%d %H:%M:%S'), parcial_etag=None, parcial_last_modified=None)
+    resultado.update(estado='descargado', sha256=sha)
+    return resultado
+
+
+def descargar_con_reintentos(cliente, url, destino, registro, esperado=None, reintentos=REINTENTOS) -> dict:
+    """descargar() reintentando cortes de red (cada reintento reanuda el .part)."""
+    for intento in range(reintentos + 1):
+        try:
+            return descargar(cliente, url, destino, registro, esperado)
+        except ErrorDescarga as e:
+            return {'url': url, 'archivo': os.path.basename(destino), 'estado': 'error', 'mensaje': str(e)}
+        except (OSError, http.client.HTTPException) as e:
+            if intento == reintentos:
+                return {'url': url, 'archivo': os.path.basename(destino), 'estado': 'error', 'mensaje': str(e)}
+            time.sleep(min(2 ** intento * 0.5, 5))
+
+
+def nombres_estudio(study_id: str) -> tuple:
+    """([libros por prioridad], [PDFs]) con las variantes de nombre del catálogo."""
+    libros = [f"{study_id}{sufijo}" for sufijo, _ in cis_catalogo.VARIANTES]
+    pdfs = [f"{study_id}{sufijo}" for sufijo in cis_catalogo.SUFIJOS_PDF]
+    return libros, pdfs
+
+
+def descargar_estudio(cliente: ClienteHTTP, study_id: str, destino_dir: str, registro: Registro,
+                      url_base: str = URL_BASE, esperados: dict = None) -> list:
+    """Primer libro disponible del estudio (por prioridad de variante) y su PDF, si lo hay."""
+    esperados = esperados or {}
+    resultados = []
+    libros, pdfs = nombres_estudio(study_id)
+    for grupo in (libros, pdfs):
+        for nombre in grupo:
+            url = urljoin(url_base if url_base.endswith('/') else url_base + '/', nombre)
+            r = descargar_con_reintentos(cliente, url, os.path.join(destino_dir, nombre), registro, esperados.get(nombre))
+            if r['estado'] != 'no_encontrado':
+                resultados.append(r)
+                break
+        else:
+            if grupo is libros:
+                resultados.append({'archivo': f"{study_id}-multi_A.xlsx", 'estado': 'no_encontrado', 'bytes': 0})
+    return resultados
+
+
+def descargar_estudios(ids: list, destino_dir: str = cis_catalogo.DATA_DIR, url_base: str = URL_BASE,
+                       concurrencia: int = CONCURRENCIA, registro: Registro = None, esperados: dict = None) -> list:
+    """Descarga varios estudios en paralelo con un cliente HTTP compartido."""
+    os.makedirs(destino_dir, exist_ok=True)
+    registro = registro or Registro()
+    cliente = ClienteHTTP()
+    try:
+        with ThreadPoolExecutor(max_workers=concurrencia, thread_name_prefix='cis-descarga') as pool:
+            futuros = [pool.submit(descargar_estudio, cliente, str(i), destino_dir, registro, url_base, esperados)
+                       for i in ids]
+            return [r for f in futuros for r in f.result()]
+    finally:
+        cliente.cerrar()
+
+
+def ingerir(destino_dir: str):
+    """Pasa los archivos nuevos por cis_ingesta (una pasada) y espera a que terminen."""
+    from cis_ingesta import Ingesta
+    ingesta = Ingesta(destino_dir, esperar_estable=False)
+    try:
+        ingesta.paso()
+        ingesta.esperar()
+    finally:
+        ingesta.cerrar()
+
+
+# --- Servidor local de pruebas ---
+
+class ManejadorPruebas(BaseHTTPRequestHandler):
+    """GET de los archivos de server.directorio con ETag, Last-Modified, Range, If-Range y Digest."""
+
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, formato, *args):
+        pass
+
+    def _vacio(self, status: int, cabeceras: dict = None):
+        self.send_response(status)
+        for k, v in (cabeceras or {}).items():
+            self.send_header(k, v)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def do_GET(self):
+        servidor = self.server
+        nombre = os.path.basename(urlsplit(self.path).path)
+        path = os.path.join(servidor.directorio, nombre)
+        servidor.peticiones.append((nombre, dict(self.headers)))
+        if not nombre or not os.path.isfile(path):
+            return self._vacio(404)
+
+        datos, etag = servidor.contenido(path)
+        digest = 'sha-256=' + base64.b64encode(hashlib.sha256(datos).digest()).decode()
+        if nombre in servidor.corromper:
+            # Corrupción en tránsito simulada: el Digest sigue siendo el del archivo original
+            datos = datos[:-1] + bytes([datos[-1] ^ 0xFF])
+        modificado = email.utils.formatdate(os.path.getmtime(path), usegmt=True)
+        comunes = {'ETag': etag, 'Last-Modified': modificado, 'Accept-Ranges': 'bytes'}
+        if self.headers.get('If-None-Match') == etag:
+            return self._vacio(304, comunes)
+
+        inicio = 0
+        rango = self.headers.get('Range')
+        if rango and self.headers.get('If-Range') in (None, etag, modificado):
+            inicio = int(rango.split('=')[1].split('-')[0])
+            if inicio >= len(datos):
+                return self._vacio(416, {'Content-Range': f"bytes */{len(datos)}"})
+        cuerpo = datos[inicio:]
+        self.send_response(206 if inicio else 200)
+        for k, v in comunes.items():
+            self.send_header(k, v)
+        self.send_header('Content-Type', 'application/octet-stream')
+        self.send_header('Content-Length', str(len(cuerpo)))
+        self.send_header('Digest', digest)
+        if inicio:
+            self.send_header('Content-Range', f"bytes {inicio}-{len(datos) - 1}/{len(datos)}")
+        self.end_headers()
+
+        corte = servidor.cortes.pop(nombre, None)
+        if corte is not None:
+            # Corte de red simulado: se envía solo una parte y se cierra la conexión
+            self.wfile.write(cuerpo[:corte])
+            self.wfile.flush()
+            self.close_connection = True
+            return
+        self.wfile.write(cuerpo)
+
+
+class ServidorPruebas(ThreadingHTTPServer):
+    """Servidor HTTP local que sustituye al del CIS en pruebas (sin red)."""
+
+    daemon_threads = True
+
+    def __init__(self, directorio: str = cis_catalogo.DATA_DIR, puerto: int = 0):
+        super().__init__(('127.0.0.1', puerto), ManejadorPruebas)
+        self.directorio = directorio
+        self.cortes = {}        # nombre -> bytes enviados antes de cortar (una vez)
+        self.corromper = set()  # nombres servidos con un byte alterado
+        self.peticiones = []    # (nombre, cabeceras) recibidas
+        self._contenidos = {}
+
+    def contenido(self, path: str) -> tuple:
+        """(bytes, ETag) del archivo, recalculados si cambia en disco."""
+        st = os.stat(path)
+        clave = (path, st.st_mtime_ns, st.st_size)
+        if clave not in self._contenidos:
+            with open(path, 'rb') as f:
+                datos = f.read()
+            self._contenidos[clave] = (datos, '"' + hashlib.sha256(datos).hexdigest()[:20] + '"')
+        return self._contenidos[clave]
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}/"
+
+    def iniciar(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+def comprobar(directorio: str = cis_catalogo.DATA_DIR) -> int:
+    """Autocomprobación contra el servidor local: descarga, 304, reanudación, checksum, 404."""
+    fallos = 0
+    servidor = ServidorPruebas(directorio).iniciar()
+    tmp = tempfile.mkdtemp(prefix='cis_descargas_')
+    try:
+        registro = Registro(os.path.join(tmp, 'registro.json'))
+        destino = os.path.join(tmp, 'estudios')
+        ids = sorted({cis_catalogo.id_estudio(n) for n in os.listdir(directorio)
+                      if cis_catalogo.variante(n) and es_libro_valido(n)})
+
+        def comprobar_caso(descripcion, ok):
+            nonlocal fallos
+            fallos += not ok
+            print(f"  {descripcion:<58} {'OK' if ok else 'FALLO'}")
+
+        t0 = time.perf_counter()
+        resultados = descargar_estudios(ids, destino, servidor.url, registro=registro)
+        iguales = all(r['estado'] == 'descargado' and
+                      r['sha256'] == hash_archivo(os.path.join(directorio, r['archivo'])).hexdigest()
+                      for r in resultados)
+        comprobar_caso(f"{len(resultados)} archivos de {len(ids)} estudios en {time.perf_counter() - t0:.2f} s", iguales)
+
+        resultados = descargar_estudios(ids, destino, servidor.url, registro=registro)
+        comprobar_caso("segunda pasada: todo 304 sin transferir", all(r['estado'] == 'sin_cambios' and r['bytes'] == 0
+                                                                       for r in resultados))
+
+        libro = next(r['archivo'] for r in resultados if r['archivo'].endswith('.xlsx'))
+        os.remove(os.path.join(destino, libro))
+        servidor.cortes[libro] = 100000
+        r = next(r for r in descargar_estudios([cis_catalogo.id_estudio(libro)], destino, servidor.url,
+                                               registro=registro) if r['archivo'] == libro)
+        origen = hash_archivo(os.path.join(directorio, libro)).hexdigest()
+        comprobar_caso(f"corte a los 100 KB y reanudación con Range ({libro})",
+                       r['estado'] == 'descargado' and r['reanudado'] and r['sha256'] == origen)
+
+        os.remove(os.path.join(destino, libro))
+        servidor.corromper.add(libro)
+        r = descargar_estudios([cis_catalogo.id_estudio(libro)], destino, servidor.url, registro=registro)[0]
+        comprobar_caso("archivo alterado: rechazado por Digest", r['estado'] == 'error'
+                       and not os.path.exists(os.path.join(destino, libro)))
+        servidor.corromper.clear()
+
+        r = descargar_estudios(['9999'], destino, servidor.url, registro=registro)
+        comprobar_caso("estudio inexistente: no_encontrado", [x['estado'] for x in r] == ['no_encontrado'])
+    finally:
+        servidor.shutdown()
+        servidor.server_close()
+        shutil.rmtree(tmp, ignore_errors=True)
+    print(f"{'Sin fallos' if not fallos else f'{fallos} fallos'}")
+    return fallos
+
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == 'servir':
+        parser = argparse.ArgumentParser(description="Servidor HTTP local de archivos de estudios")
+        parser.add_argument('accion')
+        parser.add_argument('--directorio', default=cis_catalogo.DATA_DIR)
+        parser.add_argument('--puerto', type=int, default=8765)
+        args = parser.parse_args()
+        servidor = ServidorPruebas(args.directorio, args.puerto)
+        print(f"Sirviendo {args.directorio} en {servidor.url} (Ctrl+C para salir)")
+        try:
+            servidor.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        return
+    if len(sys.argv) > 1 and sys.argv[1] == 'comprobar':
+        sys.exit(1 if comprobar() else 0)
+
+    parser = argparse.ArgumentParser(description="Descarga de estudios del CIS")
+    parser.add_argument('ids', nargs='+', help="Ids de estudio del CIS (p. ej. 3547)")
+    parser.add_argument('--url-base', default=URL_BASE, help="URL bajo la que están los archivos")
+    parser.add_argument('--destino', default=cis_catalogo.DATA_DIR, help="Carpeta de estudios")
+    parser.add_argument('--concurrencia', type=int, default=CONCURRENCIA)
+    parser.add_argument('--ingerir', action='store_true', help="Ingerir al terminar (cis_ingesta, una pasada)")
+    args = parser.parse_args()
+
+    t0 = time.perf_counter()
+    resultados = descargar_estudios(args.ids, args.destino, args.url_base, args.concurrencia)
+    for r in resultados:
+        extra = f"{r['bytes'] / 1048576:.1f} MB" + (" (reanudado)" if r.get('reanudado') else "")
+        print(f"  {r['archivo']:<24} {r['estado']:<14} {extra if r['estado'] == 'descargado' else r.get('mensaje', '')}")
+    print(f"{len(resultados)} archivos en {time.perf_counter() - t0:.1f} s")
+    if args.ingerir and any(r['estado'] == 'descargado' for r in resultados):
+        ingerir(args.destino)
+    sys.exit(1 if any(r['estado'] == 'error' for r in resultados) else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,222 @@
+"""
+Evaluación vectorizada de escenarios Aldabón-Gemini.
+
+Reproduce la aritmética de cis_estudios.estimar_aldabon_gemini sobre matrices NumPy:
+los insumos extraídos del Excel se convierten una vez en un modelo (vectores y
+matrices densas) y cada escenario de momentum (Λ) y fidelidad (Φ) es una fila.
+"""
+
+import numpy as np
+
+from cis_estudios import UMBRALES_ABSTENCION, calcular_factores_k
+
+NO_VOTO = ['No Sabe', 'No Contesta', 'Abstención']
+
+# Versión del documento de exportación (ModeloAldabon.exportar); subir si cambia el formato
+MODELO_VERSION = 1
+
+
+def _redondear(valores: np.ndarray) -> np.ndarray:
+    """round(x, 1) de Python (redondeo decimal exacto) aplicado elemento a elemento.
+
+    np.round multiplica por 10 antes de redondear y difiere de Python en los casos
+    frontera (0.15 -> 0.2 en NumPy, 0.1 en Python). Esos pocos casos se rehacen en Python.
+    """
+    r = np.round(valores, 1)
+    x10 = valores * 10
+    dudosos = np.abs(np.abs(x10 - np.trunc(x10)) - 0.5) < 1e-6
+    if dudosos.any():
+        idx = np.nonzero(dudosos)
+        r[idx] = [round(float(v), 1) for v in valores[idx]]
+    return r
+
+
+def _sumar_en_orden(matriz: np.ndarray) -> np.ndarray:
+    """Suma por filas columna a columna, en el mismo orden que sum() sobre el dict escalar."""
+    suma = np.zeros(matriz.shape[0])
+    for j in range(matriz.shape[1]):
+        suma += matriz[:, j]
+    return suma
+
+
+class ModeloAldabon:
+    """Estado precomputado de la estimación de un estudio (todo lo que no depende de Λ).
+
+    Eje de categorías: las del voto directo en su orden (sin NS/NC/Abstención),
+    'En Blanco' si no estaba, y 'Abstención' al final.
+    """
+
+    def __init__(self, voto_directo: dict, recuerdo: dict, partidos_ref: dict, config: dict):
+        base = [p for p in voto_directo if p not in NO_VOTO]
+        self.blanco_en_base = 'En Blanco' in base
+        self.categorias = base + ([] if self.blanco_en_base else ['En Blanco']) + ['Abstención']
+        self.n_base = len(base)
+        idx = {p: i for i, p in enumerate(self.categorias)}
+        self.i_blanco = idx['En Blanco']
+        self.i_abst = idx['Abstención']
+        n = len(self.categorias)
+
+        # Factor K (regla atenuada para Blanco/Nulo sin referencia, como en el motor escalar)
+        k_factors = calcular_factores_k(recuerdo, partidos_ref)
+        self.vd = np.zeros(n)
+        self.k = np.ones(n)
+        for p in base:
+            i = idx[p]
+            self.vd[i] = voto_directo[p]
+            k = k_factors.get(p, 1.0)
+            if p in ['En Blanco', 'Voto Nulo'] and p not in k_factors:
+                rec_val = recuerdo.get(p, 0)
+                ref_val = partidos_ref.get(p, 0)
+                k = 1.0 + ((ref_val / rec_val) - 1.0) * 0.75 if rec_val > 0 else 1.0
+            self.k[i] = k
+
+        self.fidelidad = np.array([config['fidelidad'].get(p, 1.0) for p in self.categorias], dtype=float)
+        self.momentum = np.array([config['momentum'].get(p, 1.0) for p in self.categorias], dtype=float)
+
+        # Destinos válidos: categorías del voto directo y siempre 'En Blanco'
+        destinos_validos = set(base) | {'En Blanco'}
+        # Orígenes: todo el eje; 'En Blanco' fuera del voto directo recibe transvases y,
+        # como en el motor escalar, reparte sus pérdidas por momentum con su fila de sector
+        self.transvases, self.transvases_destino = self._matriz(config['transvases'], idx, destinos_validos)
+        self.sector, self.sector_destino = self._matriz(config['matriz_sector'], idx, destinos_validos)
+        self.tiene_sector = np.array([p in config['matriz_sector'] for p in self.categorias])
+        self.umbrales = np.array(UMBRALES_ABSTENCION, dtype=float)
+
+    @staticmethod
+    def _matriz(mapa: dict, idx: dict, destinos_validos: set):
+        """Convierte {origen: {destino: pct}} en matriz densa origen × destino (+ máscara de presencia)."""
+        n = len(idx)
+        m = np.zeros((n, n))
+        presente = np.zeros((n, n), dtype=bool)
+        for origen, destinos in mapa.items():
+            if origen not in idx:
+                continue
+            for destino, pct in destinos.items():
+                if destino in destinos_validos:
+                    m[idx[origen], idx[destino]] += pct
+                    presente[idx[origen], idx[destino]] = True
+        return m, presente
+
+    def vector(self, valores: dict, por_defecto: np.ndarray) -> np.ndarray:
+        """Vector sobre el eje de categorías a partir de un dict parcial {partido: valor}."""
+        v = por_defecto.copy()
+        for p, val in (valores or {}).items():
+            if p in self.categorias:
+                v[self.categorias.index(p)] = val
+        return v
+
+    def _porcentaje_abstencion(self, lam: np.ndarray) -> np.ndarray:
+        umbrales, pcts = self.umbrales[:, 0], self.umbrales[:, 1]
+        return np.select([lam >= u for u in umbrales], pcts, default=pcts[-1])
+
+    def evaluar(self, momentum: np.ndarray = None, fidelidad: np.ndarray = None):
+        """Evalúa N escenarios a la vez.
+
+        Args:
+            momentum: matriz N × categorías de Λ (por defecto, el Λ del estudio).
+            fidelidad: matriz N × categorías de Φ base, o None para usar la del estudio.
+        Returns:
+            (valores, presentes): estimación N × categorías en % (NaN si la categoría
+            no aparecería en la salida escalar) y la máscara de presencia.
+        """
+        lam = np.atleast_2d(self.momentum if momentum is None else np.asarray(momentum, dtype=float))
+        n_esc = lam.shape[0]
+        phi_base = self.fidelidad if fidelidad is None else np.asarray(fidelidad, dtype=float)
+        phi_base = np.broadcast_to(np.atleast_2d(phi_base), lam.shape)
+        nb = self.n_base
+
+        # B. E_p = S_p × K_p × Φ_p (con suelo en el voto directo)
+        vd, k = self.vd[:nb], self.k[:nb]
+        phi = np.minimum(1.0, phi_base[:, :nb] * k)
+        base_val = vd * k * phi
+        est = np.zeros(lam.shape)
+        est[:, :nb] = np.maximum(vd, base_val)
+        masa = np.where(base_val < vd * k, vd * k - base_val, 0.0)
+
+        presentes = np.zeros(lam.shape, dtype=bool)
+        presentes[:, :nb] = True
+
+        # C. Transvases de la masa perdida por fidelidad
+        masa_full = np.zeros(lam.shape)
+        masa_full[:, :nb] = masa
+        est += masa_full @ self.transvases
+        if not self.blanco_en_base:
+            presentes[:, self.i_blanco] = ((masa_full > 0) & self.transvases_destino[:, self.i_blanco]).any(axis=1)
+
+        # D. Momentum: deltas sobre la foto previa, aplicados en orden (la abstención se recorta en 0);
+        # la parte de sector de las pérdidas se reparte al final con un único producto
+        deltas = np.where(presentes, est * (lam - 1.0), 0.0)
+        deltas[:, self.i_abst] = 0.0
+        abst = np.zeros(n_esc)
+        abst_presente = np.zeros(n_esc, dtype=bool)
+        perdidas_sector = np.zeros(lam.shape)
+        for j in range(len(self.categorias)):
+            d = deltas[:, j]
+            neg = d < 0
+            if neg.any():
+                perdida = np.where(neg, -d, 0.0)
+                est[:, j] -= perdida
+                pct_abst = self._porcentaje_abstencion(lam[:, j])
+                abst += perdida * pct_abst
+                abst_presente |= neg
+                if self.tiene_sector[j]:
+                    perdidas_sector[:, j] = perdida * (1.0 - pct_abst)
+                    if self.sector_destino[j, self.i_blanco]:
+                        presentes[:, self.i_blanco] |= neg
+                else:
+                    abst += perdida * (1.0 - pct_abst)
+            pos = d > 0
+            if pos.any():
+                est[:, j] += np.where(pos, d, 0.0)
+                abst = np.where(pos & abst_presente, np.maximum(0.0, abst - d), abst)
+        est += perdidas_sector @ self.sector
+        est[:, self.i_abst] = abst
+        presentes[:, self.i_abst] = abst_presente
+
+        # E. Normalización al 100% y ajuste de redondeo sobre la categoría mayor
+        valores = np.where(presentes, est, 0.0)
+        total = _sumar_en_orden(valores)
+        ok = total > 0
+        pct = np.zeros(lam.shape)
+        pct[ok] = _redondear(valores[ok] * 100 / total[ok, None])
+        pct = np.where(presentes, pct, 0.0)
+        suma = _sumar_en_orden(pct)
+        ajustar = ok & (np.abs(suma - 100) > 0.01)
+        if ajustar.any():
+            filas = np.nonzero(ajustar)[0]
+            mayor = np.argmax(np.where(presentes[filas], pct[filas], -np.inf), axis=1)
+            pct[filas, mayor] = _redondear(pct[filas, mayor] + (100 - suma[filas]))
+        presentes &= ok[:, None]
+        return np.where(presentes, pct, np.nan), presentes
+
+    def exportar(self) -> dict:
+        """Estado del modelo como documento JSON compacto para evaluarlo en el cliente.
+
+        Las matrices se exportan dispersas como [origen, destino, pct] (índices sobre
+        'categorias'), en orden origen → destino como las recorre el motor escalar.
+        """
+        def tripletas(m, presente):
+            return [[int(i), int(j), float(m[i, j])] for i, j in zip(*np.nonzero(presente))]
+
+        return {
+            'version': MODELO_VERSION,
+            'categorias': list(self.categorias),
+            'n_base': self.n_base,
+            'voto_directo': self.vd.tolist(),
+            'k': self.k.tolist(),
+            'fidelidad': self.fidelidad.tolist(),
+            'momentum': self.momentum.tolist(),
+            'transvases': tripletas(self.transvases, self.transvases_destino),
+            'matriz_sector': tripletas(self.sector, self.sector_destino),
+            'origenes_sector': [int(i) for i in np.nonzero(self.tiene_sector)[0]],
+            'umbrales_abstencion': self.umbrales.tolist(),
+        }
+
+    def a_dicts(self, valores: np.ndarray) -> list:
+        """Convierte la salida de evaluar() en dicts {categoría: %} como los del motor escalar."""
+        return [{p: float(v) for p, v in zip(self.categorias, fila) if not np.isnan(v)} for fila in valores]
+
+
+def construir_modelo(insumos: dict) -> ModeloAldabon:
+    """Atajo: ModeloAldabon a partir de EstudioCIS.extraer_insumos()."""
+    return ModeloAldabon(insumos['voto_directo'], insumos['recuerdo'], insumos['partidos_ref'], insumos['config'])
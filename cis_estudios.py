@@ -3,22 +3,146 @@ Clases para análisis de estudios del CIS.
 Arquitectura modular para diferentes tipos de estudios electorales.
 """
 
+import numpy as np
 import pandas as pd
+import json
 import os
 import re
 from abc import ABC, abstractmethod
 
+from cis_cache import firma_archivo, ruta_artefacto
+from cis_cruces import CuboCruces, cargar as cargar_cruces, guardar as guardar_cruces
+from cis_instrumentacion import tramo, contar, instrumentar
+from cis_memoria import CacheMemoria, registrar_estudio, medir_asignacion
 
-class EstudioCIS(ABC):
-    """Clase base abstracta para todos los estudios del CIS."""
+
+# Hojas leídas por los extractores, compartidas entre instancias del mismo libro
+# (clave: ruta, firma del archivo, hoja) y sujetas al presupuesto de cis_memoria
+HOJAS = CacheMemoria('hojas_excel')
+
+# Reparto de la pérdida por momentum: (Λ mínimo, fracción a abstención), de mayor a menor
+UMBRALES_ABSTENCION = [(0.90, 0.40), (0.80, 0.50), (0.0, 0.60)]
+
+# Matriz de transferencia (recuerdo × intención): entrevistas ponderadas mínimas de una
+# columna de recuerdo para fiarse de su Φ, y cuota mínima de un destino para ser transvase
+N_MIN_TRANSFERENCIA = 30
+CUOTA_MIN_TRANSVASE = 0.03
+
+# Matriz de sector por proximidad ideológica (escala 1-10): la afinidad entre dos
+# electorados cae a 1/e a ANCHO_PROXIMIDAD puntos de distancia; los destinos con menos
+# de CUOTA_MIN_SECTOR de la pérdida se descartan y la fila se renormaliza
+ANCHO_PROXIMIDAD = 1.0
+CUOTA_MIN_SECTOR = 0.05
+
+# Transvases (sin hoja RV) y matriz de sector de respaldo (sin cruce de ideología)
+TRANSVASES_POR_DEFECTO = {
+    'PSOE': {'SUMAR': 0.10, 'PODEMOS': 0.08, 'En Blanco': 0.05},
+    'PP': {'VOX': 0.05},
+    'VOX': {'PP': 0.12, 'SALF': 0.05},
+    'SUMAR': {'PSOE': 0.08, 'PODEMOS': 0.10},
+    'PODEMOS': {'SUMAR': 0.12}
+}
+MATRIZ_SECTOR_POR_DEFECTO = {
+    'PSOE': {'SUMAR': 0.67, 'PODEMOS': 0.33},
+    'PP': {'VOX': 0.70, 'En Blanco': 0.30},
+    'VOX': {'PP': 0.85, 'En Blanco': 0.15},
+    'SALF': {'VOX': 0.60, 'En Blanco': 0.40},
+    'SUMAR': {'PSOE': 0.67, 'PODEMOS': 0.33},
+    'PODEMOS': {'SUMAR': 0.57, 'PSOE': 0.43},
+}
+
+# Destinos que cuentan como voto declarado en la matriz (el resto: abstención e indecisión)
+NO_PARTIDOS = ['Abstención', 'No Sabe', 'No Contesta', 'Sin Derecho']
+
+# Categorías de indecisión del voto directo que reparte la asignación de indecisos
+# (versión del artefacto en data/cache/indecisos: cambiarla fuerza recalcular)
+INDECISOS = ['No Sabe', 'No Contesta']
+VERSION_INDECISOS = 1
+
+
+def fuzzy_normalize(text: str) -> str:
+    """Normaliza texto eliminando acentos, caracteres raros y espacios."""
+    if not text or not isinstance(text, str): return ""
+    t = text.upper()
+    t = t.replace('Á', 'A').replace('É', 'E').replace('Í', 'I').replace('Ó', 'O').replace('Ú', 'U')
+    t = t.replace('Ñ', 'N').replace('±', 'N').replace('Ï', 'I').replace('¾', 'O').replace('Ë', 'O').replace('Ý', 'I').replace('═', 'O')
+    t = re.sub(r'[^A-Z0-9]', '', t)
+    return t
+
+
+class LectorLibro:
+    """Acceso a los datos de un estudio en disco: hojas del Excel y texto del PDF asociado.
     
+    Es el único punto de E/S de EstudioCIS y crear_estudio: cis_fixtures ofrece
+    lectores que graban y reproducen estos mismos accesos sin abrir el libro.
+    """
+
     def __init__(self, file_path: str):
         self.file_path = file_path
-        self.excel_file = pd.ExcelFile(file_path)
+        self.firma = firma_archivo(file_path)
+        with tramo('abrir_libro', archivo=os.path.basename(file_path)):
+            self.excel_file = pd.ExcelFile(file_path)
         self.sheet_names = self.excel_file.sheet_names
+
+    def leer_hoja(self, hoja: str) -> pd.DataFrame:
+        """Hoja completa sin cabecera."""
+        return pd.read_excel(self.excel_file, sheet_name=hoja, header=None)
+
+    def existe(self, ruta: str) -> bool:
+        return os.path.exists(ruta)
+
+    def texto_pdf(self, ruta: str) -> str:
+        """Texto de todas las páginas del PDF."""
+        return texto_pdf(ruta)
+
+
+def texto_pdf(ruta: str) -> str:
+    """
+    Texto de todas las páginas del PDF. Se guarda junto a la firma del PDF en
+    data/cache/pdf_texto/ (cis_ingesta lo genera al llegar el PDF; si no, la primera
+    extracción): mientras el PDF no cambie, no se vuelve a pasar por pypdf.
+    """
+    sidecar = ruta_artefacto('pdf_texto', ruta, '.json')
+    firma = list(firma_archivo(ruta))
+    try:
+        with open(sidecar, encoding='utf-8') as f:
+            guardado = json.load(f)
+        if guardado.get('firma') == firma:
+            return guardado['texto']
+    except Exception:
+        pass
+    from pypdf import PdfReader
+    reader = PdfReader(ruta)
+    text = ""
+    for page in reader.pages:
+        text += page.extract_text() + "\n"
+    contar('paginas_pdf', len(reader.pages))
+    try:
+        with open(sidecar, 'w', encoding='utf-8') as f:
+            json.dump({'firma': firma, 'paginas': len(reader.pages), 'texto': text}, f, ensure_ascii=False)
+    except OSError:
+        pass  # caché no escribible: se extrae en cada llamada
+    return text
+
+
+class EstudioCIS(ABC):
+    """Clase base abstracta para todos los estudios del CIS."""
+    
+    def __init__(self, file_path: str, lector: LectorLibro = None):
+        self.file_path = file_path
+        antes = medir_asignacion()
+        self.lector = lector or LectorLibro(file_path)
+        # Coste en memoria del libro abierto (solo con CIS_MEMORIA_TRAZA)
+        self._bytes_apertura = max(0, medir_asignacion() - antes) if antes is not None else None
+        self._firma = self.lector.firma
+        self.sheet_names = self.lector.sheet_names
         self._cache = {}
         self._inferred_data = None
+        # Microdatos del estudio (cis_microdatos.Microdatos): si están, sustituyen a las hojas
+        self.microdatos = None
+        registrar_estudio(self)
 
+    @instrumentar()
     def _infer_context(self) -> dict:
         """Infiere métricas clave del estudio a partir de los cruces de datos."""
         if self._inferred_data:
@@ -40,6 +164,7 @@ class EstudioCIS(ABC):
         'EXTREMADURA': {'PP': 38.8, 'PSOE': 39.9, 'VOX': 8.1, 'PODEMOS': 6.0}
     }
 
+    @instrumentar()
     def _extraer_bias_recuerdo(self) -> dict:
         """Compara el recuerdo con el histórico real del año del recuerdo (2023)."""
         recuerdo = self.extraer_recuerdo_voto()
@@ -108,24 +233,41 @@ class EstudioCIS(ABC):
             'Voto Nulo': 1.0
         }
         
-        # 3. Matriz de Transvases (voto refugio ideológico)
-        transvases = {
-            'PSOE': {'SUMAR': 0.10, 'PODEMOS': 0.08, 'En Blanco': 0.05},
-            'PP': {'VOX': 0.05},
-            'VOX': {'PP': 0.12, 'SALF': 0.05},
-            'SUMAR': {'PSOE': 0.08, 'PODEMOS': 0.10},
-            'PODEMOS': {'SUMAR': 0.12}
+        # 3. Transvases (voto refugio): fracción del voto declarado que se reparte entre
+        # otros partidos. La proximidad ideológica no sirve aquí: cada fila suma 1 y
+        # vaciaría la base de origen, mientras que el transvase es solo la parte no fiel.
+        transvases = {p: dict(d) for p, d in TRANSVASES_POR_DEFECTO.items()}
+        
+        # 4. Matriz de sector (destino de la pérdida por momentum que no va a abstención):
+        # proximidad ideológica de los electorados del propio estudio; sin cruce de
+        # ideología, los valores de respaldo
+        sector = self.sector_ideologico()
+        matriz_sector = sector or MATRIZ_SECTOR_POR_DEFECTO
+        
+        justificacion = {
+            'Modelo': 'Aldabón-Gemini 3.0 (Parámetros Fijos)',
+            'Φ (Fidelidad)': 'Tasa de retención estructural histórica',
+            'Λ (Momentum)': 'Factor de coyuntura actual (desgaste/viralidad)'
         }
+        if sector:
+            justificacion['Matriz de sector'] = 'Proximidad ideológica de los electorados (escala 1-10 del estudio)'
+        
+        # 5. Φ y transvases propios del estudio (matriz recuerdo × intención de la hoja RV).
+        # Los partidos sin columna suficiente en el cruce conservan los valores anteriores.
+        coeficientes = self.coeficientes_transferencia()
+        if coeficientes:
+            fidelidad.update(coeficientes['fidelidad'])
+            transvases.update(coeficientes['transvases'])
+            fuente = "microdatos" if self._microdato('intencion') and self._microdato('recuerdo') else f"hoja {self.get_hoja_rv()}"
+            justificacion['Φ (Fidelidad)'] = f"Retención recuerdo → intención del estudio ({fuente})"
+            justificacion['Transvases'] = 'Destinos del voto declarado no fiel en la misma matriz'
         
         return {
             'fidelidad': fidelidad,
             'momentum': momentum,
             'transvases': transvases,
-            'justificacion': {
-                'Modelo': 'Aldabón-Gemini 3.0 (Parámetros Fijos)',
-                'Φ (Fidelidad)': 'Tasa de retención estructural histórica',
-                'Λ (Momentum)': 'Factor de coyuntura actual (desgaste/viralidad)'
-            }
+            'matriz_sector': matriz_sector,
+            'justificacion': justificacion
         }
     
     @abstractmethod
@@ -138,69 +280,135 @@ class EstudioCIS(ABC):
         """Retorna el nombre de la hoja de Recuerdo de Voto a usar."""
         pass
     
+    @instrumentar()
     def _extraer_metricas_rurales(self) -> float:
         """Calcula el peso de municipios pequeños (<10k hab) usando el total del estudio."""
-        sheet = self._encontrar_hoja('TAMAÑO DE MUNICIPIO')
-        if not sheet: return 0.3
         try:
-            df = pd.read_excel(self.file_path, sheet_name=sheet, header=None)
-            for i in range(min(100, len(df))):
-                cell_val = str(df.iloc[i, 0]).upper()
-                if '(N)' in cell_val:
-                    row = df.iloc[i]
-                    total = self._try_float(row.iloc[1])
-                    if total and total > 500:
-                        rural = (self._try_float(row.iloc[2]) or 0.0) + (self._try_float(row.iloc[3]) or 0.0)
-                        return rural / total if total > 0 else 0.3
+            n = self._n_cruce(self._encontrar_hoja('TAMAÑO DE MUNICIPIO'), 'tamuni')
+            total = n.get('TOTAL')
+            if total and total > 500:
+                # Tramos cuyo límite superior no pasa de 10.000 habitantes
+                limites = {s: [float(x.replace('.', '')) for x in re.findall(r'\d[\d.]*', s)] for s in n.index}
+                rural = sum(v for s, v in n.items()
+                            if s != 'TOTAL' and limites[s] and max(limites[s]) <= 10000 and 'MÁS' not in s.upper())
+                return rural / total
         except: pass
         return 0.3
 
+    @instrumentar()
     def _extraer_metricas_ideologicas(self) -> float:
         """Infiere polarización (peso de extremos 1-2 y 9-10) en la escala 1-10."""
-        sheet = self._encontrar_hoja('IDEOLOGÍA')
-        if not sheet: return 0.5
         try:
-            df = pd.read_excel(self.file_path, sheet_name=sheet, header=None)
-            for i in range(min(100, len(df))):
-                row_str = [str(x) for x in df.iloc[i].tolist()]
-                if any('1 Izquierda' in x for x in row_str):
-                    for k in range(i + 1, i + 20):
-                        if k >= len(df): break
-                        if '(N)' in str(df.iloc[k, 0]):
-                            n_row = df.iloc[k]
-                            total = self._try_float(n_row.iloc[1])
-                            if total and total > 500:
-                                # Extremos: 1-2 (cols 2,3) y 9-10 (cols 10,11)
-                                extremos = sum((self._try_float(n_row.iloc[c]) or 0.0) for c in [2, 3, 10, 11])
-                                return extremos / total if total > 0 else 0.5
+            n = self._n_cruce(self._encontrar_hoja('IDEOLOGÍA'), 'ideologia')
+            total = n.get('TOTAL')
+            if total and total > 500:
+                # Extremos: segmentos '1 Izquierda', '2', '9' y '10 Derecha'
+                extremos = sum(v for s, v in n.items() if re.match(r'(1|2|9|10)(\D|$)', s))
+                return extremos / total
         except: pass
         return 0.5
 
+    @instrumentar()
     def _extraer_segunda_opcion(self) -> dict:
-        """Extrae transvases potenciales de la pregunta de segunda opción (P12)."""
-        sheet = self._encontrar_hoja('RESULTADOS') or self._encontrar_hoja('VOTO DIRECTO')
-        if not sheet: return {}
+        """Extrae transvases potenciales de la pregunta de segunda opción ("si no votase...")."""
+        hoja = self._hoja_marginales()
+        if not hoja: return {}
         try:
-            df = pd.read_excel(self.file_path, sheet_name=sheet, header=None)
-            found_p12 = False
+            cubo, pregunta = self._cruce(hoja, 'NO VOTASE')
+            if pregunta is None: return {}
             transvases = {}
-            for i in range(len(df)):
-                cell_val = str(df.iloc[i, 0]).upper()
-                if 'SEGUNDA OPCION' in cell_val or 'P12' in cell_val or 'PREGUNTA 12' in cell_val:
-                    found_p12 = True
-                    continue
-                if found_p12:
-                    if '(N)' in cell_val or 'PREGUNTA' in cell_val: 
-                        if transvases: break
-                        continue
-                    p_key = self._normalizar_partido(df.iloc[i, 0])
-                    val = self._try_float(df.iloc[i, 1])
-                    if p_key and val and val > 0:
-                        transvases[p_key] = val / 100.0
+            for categoria, val in cubo.crosstab(pregunta, hoja)['TOTAL'].items():
+                if 'NO VOTAR' in categoria.upper():
+                    continue  # "No votaría a ningún otro partido"
+                p_key = self._normalizar_partido(categoria)
+                if p_key and val > 0:
+                    transvases[p_key] = transvases.get(p_key, 0.0) + float(val) / 100.0
             return {'GLOBAL': transvases} if transvases else {}
         except: pass
         return {}
 
+    def _microdato(self, rol: str) -> str:
+        """Variable de los microdatos para un rol de cis_microdatos.ROLES (None sin microdatos)."""
+        return self.microdatos.variable(rol) if self.microdatos is not None else None
+
+    def _n_cruce(self, hoja: str, rol: str) -> pd.Series:
+        """
+        N (TOTAL y cada segmento) de una variable de cruce: de los microdatos si tienen
+        la variable del rol; si no, del primer bloque de la hoja de cruce.
+        """
+        variable = self._microdato(rol)
+        if variable:
+            return self.microdatos.n(por=variable)
+        if not hoja or hoja not in self.sheet_names:
+            return pd.Series(dtype=float)
+        cubo, pregunta = self._cruce(hoja)
+        return cubo.n(pregunta, hoja) if pregunta else pd.Series(dtype=float)
+
+    def _hoja_marginales(self) -> str:
+        """Hoja de marginales de la muestra completa ('Resultados', 'Resultados Aragón', 'Marginales')."""
+        return self._encontrar_hoja('RESULTADOS') or self._encontrar_hoja('MARGINALES')
+
+    def cruces(self, hoja: str = None, preguntas: list = None) -> CuboCruces:
+        """
+        Cubo de cruces del libro (cis_cruces). Con `hoja`, garantiza indexada esa hoja y
+        convertidos sus bloques de `preguntas` (todos si es None; [] solo indexa); sin
+        `hoja`, todo el libro. Cada bloque se convierte una vez (la hoja sale de HOJAS)
+        y el cubo se guarda en data/cache/cruces para las siguientes instancias.
+        """
+        cubo = self._cache.get('cruces')
+        if cubo is None:
+            cubo = self._cache['cruces'] = cargar_cruces(self.file_path, self._firma)
+        cambios = False
+        for h in ([hoja] if hoja else self.sheet_names):
+            if h in self.sheet_names and cubo.pendiente(h, preguntas):
+                with tramo('convertir_cruces', hoja=h):
+                    cambios |= cubo.anadir(h, self._leer_hoja(h), preguntas)
+        if cambios:
+            guardar_cruces(self.file_path, self._firma, cubo)
+        return cubo
+
+    def _cruce(self, hoja: str, pregunta: str = None):
+        """(cubo, clave) con el bloque de `pregunta` (referencia de CuboCruces.buscar; la primera si None) convertido."""
+        cubo = self.cruces(hoja, [])
+        clave = cubo.buscar(pregunta, hoja) if pregunta else next(iter(cubo.preguntas(hoja)), None)
+        if clave:
+            cubo = self.cruces(hoja, [clave])
+        return cubo, clave
+
+    def crosstab(self, pregunta: str, segmento: str = None) -> pd.DataFrame:
+        """
+        Tabla categorías × segmentos de una pregunta ('11R', 'Pregunta 11R' o fragmento
+        del enunciado) cruzada por `segmento` (nombre de la hoja de cruce, p. ej.
+        'Tamaño de municipio'); sin segmento, los marginales (columna TOTAL). Con
+        microdatos, pregunta y segmento pueden ser variables o roles ('intencion').
+        """
+        if self.microdatos is not None and self.microdatos.variable(pregunta) \
+                and (segmento is None or self.microdatos.variable(segmento)):
+            # Variables de los microdatos (nombre o rol): tabla ponderada
+            return self.microdatos.tabla(self.microdatos.variable(pregunta), self.microdatos.variable(segmento))
+        hoja = self._encontrar_hoja(segmento) if segmento else self._hoja_marginales()
+        if not hoja:
+            return pd.DataFrame()
+        cubo, clave = self._cruce(hoja, pregunta)
+        return cubo.crosstab(clave, hoja) if clave else pd.DataFrame()
+
+    def _leer_hoja(self, hoja: str) -> pd.DataFrame:
+        """Lee una hoja completa sin cabecera (punto único de lectura de los extractores).
+        
+        El DataFrame queda en la caché HOJAS y se comparte: los extractores no lo modifican.
+        """
+        clave = (self.file_path, self._firma, hoja)
+        df = HOJAS.get(clave)
+        if df is not None:
+            contar('hojas_en_cache')
+            return df
+        with tramo('leer_hoja', hoja=hoja):
+            df = self.lector.leer_hoja(hoja)
+            contar('filas_leidas', len(df))
+            contar('celdas_leidas', df.size)
+        HOJAS[clave] = df
+        return df
+
     def _encontrar_hoja(self, keyword: str) -> str:
         """Busca una hoja por palabra clave usando normalización difusa."""
         norm_key = self._fuzzy_normalize(keyword)
@@ -211,6 +419,7 @@ class EstudioCIS(ABC):
 
     def _try_float(self, val) -> float:
         """Conversión robusta a float para formatos de texto CIS."""
+        contar('celdas_convertidas')
         try:
             if pd.isna(val) or str(val).strip().lower() in ['nan', '', 'n.c.', 'n.s.']: 
                 return None
@@ -225,13 +434,9 @@ class EstudioCIS(ABC):
 
     def _fuzzy_normalize(self, text: str) -> str:
         """Normaliza texto eliminando acentos, caracteres raros y espacios."""
-        if not text or not isinstance(text, str): return ""
-        t = text.upper()
-        t = t.replace('Á', 'A').replace('É', 'E').replace('Í', 'I').replace('Ó', 'O').replace('Ú', 'U')
-        t = t.replace('Ñ', 'N').replace('±', 'N').replace('Ï', 'I').replace('¾', 'O').replace('Ë', 'O').replace('Ý', 'I').replace('═', 'O')
-        t = re.sub(r'[^A-Z0-9]', '', t)
-        return t
+        return fuzzy_normalize(text)
 
+    @instrumentar()
     def extraer_ficha_tecnica(self) -> dict:
         """Extrae las características técnicas del sondeo desde la hoja Ficha técnica."""
         import re
@@ -255,10 +460,11 @@ class EstudioCIS(ABC):
             return ficha
         
         try:
-            df = pd.read_excel(self.excel_file, sheet_name=hoja_ficha, header=None)
+            df = self._leer_hoja(hoja_ficha)
             
             # Buscar en todas las celdas
             for i in range(min(20, len(df))):
+                contar('filas_recorridas')
                 for j in range(min(4, len(df.columns))):
                     cell = str(df.iloc[i, j]) if pd.notna(df.iloc[i, j]) else ""
                     cell_upper = cell.upper()
@@ -311,8 +517,13 @@ class EstudioCIS(ABC):
 
 
     
+    @instrumentar()
     def extraer_voto_directo(self) -> dict:
-        """Extrae el Voto Directo. Busca en hoja Estimación o Resultados."""
+        """Extrae el Voto Directo. Busca en hoja Estimación o Resultados (o en los microdatos)."""
+        variable = self._microdato('intencion')
+        if variable:
+            return self._distribucion(self.microdatos.tabla(variable)['TOTAL'])
+        
         hoja_estim = self._encontrar_hoja_estimacion()
         if not hoja_estim:
             return {}
@@ -323,6 +534,40 @@ class EstudioCIS(ABC):
             
         return self._extraer_columna_estimacion(col_idx=1, normalizar=False)
     
+    def _distribucion(self, porcentajes: pd.Series) -> dict:
+        """{clave: %} de una pregunta de voto (categoría -> % del total), con las claves del voto directo."""
+        resultados = {}
+        for categoria, val in porcentajes.items():
+            clave = self._categoria_transferencia(categoria)
+            if clave and clave != 'Sin Derecho' and pd.notna(val) and val > 0:
+                resultados[clave] = resultados.get(clave, 0.0) + float(val)
+        return resultados
+
+    @instrumentar()
+    def extraer_voto_simpatia(self) -> dict:
+        """Voto+simpatía (intención más simpatía de quienes no declaran voto), % del total."""
+        return self._extraer_distribucion('voto_simpatia', 'VOTO+SIMPAT')
+
+    @instrumentar()
+    def extraer_simpatia(self) -> dict:
+        """Partido por el que se siente más simpatía, % del total."""
+        return self._extraer_distribucion('simpatia', 'SIENTE UD. MÁS SIMPAT')
+
+    def _extraer_distribucion(self, rol: str, referencia: str) -> dict:
+        """Distribución de una pregunta de voto: variable de los microdatos o, si no, columna TOTAL de los marginales."""
+        variable = self._microdato(rol)
+        if variable:
+            return self._distribucion(self.microdatos.tabla(variable)['TOTAL'])
+        hoja = self._hoja_marginales()
+        if not hoja: return {}
+        try:
+            cubo, pregunta = self._cruce(hoja, referencia)
+            if pregunta is None: return {}
+            return self._distribucion(cubo.crosstab(pregunta, hoja)['TOTAL'])
+        except: pass
+        return {}
+
+    @instrumentar()
     def _extraer_estimacion_cis_pdf(self) -> dict:
         """Intenta extraer la estimación oficial desde un PDF si existe."""
         # Intentar varias combinaciones de nombres de archivo
@@ -335,7 +580,7 @@ class EstudioCIS(ABC):
         
         pdf_path = None
         for v in pdf_variants:
-            if os.path.exists(v):
+            if self.lector.existe(v):
                 pdf_path = v
                 break
                 
@@ -343,11 +588,8 @@ class EstudioCIS(ABC):
             return {}
             
         try:
-            from pypdf import PdfReader
-            reader = PdfReader(pdf_path)
-            text = ""
-            for page in reader.pages:
-                text += page.extract_text() + "\n"
+            with tramo('extraer_texto_pdf', pdf=os.path.basename(pdf_path)):
+                text = self.lector.texto_pdf(pdf_path)
             
             # Limpiar texto
             full_text_upper = text.upper()
@@ -360,6 +602,7 @@ class EstudioCIS(ABC):
             
             search_text = text[start_idx:] if start_idx != -1 else text
             
+            contar('regex')
             matches = re.findall(r'([A-ZÁÉÍÓÚÑa-záéíóúñ\s\.\-\/]{2,35})\s+(\d+(?:,\d+)?)(?:\s+[\±\▒]\s*\d+(?:,\d+)?)?\s+(\d+(?:,\d+)?)?', search_text)
             
             pdf_data = {}
@@ -396,9 +639,10 @@ class EstudioCIS(ABC):
             # Silenciar errores de PDF corruptos o streams terminados si tenemos fallback
             return {}
 
+    @instrumentar()
     def _extraer_voto_directo_desde_resultados(self, hoja: str, normalizar: bool = False) -> dict:
         """Extrae Voto Directo buscando la tabla de intención de voto puramente."""
-        df = pd.read_excel(self.excel_file, sheet_name=hoja, header=None)
+        df = self._leer_hoja(hoja)
         resultados = {}
         
         # 1. Localizar bloque de intención de voto principal
@@ -406,6 +650,7 @@ class EstudioCIS(ABC):
         
         # Primero buscamos patrones muy específicos de intención de voto espontánea
         for i in range(len(df)):
+            contar('filas_recorridas')
             cell = str(df.iloc[i, 0]).upper()
             
             # Buscamos la pregunta clásica de intención de voto
@@ -431,6 +676,7 @@ class EstudioCIS(ABC):
         # Fallback si no se encontró la tabla pura (ej. estudios antiguos o raros)
         if start_row == -1:
             for i in range(len(df)):
+                contar('filas_recorridas')
                 cell = str(df.iloc[i, 0]).upper()
                 if 'VOTARÍA' in cell and 'PRÓXIMAS' in cell and not any(x in cell for x in ['SIMPATÍA', 'VOTO+']):
                     start_row = i
@@ -441,6 +687,7 @@ class EstudioCIS(ABC):
         # 2. Extraer hasta encontrar el final de la tabla (N)
         empty_streak = 0
         for i in range(start_row + 1, min(start_row + 60, len(df))):
+            contar('filas_recorridas')
             row = df.iloc[i]
             partido_raw = str(row.iloc[0]).strip()
             
@@ -475,6 +722,7 @@ class EstudioCIS(ABC):
         
         return resultados
     
+    @instrumentar()
     def extraer_estimacion_cis(self) -> dict:
         """Extrae la Estimación del CIS. 
         Intenta PDF primero, luego diferentes hojas de Excel."""
@@ -496,13 +744,15 @@ class EstudioCIS(ABC):
              
         return self._extraer_columna_estimacion(col_idx=3)
 
+    @instrumentar()
     def _extraer_columna_estimacion_desde_resultados(self, hoja: str, col_idx: int) -> dict:
         """Extrae estimación cuando está en una columna de la tabla de resultados."""
-        df = pd.read_excel(self.excel_file, sheet_name=hoja, header=None)
+        df = self._leer_hoja(hoja)
         
         # Buscar el bloque de RECODIFICADA o SIMPATÍA o VOTO+SIMPATÍA
         start_row = -1
         for i in range(len(df)):
+            contar('filas_recorridas')
             cell = str(df.iloc[i, 0]).upper()
             if 'ESTIMACIÓN' in cell or 'RECODIFICADA' in cell or 'SIMPATÍA' in cell or 'VOTO+SIMPATÍA' in cell:
                 # Verificar si tiene datos numéricos en las filas siguientes
@@ -516,6 +766,7 @@ class EstudioCIS(ABC):
         
         resultados = {}
         for i in range(start_row + 1, min(start_row + 50, len(df))):
+            contar('filas_recorridas')
             row = df.iloc[i]
             partido_raw = str(row.iloc[0]).strip()
             if '(N)' in partido_raw.upper() or not partido_raw: break
@@ -526,6 +777,7 @@ class EstudioCIS(ABC):
                 if valor: resultados[partido_key] = valor
         return resultados
     
+    @instrumentar()
     def _extraer_columna_estimacion(self, col_idx: int, normalizar: bool = True) -> dict:
         """Extrae datos de una columna específica de la hoja Estimación.
         
@@ -537,7 +789,7 @@ class EstudioCIS(ABC):
         if not hoja_estim:
             return {}
         
-        df = pd.read_excel(self.excel_file, sheet_name=hoja_estim, header=None)
+        df = self._leer_hoja(hoja_estim)
         resultados = {}
         
         # Categorías técnicas a ignorar (no son opciones de voto)
@@ -555,6 +807,7 @@ class EstudioCIS(ABC):
         
         # Buscar en más filas (hasta 65) para no perder el final de la tabla
         for i in range(min(65, len(df))):
+            contar('filas_recorridas')
             row = df.iloc[i]
             
             if len(row) <= col_idx or not pd.notna(row.iloc[0]):
@@ -615,6 +868,7 @@ class EstudioCIS(ABC):
 
 
     
+    @instrumentar()
     def _encontrar_hoja_estimacion(self) -> str:
         """Encuentra la hoja de Estimación usando lógica difusa para evitar fallos de codificación."""
         sheets = self.sheet_names
@@ -657,6 +911,7 @@ class EstudioCIS(ABC):
         y no es una categoría de exclusión, devuelve el nombre limpio.
         Esto permite capturar partidos regionales automáticamente.
         """
+        contar('normalizaciones_partido')
         if not nombre or not isinstance(nombre, str):
             return ""
         
@@ -706,6 +961,7 @@ class EstudioCIS(ABC):
         nombre_clean = nombre.replace('.', '')
         
         for variante, canonico in mapeo.items():
+            contar('regex')
             # Intentar match con nombre original o sin puntos
             if re.search(rf'\b{re.escape(variante)}\b', nombre) or \
                re.search(rf'\b{re.escape(variante)}\b', nombre_clean):
@@ -723,54 +979,38 @@ class EstudioCIS(ABC):
         # Devolver nombre capitalizado (título) como nueva clave
         return nombre.strip().title()
     
+    @instrumentar()
     def extraer_recuerdo_voto(self) -> dict:
-        """Extrae los datos de Recuerdo de Voto de la hoja RV correspondiente."""
-        hoja_rv = self.get_hoja_rv()
-        if hoja_rv not in self.sheet_names:
-            return {}
-        
-        df = pd.read_excel(self.excel_file, sheet_name=hoja_rv, header=None)
-        
-        # Buscar fila con nombres de partidos
-        party_row = -1
-        for i in range(min(50, len(df))):
-            row_str = ' '.join([str(x).upper() for x in df.iloc[i].values])
-            if 'PP' in row_str and 'PSOE' in row_str:
-                party_row = i
-                break
-        
-        if party_row < 0:
+        """Extrae los datos de Recuerdo de Voto de la hoja RV correspondiente (o de los microdatos)."""
+        # N de cada columna de recuerdo en el primer bloque de la hoja (cubo de cruces)
+        n_segmentos = self._n_cruce(self.get_hoja_rv(), 'recuerdo')
+        if n_segmentos.empty:
             return {}
-        
-        # Buscar fila (N) con totales
-        n_rows = df[df.iloc[:, 0].astype(str).str.contains(r"\(N\)", na=False, regex=True)].index
-        if len(n_rows) == 0:
-            return {}
-        
-        n_idx = n_rows[0]
-        
+        return self._recuerdo_desde_n(n_segmentos)
+
+    def _recuerdo_desde_n(self, n_segmentos: pd.Series) -> dict:
+        """% de recuerdo (partidos de referencia, blanco y nulo) a partir de la N de cada categoría de recuerdo."""
         # Mapear columnas a partidos y calcular porcentajes
         recuerdo = {}
         total = 0
         valores_raw = {}
         
-        for col_idx, val in enumerate(df.iloc[party_row].values):
-            p_raw = str(val).strip().upper()
-            p_key = self._normalizar_partido(str(val))
+        for segmento, v in n_segmentos.items():
+            contar('filas_recorridas')
+            p_raw = segmento.upper()
+            if p_raw == 'TOTAL' or pd.isna(v) or v <= 0:
+                continue
+            p_key = self._normalizar_partido(segmento)
             
             # Capturar partidos de referencia Y categorías de no-partido (Blanco/Nulo)
             if p_key and (p_key in self.get_partidos_referencia() or p_key in ['En Blanco', 'Voto Nulo']):
-                v = self._try_float(df.iloc[n_idx, col_idx])
-                if v and v > 0:
-                    valores_raw[p_key] = v
-                    total += v
+                valores_raw[p_key] = v
+                total += v
             # Fallback manual para Blanco/Nulo si el normalizador falló
             elif 'BLANCO' in p_raw:
-                v = self._try_float(df.iloc[n_idx, col_idx])
-                if v: valores_raw['En Blanco'] = valores_raw.get('En Blanco', 0) + v; total += v
+                valores_raw['En Blanco'] = valores_raw.get('En Blanco', 0) + v; total += v
             elif 'NULO' in p_raw:
-                v = self._try_float(df.iloc[n_idx, col_idx])
-                if v: valores_raw['Voto Nulo'] = valores_raw.get('Voto Nulo', 0) + v; total += v
+                valores_raw['Voto Nulo'] = valores_raw.get('Voto Nulo', 0) + v; total += v
         
         if total > 0:
             for p_key, v in valores_raw.items():
@@ -778,129 +1018,471 @@ class EstudioCIS(ABC):
         
         return recuerdo
     
-    def calcular_aldabon_gemini(self, custom_momentum: dict = None) -> dict:
+    def _categoria_transferencia(self, nombre) -> str:
+        """Clave de una fila o columna del cruce RV: partido normalizado o categoría de no-voto."""
+        t = str(nombre).upper().strip()
+        if 'NO TEN' in t:
+            return 'Sin Derecho'      # No tenía edad / derecho a voto
+        if 'NO VOT' in t or 'ABSTENCI' in t:
+            return 'Abstención'       # "No votó" (recuerdo) / "No votaría" (intención)
+        if 'NO SABE' in t or t.startswith('N.S'):
+            return 'No Sabe'
+        if t in ('N.C.', 'N.R.') or 'CONTESTA' in t or 'RECUERDA' in t:
+            return 'No Contesta'
+        return self._normalizar_partido(str(nombre))
+
+    @instrumentar()
+    def extraer_matriz_transferencia(self) -> dict:
         """
-        Calcula la estimación usando el método Aldabón-Gemini 3.0.
+        Matriz de transferencia recuerdo × intención de la hoja RV.
+        
+        Las hojas RV cruzan cada pregunta con el recuerdo de voto; el bloque de
+        intención es la primera pregunta "¿a qué partido votaría?" del cubo de
+        cruces (no la de segunda opción, "si no votase..."); con microdatos, el cruce
+        ponderado de sus variables de intención y recuerdo. Devuelve {'origen', 'destino', 'matriz', 'n'}:
+        matriz[d, o] es la fracción (0-1) de los votantes de o que hoy votarían d y
+        n[o] las entrevistas ponderadas de cada columna. Las etiquetas repetidas tras
+        normalizar se agregan (filas sumadas, columnas ponderadas por N).
+        """
+        if 'matriz_transferencia' in self._cache:
+            return self._cache['matriz_transferencia']
         
-        Fórmula: E_p = S_p × K_p × Φ_p × Λ_p
+        resultado = {}
+        tabla, n_segmentos = pd.DataFrame(), pd.Series(dtype=float)
+        hoja_rv = self.get_hoja_rv()
+        intencion, recuerdo = self._microdato('intencion'), self._microdato('recuerdo')
+        if intencion and recuerdo:
+            tabla = self.microdatos.tabla(intencion, recuerdo)
+            n_segmentos = self.microdatos.n(intencion, recuerdo)
+        elif hoja_rv in self.sheet_names:
+            tabla, n_segmentos = self._cruce_intencion(hoja_rv)
+        if not tabla.empty:
+            tabla = tabla.drop(columns='TOTAL', errors='ignore')
+            filas = [(i, self._categoria_transferencia(c)) for i, c in enumerate(tabla.index)]
+            columnas = [(j, self._categoria_transferencia(s)) for j, s in enumerate(tabla.columns)]
+            filas = [(i, k) for i, k in filas if k]
+            columnas = [(j, k) for j, k in columnas if k]
+            
+            if filas and columnas:
+                valores = tabla.to_numpy(dtype=float)[np.ix_([i for i, _ in filas], [j for j, _ in columnas])]
+                valores = np.nan_to_num(valores) / 100.0
+                n_col = np.nan_to_num(n_segmentos.reindex(tabla.columns).to_numpy(dtype=float))
+                n_col = n_col[[j for j, _ in columnas]]
+                
+                destino = list(dict.fromkeys(k for _, k in filas))
+                origen = list(dict.fromkeys(k for _, k in columnas))
+                # Agregar filas repetidas (suma) y columnas repetidas (media ponderada por N)
+                filas_idx = np.array([destino.index(k) for _, k in filas])
+                cols_idx = np.array([origen.index(k) for _, k in columnas])
+                por_destino = np.zeros((len(destino), valores.shape[1]))
+                np.add.at(por_destino, filas_idx, valores)
+                masa = np.zeros((len(destino), len(origen)))
+                np.add.at(masa.T, cols_idx, (por_destino * n_col).T)
+                n = np.zeros(len(origen))
+                np.add.at(n, cols_idx, n_col)
+                matriz = np.divide(masa, n, out=np.zeros_like(masa), where=n > 0)
+                resultado = {'origen': origen, 'destino': destino, 'matriz': matriz, 'n': n}
+        
+        self._cache['matriz_transferencia'] = resultado
+        return resultado
+
+    def _cruce_intencion(self, hoja: str):
+        """(tabla intención × segmentos, N por segmento) de una hoja de cruce; vacías si no tiene la pregunta."""
+        cubo = self.cruces(hoja, [])
+        # Bloque de intención: la pregunta de voto ("¿a qué partido votaría?")
+        pregunta = next((p for p, texto in cubo.enunciados(hoja).items()
+                         if 'VOTARÍA' in texto.upper() and 'PARTIDO' in texto.upper()
+                         and 'NO VOTASE' not in texto.upper()), None)
+        if not pregunta:
+            return pd.DataFrame(), pd.Series(dtype=float)
+        cubo, pregunta = self._cruce(hoja, pregunta)
+        return cubo.crosstab(pregunta, hoja), cubo.n(pregunta, hoja)
+
+    def coeficientes_transferencia(self) -> dict:
         """
-        voto_directo = self.extraer_voto_directo()
-        recuerdo = self.extraer_recuerdo_voto()
-        partidos_ref = self.get_partidos_referencia()
+        Φ y transvases del propio estudio a partir de la matriz de transferencia.
         
-        if not voto_directo or not recuerdo:
+        Sobre el voto declarado de cada recuerdo (partidos, blanco y nulo; sin
+        abstención ni indecisos): Φ_p es la cuota que repite y transvases[p] las
+        cuotas que van a otros destinos (desde CUOTA_MIN_TRANSVASE). Solo se
+        devuelven recuerdos con al menos N_MIN_TRANSFERENCIA entrevistas.
+        """
+        if 'coeficientes_transferencia' in self._cache:
+            return self._cache['coeficientes_transferencia']
+        
+        fidelidad, transvases = {}, {}
+        mt = self.extraer_matriz_transferencia()
+        if mt:
+            declarados = [i for i, d in enumerate(mt['destino']) if d not in NO_PARTIDOS]
+            for j, p in enumerate(mt['origen']):
+                if p in NO_PARTIDOS or p == 'OTROS' or p not in mt['destino'] or mt['n'][j] < N_MIN_TRANSFERENCIA:
+                    continue
+                columna = mt['matriz'][declarados, j]
+                total = columna.sum()
+                if total <= 0:
+                    continue
+                cuotas = columna / total
+                fidelidad[p] = round(float(cuotas[[mt['destino'][i] for i in declarados].index(p)]), 3)
+                destinos = {mt['destino'][i]: round(float(c), 3) for i, c in zip(declarados, cuotas)
+                            if mt['destino'][i] != p and c >= CUOTA_MIN_TRANSVASE}
+                if destinos:
+                    transvases[p] = destinos
+        
+        coeficientes = {'fidelidad': fidelidad, 'transvases': transvases} if fidelidad else {}
+        self._cache['coeficientes_transferencia'] = coeficientes
+        return coeficientes
+
+    def matriz_proximidad(self) -> dict:
+        """
+        Proximidad ideológica entre los electorados del estudio (se calcula una vez).
+        
+        Del cruce intención × escala de ideología (hoja 'Escala de ideología' o, con
+        microdatos, sus variables de intención e ideología) sale la posición media
+        1-10 de cada partido declarado (claves del normalizador, sin no-voto ni nulo)
+        y su tamaño (entrevistas ponderadas). matriz[o, d] es la cuota de la pérdida
+        de o que va a d: afinidad tamaño_d × exp(-|x_o - x_d| / ANCHO_PROXIMIDAD),
+        sin diagonal, normalizada por filas y sin destinos por debajo de
+        CUOTA_MIN_SECTOR. Devuelve {'partidos', 'posicion', 'n', 'matriz'} o {}.
+        """
+        if 'matriz_proximidad' in self._cache:
+            return self._cache['matriz_proximidad']
+        
+        resultado = {}
+        tabla, n_segmentos = pd.DataFrame(), pd.Series(dtype=float)
+        hoja = self._encontrar_hoja('IDEOLOGÍA')
+        intencion, ideologia = self._microdato('intencion'), self._microdato('ideologia')
+        if intencion and ideologia:
+            tabla = self.microdatos.tabla(intencion, ideologia)
+            n_segmentos = self.microdatos.n(intencion, ideologia)
+        elif hoja:
+            tabla, n_segmentos = self._cruce_intencion(hoja)
+        # Columnas de la escala: '1 Izquierda', '2', ..., '10 Derecha' (sin N.S./N.C.)
+        escala = [(c, int(m.group(1))) for c in tabla.columns
+                  if (m := re.match(r'\s*(\d+)(\D|$)', str(c))) and 1 <= int(m.group(1)) <= 10]
+        filas = [(i, self._categoria_transferencia(c)) for i, c in enumerate(tabla.index)]
+        filas = [(i, k) for i, k in filas if k and k not in NO_PARTIDOS and k != 'Voto Nulo']
+        if escala and filas:
+            columnas = [c for c, _ in escala]
+            valores = np.nan_to_num(tabla[columnas].to_numpy(dtype=float)[[i for i, _ in filas]]) / 100.0
+            n_col = np.nan_to_num(n_segmentos.reindex(columnas).to_numpy(dtype=float))
+            partidos = list(dict.fromkeys(k for _, k in filas))
+            masa = np.zeros((len(partidos), len(columnas)))
+            np.add.at(masa, np.array([partidos.index(k) for _, k in filas]), valores * n_col)
+            n = masa.sum(axis=1)
+            validos = n >= N_MIN_TRANSFERENCIA
+            if validos.sum() > 1:
+                partidos = [p for p, v in zip(partidos, validos) if v]
+                masa, n = masa[validos], n[validos]
+                posicion = masa @ np.array([x for _, x in escala], dtype=float) / n
+                
+                afinidad = n[None, :] * np.exp(-np.abs(posicion[:, None] - posicion[None, :]) / ANCHO_PROXIMIDAD)
+                np.fill_diagonal(afinidad, 0.0)
+                suma = afinidad.sum(axis=1, keepdims=True)
+                completa = np.divide(afinidad, suma, out=np.zeros_like(afinidad), where=suma > 0)
+                matriz = np.where(completa >= CUOTA_MIN_SECTOR, completa, 0.0)
+                # Filas sin ningún destino por encima del umbral: se conserva la fila sin recortar
+                matriz = np.where(matriz.sum(axis=1, keepdims=True) > 0, matriz, completa)
+                suma = matriz.sum(axis=1, keepdims=True)
+                matriz = np.divide(matriz, suma, out=np.zeros_like(matriz), where=suma > 0)
+                resultado = {'partidos': partidos, 'posicion': posicion, 'n': n, 'matriz': matriz}
+        
+        self._cache['matriz_proximidad'] = resultado
+        return resultado
+
+    def sector_ideologico(self) -> dict:
+        """Matriz de proximidad como {origen: {destino: cuota}} (cuotas a 3 decimales), para config."""
+        mp = self.matriz_proximidad()
+        if not mp:
             return {}
+        return {o: {d: round(float(c), 3) for d, c in zip(mp['partidos'], fila) if c > 0}
+                for o, fila in zip(mp['partidos'], mp['matriz'])}
+
+    def asignacion_indecisos(self) -> dict:
+        """
+        Reparto de los indecisos (No Sabe / No Contesta del voto directo) entre el voto
+        declarado (se calcula una vez por estudio).
+        
+        1. Simpatía: con microdatos, el cruce simpatía × intención de los indecisos; sin
+           ellos, lo que cada partido gana de voto directo a voto+simpatía, atribuido a
+           los indecisos en proporción a su peso entre quienes no declaran voto.
+        2. Segmentos: el resto, con la distribución del voto declarado en cada segmento
+           de los cruces de ideología y recuerdo (todos los segmentos de todos los
+           cruces en una sola pasada de arrays), media de las cuotas de cada cruce.
+        Devuelve {'cuotas': {clave: fracción}, 'simpatia', 'fuentes'} o {}. Sin
+        microdatos se guarda con la firma del libro en data/cache/indecisos/: las
+        siguientes instancias (cada recarga del panel) no vuelven a leer los cruces.
+        """
+        if 'asignacion_indecisos' in self._cache:
+            return self._cache['asignacion_indecisos']
+        
+        ruta = ruta_artefacto('indecisos', self.file_path, '.json') if self.microdatos is None else None
+        firma = list(self._firma)
+        if ruta:
+            try:
+                with open(ruta, encoding='utf-8') as f:
+                    guardado = json.load(f)
+                if guardado.get('version') == VERSION_INDECISOS and guardado.get('firma') == firma:
+                    self._cache['asignacion_indecisos'] = guardado['asignacion']
+                    return guardado['asignacion']
+            except Exception:
+                pass
         
-        # A. Normalización del Recuerdo y cálculo de Factor K
-        sum_rec = sum(recuerdo.values())
-        k_factors = {}
-        for p, voto_real in partidos_ref.items():
-            rec = recuerdo.get(p, 0)
-            if rec > 0 and sum_rec > 0:
-                rec_norm = (rec / sum_rec) * 100  # R_norm,p
-                k_raw = voto_real / rec_norm      # K_p crudo
-                k_factors[p] = k_raw
-            else:
-                k_factors[p] = 1.0
-        
-        # Obtener parámetros Φ (fidelidad), Λ (momentum) y transvases
-        config = self.get_context_biases()
-        fidelidad_map = config['fidelidad']    # Φ
-        
-        momentum_map = config['momentum'].copy()  # Λ base
-        if custom_momentum:
-            momentum_map.update(custom_momentum)
-        
-        transvases_map = config['transvases']
-        
-        # B. Aplicar fórmula: E_p = S_p × K_p × Φ_p × Λ_p
-        estimacion_raw = {}
-        masa_perdida = {}
-        
-        for p, vd in voto_directo.items():
-            if p in ['No Sabe', 'No Contesta', 'Abstención']:
+        resultado = self._calcular_asignacion_indecisos()
+        self._cache['asignacion_indecisos'] = resultado
+        if ruta:
+            try:
+                with open(ruta, 'w', encoding='utf-8') as f:
+                    json.dump({'version': VERSION_INDECISOS, 'firma': firma, 'asignacion': resultado}, f, ensure_ascii=False)
+            except (OSError, TypeError):
+                pass
+        return resultado
+
+    def _calcular_asignacion_indecisos(self) -> dict:
+        resultado = {}
+        voto_directo = self.extraer_voto_directo()
+        partidos = [p for p in voto_directo if p not in NO_PARTIDOS]
+        indecisos = sum(voto_directo.get(c, 0) for c in INDECISOS)
+        idx = {p: i for i, p in enumerate(partidos)}
+        fuentes = []
+        
+        # 1. Simpatía de los indecisos
+        cuota_simpatia, con_simpatia = np.zeros(len(partidos)), 0.0
+        intencion, simpatia = self._microdato('intencion'), self._microdato('simpatia')
+        if intencion and simpatia:
+            tabla = self.microdatos.tabla(simpatia, intencion).drop(columns='TOTAL', errors='ignore')
+            n_col = np.nan_to_num(self.microdatos.n(simpatia, intencion).reindex(tabla.columns).to_numpy(dtype=float))
+            de_indecisos = np.array([self._categoria_transferencia(c) in INDECISOS for c in tabla.columns])
+            masa = np.nan_to_num(tabla.to_numpy(dtype=float))[:, de_indecisos] @ n_col[de_indecisos] / 100.0
+            for categoria, m in zip(tabla.index, masa):
+                clave = self._categoria_transferencia(categoria)
+                if clave in idx:
+                    cuota_simpatia[idx[clave]] += m
+            if n_col[de_indecisos].sum() > 0:
+                con_simpatia = cuota_simpatia.sum() / n_col[de_indecisos].sum()
+        elif indecisos > 0:
+            voto_simpatia = self.extraer_voto_simpatia()
+            if voto_simpatia:
+                cuota_simpatia = np.array([max(0.0, voto_simpatia.get(p, 0) - voto_directo[p]) for p in partidos])
+                atribuible = indecisos / (indecisos + voto_directo.get('Abstención', 0))
+                con_simpatia = min(1.0, cuota_simpatia.sum() * atribuible / indecisos)
+        if cuota_simpatia.sum() > 0:
+            cuota_simpatia /= cuota_simpatia.sum()
+            fuentes.append('simpatía')
+        else:
+            con_simpatia = 0.0
+        
+        # 2. Segmentos de los cruces de ideología y recuerdo: filas [indecisos, partidos...]
+        bloques = []
+        for rol, hoja in (('ideologia', self._encontrar_hoja('IDEOLOGÍA')), ('recuerdo', self.get_hoja_rv())):
+            tabla, n_segmentos = pd.DataFrame(), pd.Series(dtype=float)
+            if intencion and self._microdato(rol):
+                tabla = self.microdatos.tabla(intencion, self._microdato(rol))
+                n_segmentos = self.microdatos.n(intencion, self._microdato(rol))
+            elif hoja and hoja in self.sheet_names:
+                tabla, n_segmentos = self._cruce_intencion(hoja)
+            if tabla.empty:
                 continue
-                
-            k = k_factors.get(p, 1.0)
-            if p in ['En Blanco', 'Voto Nulo'] and p not in k_factors:
-                rec_val = recuerdo.get(p, 0)
-                ref_val = partidos_ref.get(p, 0)
-                if rec_val > 0:
-                    k = 1.0 + ((ref_val / rec_val) - 1.0) * 0.75
-                else:
-                    k = 1.0
-
-            phi_base = fidelidad_map.get(p, 1.0)
-            phi = min(1.0, phi_base * k)
-            
-            base_val = vd * k * phi
-            estimacion_raw[p] = max(vd, base_val)
-            
-            if base_val < vd * k:
-                masa_perdida[p] = (vd * k) - base_val
-        
-        # C. Aplicar Transvases
-        for origen, masa in masa_perdida.items():
-            if masa > 0 and origen in transvases_map:
-                destinos = transvases_map[origen]
-                for destino, porcentaje in destinos.items():
-                    if destino in estimacion_raw or destino == 'En Blanco':
-                        refugio_val = masa * porcentaje
-                        estimacion_raw[destino] = estimacion_raw.get(destino, 0.0) + refugio_val
-        
-        # D. Aplicar Momentum (Λ) con MATRIZ DE TRANSFERENCIA
-        MATRIZ_SECTOR = {
-            'PSOE': {'SUMAR': 0.67, 'PODEMOS': 0.33},
-            'PP': {'VOX': 0.70, 'En Blanco': 0.30},
-            'VOX': {'PP': 0.85, 'En Blanco': 0.15},
-            'SALF': {'VOX': 0.60, 'En Blanco': 0.40},
-            'SUMAR': {'PSOE': 0.67, 'PODEMOS': 0.33},
-            'PODEMOS': {'SUMAR': 0.57, 'PSOE': 0.43},
-        }
-        
-        def calcular_porcentaje_abstencion(momentum: float) -> float:
-            if momentum >= 0.90: return 0.40
-            elif momentum >= 0.80: return 0.50
-            else: return 0.60
-        
-        deltas = {}
-        for p, base in estimacion_raw.items():
-            lam = momentum_map.get(p, 1.0)
-            delta = base * (lam - 1.0)
-            deltas[p] = (delta, lam)
-        
-        for p, (delta, lam) in deltas.items():
-            if delta < 0:
-                perdida = abs(delta)
-                estimacion_raw[p] -= perdida
-                pct_abstencion = calcular_porcentaje_abstencion(lam)
-                pct_sector = 1.0 - pct_abstencion
-                estimacion_raw['Abstención'] = estimacion_raw.get('Abstención', 0) + perdida * pct_abstencion
-                if p in MATRIZ_SECTOR:
-                    for destino, porcentaje in MATRIZ_SECTOR[p].items():
-                        if destino in estimacion_raw:
-                            estimacion_raw[destino] += perdida * pct_sector * porcentaje
-                        elif destino == 'En Blanco':
-                            estimacion_raw['En Blanco'] = estimacion_raw.get('En Blanco', 0) + perdida * pct_sector * porcentaje
-                else:
-                    estimacion_raw['Abstención'] = estimacion_raw.get('Abstención', 0) + perdida * pct_sector
-            elif delta > 0:
-                ganancia = delta
-                estimacion_raw[p] += ganancia
-                if 'Abstención' in estimacion_raw:
-                    estimacion_raw['Abstención'] = max(0, estimacion_raw['Abstención'] - ganancia)
-        
-        # E. Normalización final
-        estimacion = {}
-        total = sum(estimacion_raw.values())
+            tabla = tabla.drop(columns='TOTAL', errors='ignore')
+            filas = np.array([0 if k in INDECISOS else 1 + idx[k] if k in idx else -1
+                              for k in map(self._categoria_transferencia, tabla.index)])
+            n_col = np.nan_to_num(n_segmentos.reindex(tabla.columns).to_numpy(dtype=float))
+            masa = np.nan_to_num(tabla.to_numpy(dtype=float)) / 100.0 * n_col
+            bloque = np.zeros((1 + len(partidos), masa.shape[1]))
+            np.add.at(bloque, filas[filas >= 0], masa[filas >= 0])
+            bloques.append(bloque)
+            fuentes.append(f"microdatos ({rol})" if intencion and self._microdato(rol) else f"hoja {hoja}")
+        
+        cuota_segmentos = np.zeros(len(partidos))
+        if bloques:
+            masa = np.hstack(bloques)
+            cruce = np.repeat(np.arange(len(bloques)), [b.shape[1] for b in bloques])
+            declarado = masa[1:].sum(axis=0)
+            # Indecisos de cada segmento repartidos como el voto declarado del segmento
+            asignado = np.divide(masa[1:], declarado, out=np.zeros_like(masa[1:]), where=declarado > 0) * masa[0]
+            por_cruce = np.zeros((len(bloques), len(partidos)))
+            np.add.at(por_cruce, cruce, asignado.T)
+            total = por_cruce.sum(axis=1, keepdims=True)
+            por_cruce = np.divide(por_cruce, total, out=np.zeros_like(por_cruce), where=total > 0)
+            if (total > 0).any():
+                cuota_segmentos = por_cruce[total[:, 0] > 0].mean(axis=0)
+        
+        if cuota_segmentos.sum() <= 0:
+            con_simpatia = 1.0 if con_simpatia > 0 else 0.0
+        cuotas = con_simpatia * cuota_simpatia + (1.0 - con_simpatia) * cuota_segmentos
+        if partidos and cuotas.sum() > 0:
+            resultado = {'cuotas': {p: float(c) for p, c in zip(partidos, cuotas / cuotas.sum())},
+                         'simpatia': float(con_simpatia), 'fuentes': fuentes}
+        return resultado
+
+    def asignar_indecisos(self, voto_directo: dict) -> dict:
+        """Voto directo con No Sabe / No Contesta repartidos según asignacion_indecisos (igual si no hay reparto)."""
+        asignacion = self.asignacion_indecisos()
+        if not asignacion:
+            return voto_directo
+        indecisos = sum(voto_directo.get(c, 0) for c in INDECISOS)
+        return {p: v + indecisos * asignacion['cuotas'].get(p, 0.0)
+                for p, v in voto_directo.items() if p not in INDECISOS}
+
+    def problema_rastrillado(self) -> dict:
+        """
+        Problema de rastrillado del estudio (cis_raking): {'base', 'dimensiones',
+        'objetivos'} para ipf más la intención y el recuerdo de cada celda. Márgenes:
+        recuerdo (al resultado de referencia) y sexo, edad y tamaño de municipio (a los
+        del propio estudio). Con microdatos, una celda por entrevista; sin ellos, la
+        población sintética de los cruces de las hojas. {} sin cruce de recuerdo.
+        """
+        import cis_raking
+        if self.microdatos is not None:
+            intencion, recuerdo = self._microdato('intencion'), self._microdato('recuerdo')
+            if not (intencion and recuerdo):
+                return {}
+            md = self.microdatos
+            problema = {'base': md.peso.astype(float), 'intencion': md.codigos[intencion],
+                        'recuerdo': md.codigos[recuerdo], 'etiquetas_intencion': md.etiquetas[intencion],
+                        'etiquetas_recuerdo': md.etiquetas[recuerdo], 'dimensiones': [], 'objetivos': [],
+                        'margenes': ['Recuerdo']}
+            for nombre, rol in cis_raking.MARGENES:
+                variable = self._microdato(rol)
+                if variable:
+                    codigos = md.codigos[variable]
+                    problema['dimensiones'].append(codigos)
+                    problema['objetivos'].append(np.bincount(codigos[codigos >= 0], weights=md.peso[codigos >= 0],
+                                                             minlength=len(md.etiquetas[variable])))
+                    problema['margenes'].append(nombre)
+        else:
+            hoja_rv = self.get_hoja_rv()
+            tabla, n = self._cruce_intencion(hoja_rv) if hoja_rv in self.sheet_names else (pd.DataFrame(), None)
+            if tabla.empty:
+                return {}
+            tabla = tabla.drop(columns='TOTAL', errors='ignore')
+            n_rec = np.nan_to_num(n.reindex(tabla.columns).to_numpy(dtype=float))
+            masa = np.nan_to_num(tabla.to_numpy(dtype=float)) / 100.0 * n_rec
+            condicionales, objetivos, margenes = [], [], []
+            for nombre, _ in cis_raking.MARGENES:
+                hoja = self._encontrar_hoja(nombre)
+                cruce, n_seg = self._cruce_intencion(hoja) if hoja else (pd.DataFrame(), None)
+                if cruce.empty:
+                    continue
+                cruce = cruce.drop(columns='TOTAL', errors='ignore')
+                marginal = np.nan_to_num(n_seg.reindex(cruce.columns).to_numpy(dtype=float))
+                if marginal.sum() <= 0:
+                    continue
+                conjunta = np.nan_to_num(cruce.reindex(tabla.index).to_numpy(dtype=float)) / 100.0 * marginal
+                filas = conjunta.sum(axis=1, keepdims=True)
+                # P(segmento | intención); las intenciones sin fila en el cruce, el marginal
+                condicionales.append(np.where(filas > 0, conjunta / np.where(filas > 0, filas, 1.0),
+                                              marginal / marginal.sum()))
+                objetivos.append(marginal)
+                margenes.append(nombre)
+            base, codigos = cis_raking.celdas_agregadas(masa, condicionales)
+            problema = {'base': base, 'intencion': codigos[0], 'recuerdo': codigos[1],
+                        'etiquetas_intencion': list(tabla.index), 'etiquetas_recuerdo': list(tabla.columns),
+                        'dimensiones': codigos[2:], 'objetivos': objetivos, 'margenes': ['Recuerdo'] + margenes}
+
+        recuerdo = problema['recuerdo']
+        masa_recuerdo = np.bincount(recuerdo[recuerdo >= 0], weights=problema['base'][recuerdo >= 0],
+                                    minlength=len(problema['etiquetas_recuerdo']))
+        claves = [self._categoria_transferencia(e) for e in problema['etiquetas_recuerdo']]
+        problema['dimensiones'] = [recuerdo] + list(problema['dimensiones'])
+        problema['objetivos'] = [cis_raking.objetivo_recuerdo(masa_recuerdo, claves, self.get_partidos_referencia())] \
+            + list(problema['objetivos'])
+        return problema
+
+    def aplicar_rastrillado(self, problema: dict, pesos: np.ndarray, info: dict, opciones: dict = None) -> dict:
+        """
+        Voto directo y recuerdo con los pesos rastrillados: cada clave del voto directo
+        se escala por el cociente de su intención con y sin rastrillar; el recuerdo sale
+        de la masa rastrillada de cada categoría. Se guarda para extraer_insumos junto
+        con las `opciones` de ipf que dieron los pesos (rastrillar solo lo reutiliza
+        con las mismas).
+        """
+        import cis_raking
+        base = problema['base']
+        intencion, recuerdo = problema['intencion'], problema['recuerdo']
+        antes, despues = {}, {}
+        for pesos_i, acumulado in ((base, antes), (pesos, despues)):
+            masas = np.bincount(intencion[intencion >= 0], weights=pesos_i[intencion >= 0],
+                                minlength=len(problema['etiquetas_intencion']))
+            for etiqueta, m in zip(problema['etiquetas_intencion'], masas):
+                clave = self._categoria_transferencia(etiqueta)
+                if clave:
+                    acumulado[clave] = acumulado.get(clave, 0.0) + m / max(masas.sum(), 1e-12)
+        voto_directo = self.extraer_voto_directo()
+        rastrillado = {p: v * despues[p] / antes[p] if antes.get(p, 0) > 0 else v for p, v in voto_directo.items()}
+        total = sum(rastrillado.values())
         if total > 0:
-            estimacion = {p: round(v * 100 / total, 1) for p, v in estimacion_raw.items()}
-            suma_actual = sum(estimacion.values())
-            if abs(suma_actual - 100) > 0.01 and estimacion:
-                partido_mayor = max(estimacion, key=estimacion.get)
-                estimacion[partido_mayor] = round(estimacion[partido_mayor] + (100 - suma_actual), 1)
+            rastrillado = {p: v * sum(voto_directo.values()) / total for p, v in rastrillado.items()}
+
+        masa_recuerdo = np.bincount(recuerdo[recuerdo >= 0], weights=pesos[recuerdo >= 0],
+                                    minlength=len(problema['etiquetas_recuerdo']))
+        n_recuerdo = pd.Series(masa_recuerdo, index=problema['etiquetas_recuerdo'])
+        n_recuerdo = n_recuerdo.groupby(level=0, sort=False).sum()
+
+        # Efecto de diseño de Kish de los factores de rastrillado (1 = sin pérdida de precisión)
+        factor = np.divide(pesos, base, out=np.ones_like(pesos), where=base > 0)
+        efecto = float((base * factor ** 2).sum() * base.sum() / (base * factor).sum() ** 2) if base.sum() > 0 else 1.0
+
+        resultado = {'voto_directo': rastrillado, 'recuerdo': self._recuerdo_desde_n(n_recuerdo),
+                     'margenes': problema['margenes'], 'efecto_diseno': efecto, **info}
+        self._cache['rastrillado'] = (cis_raking.opciones_ipf(**(opciones or {})), resultado)
+        return resultado
+
+    @instrumentar()
+    def rastrillar(self, **opciones) -> dict:
+        """
+        Rastrilla el estudio (cis_raking.ipf; `opciones`: max_iteraciones, tolerancia,
+        recorte) y devuelve {'voto_directo', 'recuerdo', 'margenes', 'efecto_diseno',
+        'iteraciones', 'error', 'convergido'}; {} si no hay cruce de recuerdo. El
+        resultado se reutiliza mientras las opciones no cambien.
+        """
+        import cis_raking
+        opciones = cis_raking.opciones_ipf(**opciones)
+        guardado = self._cache.get('rastrillado')
+        if guardado and guardado[0] == opciones:
+            return guardado[1]
+        problema = self.problema_rastrillado()
+        if not problema:
+            self._cache['rastrillado'] = (opciones, {})
+            return {}
+        pesos, info = cis_raking.ipf(problema['base'], problema['dimensiones'], problema['objetivos'], **opciones)
+        return self.aplicar_rastrillado(problema, pesos, info, opciones)
+
+    @instrumentar()
+    def calcular_aldabon_gemini(self, custom_momentum: dict = None, rastrillado: bool = False,
+                                indecisos: bool = False) -> dict:
+        """
+        Calcula la estimación usando el método Aldabón-Gemini 3.0.
         
-        return estimacion
+        Fórmula: E_p = S_p × K_p × Φ_p × Λ_p
+        """
+        insumos = self.extraer_insumos(rastrillado, indecisos)
+        return estimar_aldabon_gemini(custom_momentum=custom_momentum, **insumos)
+
+    @instrumentar()
+    def extraer_insumos(self, rastrillado: bool = False, indecisos: bool = False) -> dict:
+        """Datos extraídos del Excel de los que depende la estimación (sin aritmética).
+        
+        El resultado es un diccionario serializable: permite recalcular escenarios
+        de momentum sin volver a leer el libro. Con `rastrillado`, voto directo y
+        recuerdo salen de los pesos rastrillados (rastrillar): el recuerdo queda en
+        la referencia y K ≈ 1 recoge solo lo que el rastrillado no pudo cuadrar.
+        Con `indecisos`, No Sabe / No Contesta del voto directo se reparten entre el
+        voto declarado (asignacion_indecisos) en lugar de descartarse.
+        """
+        insumos = {
+            'voto_directo': self.extraer_voto_directo(),
+            'recuerdo': self.extraer_recuerdo_voto(),
+            'partidos_ref': self.get_partidos_referencia(),
+            'config': self.get_context_biases()
+        }
+        if rastrillado:
+            resultado = self.rastrillar()
+            if resultado:
+                insumos['voto_directo'] = resultado['voto_directo']
+                insumos['recuerdo'] = resultado['recuerdo']
+        if indecisos:
+            insumos['voto_directo'] = self.asignar_indecisos(insumos['voto_directo'])
+        return insumos
     
 
 
@@ -945,8 +1527,8 @@ class AvanceAutonomicas(EstudioCIS):
         }
     }
     
-    def __init__(self, file_path: str, comunidad: str = 'ARAGON'):
-        super().__init__(file_path)
+    def __init__(self, file_path: str, comunidad: str = 'ARAGON', lector: LectorLibro = None):
+        super().__init__(file_path, lector)
         self.comunidad = comunidad.upper()
     
     def get_partidos_referencia(self) -> dict:
@@ -977,7 +1559,7 @@ class AvanceAutonomicas(EstudioCIS):
             mapeo_reg = {
                 'PODEMOS-AV': 'PODEMOS', 'PODEMOS ARAGÓN': 'PODEMOS',
                 'IU-MOVIMIENTO SUMAR': 'SUMAR', 'IU-ARAGÓN': 'SUMAR',
-                'CHUNTA': 'CHA', 'PAR': 'PAR', 'TERUEL EXISTE': 'TERUEL EXISTE'
+                'CHUNTA': 'CHA', 'PAR': 'PAR', 'TERUEL EXISTE': 'TERUEL EXISTE', 'EXISTE': 'TERUEL EXISTE'
             }
         elif self.comunidad == 'EXTREMADURA':
             mapeo_reg = {
@@ -991,10 +1573,11 @@ class AvanceAutonomicas(EstudioCIS):
                 'IU-MOVIMIENTO SUMAR-VQ': 'SUMAR', 'IU-MOVIMIENTO SUMAR': 'SUMAR',
                 'PODEMOS-AV': 'PODEMOS', 'PODEMOS-IU': 'PODEMOS',
                 'POR ÁVILA': 'Por Ávila', 'POR AVILA': 'Por Ávila',
-                'SORIA YA': 'Soria Ya', 'SORIA ¡YA!': 'Soria Ya',
+                'SORIA YA': 'Soria Ya', 'SORIA ¡YA!': 'Soria Ya', 'SYA': 'Soria Ya', 'XAV': 'Por Ávila',
             }
             
         for v, c in mapeo_reg.items():
+            contar('regex')
             if re.search(rf'\b{re.escape(v)}\b', nombre_up) or \
                re.search(rf'\b{re.escape(v)}\b', nombre_clean):
                 return c
@@ -1010,8 +1593,9 @@ class AvanceAutonomicas(EstudioCIS):
         # Obtener configuración base
         config = super().get_context_biases()
         
-        # Sobrescribir con parámetros específicos por comunidad
-        if self.comunidad == 'ARAGON':
+        # Sobrescribir con parámetros específicos por comunidad (solo si el libro
+        # no trae su propia matriz de transferencia en la hoja RV)
+        if self.comunidad == 'ARAGON' and not self.coeficientes_transferencia():
             # Datos de fidelidad basados en matriz de transferencia real
             # Fuente: CIS Preelectoral Aragón Febrero 2026
             config['fidelidad'] = {
@@ -1056,83 +1640,299 @@ class BarometroNacional(EstudioCIS):
         return 'RV EG23'
 
 
-# --- Factory para crear el tipo correcto de estudio ---
+@instrumentar()
+def calcular_factores_k(recuerdo: dict, partidos_ref: dict) -> dict:
+    """K_p = V_p / R_norm,p para cada partido de referencia (1.0 si no hay recuerdo)."""
+    sum_rec = sum(recuerdo.values())
+    k_factors = {}
+    for p, voto_real in partidos_ref.items():
+        rec = recuerdo.get(p, 0)
+        if rec > 0 and sum_rec > 0:
+            rec_norm = (rec / sum_rec) * 100  # R_norm,p
+            k_raw = voto_real / rec_norm      # K_p crudo
+            k_factors[p] = k_raw
+        else:
+            k_factors[p] = 1.0
+    return k_factors
+
+
+def porcentaje_abstencion(momentum: float) -> float:
+    """Fracción de la pérdida por momentum (Λ < 1) que se va a la abstención."""
+    for umbral, pct in UMBRALES_ABSTENCION:
+        if momentum >= umbral:
+            return pct
+    return UMBRALES_ABSTENCION[-1][1]
 
-def crear_estudio(file_path: str) -> EstudioCIS:
+
+def matriz_densa(mapa: dict, categorias: list):
+    """{origen: {destino: cuota}} como matriz densa origen × destino sobre categorias (+ máscara de presencia)."""
+    idx = {p: i for i, p in enumerate(categorias)}
+    matriz = np.zeros((len(categorias), len(categorias)))
+    presente = np.zeros(matriz.shape, dtype=bool)
+    for origen, destinos in mapa.items():
+        if origen not in idx:
+            continue
+        for destino, cuota in destinos.items():
+            if destino in idx:
+                matriz[idx[origen], idx[destino]] += cuota
+                presente[idx[origen], idx[destino]] = True
+    return matriz, presente
+
+
+@instrumentar()
+def _aplicar_momentum(estimacion_raw: dict, momentum_map: dict, matriz_sector: dict):
+    """Etapa D: aplica Λ sobre estimacion_raw (in situ), repartiendo las pérdidas
+    entre abstención y la matriz de sector (un único producto pérdidas × matriz)."""
+    deltas = {}
+    for p, base in estimacion_raw.items():
+        lam = momentum_map.get(p, 1.0)
+        delta = base * (lam - 1.0)
+        deltas[p] = (delta, lam)
+    
+    # Eje de la matriz: categorías de la estimación y 'En Blanco' (destino siempre válido)
+    categorias = list(estimacion_raw) + ([] if 'En Blanco' in estimacion_raw else ['En Blanco'])
+    perdidas_sector = np.zeros(len(categorias))
+    for i, (p, (delta, lam)) in enumerate(deltas.items()):
+        if delta < 0:
+            perdida = abs(delta)
+            estimacion_raw[p] -= perdida
+            pct_abstencion = porcentaje_abstencion(lam)
+            pct_sector = 1.0 - pct_abstencion
+            estimacion_raw['Abstención'] = estimacion_raw.get('Abstención', 0) + perdida * pct_abstencion
+            if p in matriz_sector:
+                perdidas_sector[i] = perdida * pct_sector
+            else:
+                estimacion_raw['Abstención'] = estimacion_raw.get('Abstención', 0) + perdida * pct_sector
+        elif delta > 0:
+            ganancia = delta
+            estimacion_raw[p] += ganancia
+            if 'Abstención' in estimacion_raw:
+                estimacion_raw['Abstención'] = max(0, estimacion_raw['Abstención'] - ganancia)
+    
+    if perdidas_sector.any():
+        sector, presente = matriz_densa(matriz_sector, categorias)
+        recibe = presente[perdidas_sector > 0].any(axis=0)
+        for destino, incremento, usado in zip(categorias, perdidas_sector @ sector, recibe):
+            if usado:
+                estimacion_raw[destino] = estimacion_raw.get(destino, 0) + float(incremento)
+
+
+@instrumentar()
+def estimar_aldabon_gemini(voto_directo: dict, recuerdo: dict, partidos_ref: dict,
+                           config: dict, custom_momentum: dict = None) -> dict:
     """
-    Factory que crea el tipo correcto de estudio basándose en el archivo.
+    Aritmética Aldabón-Gemini 3.0 sobre datos ya extraídos (ver EstudioCIS.extraer_insumos).
+    
+    Fórmula: E_p = S_p × K_p × Φ_p × Λ_p
     """
-    xl = pd.ExcelFile(file_path)
-    sheets = xl.sheet_names
+    if not voto_directo or not recuerdo:
+        return {}
+    
+    # A. Normalización del Recuerdo y cálculo de Factor K
+    k_factors = calcular_factores_k(recuerdo, partidos_ref)
     
+    # Parámetros Φ (fidelidad), Λ (momentum) y transvases
+    fidelidad_map = config['fidelidad']    # Φ
+    
+    momentum_map = config['momentum'].copy()  # Λ base
+    if custom_momentum:
+        momentum_map.update(custom_momentum)
+    
+    transvases_map = config['transvases']
+    
+    # B. Aplicar fórmula: E_p = S_p × K_p × Φ_p × Λ_p
+    estimacion_raw = {}
+    masa_perdida = {}
+    
+    for p, vd in voto_directo.items():
+        if p in ['No Sabe', 'No Contesta', 'Abstención']:
+            continue
+            
+        k = k_factors.get(p, 1.0)
+        if p in ['En Blanco', 'Voto Nulo'] and p not in k_factors:
+            rec_val = recuerdo.get(p, 0)
+            ref_val = partidos_ref.get(p, 0)
+            if rec_val > 0:
+                k = 1.0 + ((ref_val / rec_val) - 1.0) * 0.75
+            else:
+                k = 1.0
+
+        phi_base = fidelidad_map.get(p, 1.0)
+        phi = min(1.0, phi_base * k)
+        
+        base_val = vd * k * phi
+        estimacion_raw[p] = max(vd, base_val)
+        
+        if base_val < vd * k:
+            masa_perdida[p] = (vd * k) - base_val
+    
+    # C. Aplicar Transvases
+    for origen, masa in masa_perdida.items():
+        if masa > 0 and origen in transvases_map:
+            destinos = transvases_map[origen]
+            for destino, porcentaje in destinos.items():
+                if destino in estimacion_raw or destino == 'En Blanco':
+                    refugio_val = masa * porcentaje
+                    estimacion_raw[destino] = estimacion_raw.get(destino, 0.0) + refugio_val
+    
+    # D. Aplicar Momentum (Λ) con MATRIZ DE TRANSFERENCIA
+    _aplicar_momentum(estimacion_raw, momentum_map, config['matriz_sector'])
+    
+    # E. Normalización final
+    estimacion = {}
+    total = sum(estimacion_raw.values())
+    if total > 0:
+        estimacion = {p: round(v * 100 / total, 1) for p, v in estimacion_raw.items()}
+        suma_actual = sum(estimacion.values())
+        if abs(suma_actual - 100) > 0.01 and estimacion:
+            partido_mayor = max(estimacion, key=estimacion.get)
+            estimacion[partido_mayor] = round(estimacion[partido_mayor] + (100 - suma_actual), 1)
+    
+    return estimacion
+
+
+# --- Factory para crear el tipo correcto de estudio ---
+
+COMUNIDADES = ['EXTREMADURA', 'ARAGÓN', 'ARAGON', 'CASTILLA Y LEÓN', 'CASTILLA Y LEON',
+               'MADRID', 'VALENCIA', 'CATALUNYA', 'PAÍS VASCO', 'GALICIA',
+               'ANDALUCÍA', 'ANDALUCIA', 'CANARIAS', 'MURCIA', 'NAVARRA']
+
+
+def tipo_estudio(file_path: str, sheets: list, existe=os.path.exists) -> str:
+    """
+    Nombre de la clase de estudio según las hojas del libro y el PDF asociado
+    ('AvanceAutonomicas', 'BarometroNacional' o 'AvanceGenerales'). No lee ninguna hoja.
+    """
     # Detectar tipo por hojas disponibles
     tiene_rv_ea = any('RV EA' in s for s in sheets)
     tiene_rv_eg = any('RV EG' in s for s in sheets)
     tiene_estimacion = any('estimaci' in s.lower() for s in sheets)
     
     # Detección robusta de autonómicas (por nombre de hoja de resultados)
-    comunidades = ['EXTREMADURA', 'ARAGÓN', 'ARAGON', 'CASTILLA Y LEÓN', 'CASTILLA Y LEON',
-                   'MADRID', 'VALENCIA', 'CATALUNYA', 'PAÍS VASCO', 'GALICIA',
-                   'ANDALUCÍA', 'ANDALUCIA', 'CANARIAS', 'MURCIA', 'NAVARRA']
-    es_autonomico = tiene_rv_ea or any('RESULTADOS' in s.upper() and any(c in s.upper() for c in comunidades) for s in sheets)
+    es_autonomico = tiene_rv_ea or any('RESULTADOS' in s.upper() and any(c in s.upper() for c in COMUNIDADES) for s in sheets)
     
     # Buscar PDF asociado
     base_id = re.split(r'[_-]', os.path.basename(file_path))[0]
     dir_path = os.path.dirname(file_path)
     tiene_pdf = any(
-        os.path.exists(os.path.join(dir_path, f"{base_id}{suf}"))
+        existe(os.path.join(dir_path, f"{base_id}{suf}"))
         for suf in ['_Estimacion.pdf', '-Estimacion.pdf']
     )
     
-    # Determinar tipo
     if es_autonomico:
-        # Detectar comunidad autónoma analizando la Ficha técnica
-        comunidad = None
+        return 'AvanceAutonomicas'
+    elif tiene_pdf or (not tiene_estimacion and tiene_rv_eg):
+        return 'BarometroNacional'
+    return 'AvanceGenerales'
+
+
+# Filas de la ficha técnica que se leen para detectar la comunidad (el ámbito va al principio)
+FILAS_FICHA = 40
+
+# Mapeo normalizado de comunidades (fragmento en la ficha técnica -> comunidad)
+COMUNIDADES_FICHA = {
+    'CASTILLA Y LE': 'CASTILLA Y LEON',
+    'EXTREMADURA': 'EXTREMADURA',
+    'ARAG': 'ARAGON',
+    'ANDALUC': 'ANDALUCIA',
+    'MADRID': 'MADRID',
+    'VALENCI': 'VALENCIA',
+    'CATALUN': 'CATALUNYA',
+    'PAÍS VASCO': 'PAIS VASCO', 'PAIS VASCO': 'PAIS VASCO',
+    'GALICIA': 'GALICIA',
+    'CANARIAS': 'CANARIAS',
+    'MURCIA': 'MURCIA',
+    'NAVARRA': 'NAVARRA',
+}
+
+
+def detectar_comunidad(texto_ficha: str, sheets: list) -> str:
+    """Comunidad de un avance autonómico a partir del texto de la ficha técnica y los nombres de hoja."""
+    # Buscar en ficha técnica (fuente más fiable)
+    texto = texto_ficha.upper()
+    for keyword, com_name in COMUNIDADES_FICHA.items():
+        if keyword in texto:
+            return com_name
+    
+    # Fallback: buscar por nombre de hoja de resultados
+    for s in sheets:
+        s_up = s.upper()
+        if 'RESULTADOS' in s_up:
+            for c in COMUNIDADES:
+                if c in s_up:
+                    return c.replace('Ó', 'O').replace('Á', 'A').replace('É', 'E').replace('Í', 'I').replace('Ú', 'U')
+    return 'ARAGON'  # Default si no se detecta
+
+
+@instrumentar()
+def clasificar(file_path: str, existe=os.path.exists) -> dict:
+    """
+    Clase y comunidad de un estudio sin abrir el libro con pandas: los nombres de hoja
+    salen de workbook.xml y la comunidad de las primeras filas de la ficha técnica,
+    leídas en streaming del zip (milisegundos). {'clase': ..., 'comunidad': ... o None}.
+    """
+    import cis_xlsx
+    sheets = cis_xlsx.nombres_hojas(file_path)
+    tipo = tipo_estudio(file_path, sheets, existe)
+    comunidad = None
+    if tipo == 'AvanceAutonomicas':
+        texto = ''
         try:
-            # Buscar en ficha técnica (fuente más fiable)
             ficha_sheet = next((s for s in sheets if 'ficha' in s.lower()), None)
             if ficha_sheet:
-                ficha_df = pd.read_excel(file_path, sheet_name=ficha_sheet, header=None)
-                ficha_text = ficha_df.to_string().upper()
-                # Mapeo normalizado de comunidades
-                com_map = {
-                    'CASTILLA Y LE': 'CASTILLA Y LEON',
-                    'EXTREMADURA': 'EXTREMADURA',
-                    'ARAG': 'ARAGON',
-                    'ANDALUC': 'ANDALUCIA',
-                    'MADRID': 'MADRID',
-                    'VALENCI': 'VALENCIA',
-                    'CATALUN': 'CATALUNYA',
-                    'PAÍS VASCO': 'PAIS VASCO', 'PAIS VASCO': 'PAIS VASCO',
-                    'GALICIA': 'GALICIA',
-                    'CANARIAS': 'CANARIAS',
-                    'MURCIA': 'MURCIA',
-                    'NAVARRA': 'NAVARRA',
-                }
-                for keyword, com_name in com_map.items():
-                    if keyword in ficha_text:
-                        comunidad = com_name
-                        break
-            
-            # Fallback: buscar por nombre de hoja de resultados
-            if not comunidad:
-                for s in sheets:
-                    s_up = s.upper()
-                    if 'RESULTADOS' in s_up:
-                        for c in comunidades:
-                            if c in s_up:
-                                comunidad = c.replace('Ó', 'O').replace('Á', 'A').replace('É', 'E').replace('Í', 'I').replace('Ú', 'U')
-                                break
+                filas = cis_xlsx.primeras_filas(file_path, ficha_sheet, FILAS_FICHA)
+                texto = "\n".join(" ".join(str(v) for v in valores.values()) for _, valores in filas)
+        except Exception as e:
+            print(f"Error leyendo ficha técnica de {file_path}: {e}")
+        comunidad = detectar_comunidad(texto, sheets)
+    return {'clase': tipo, 'comunidad': comunidad}
+
+
+def _clasificar_con_lector(file_path: str, lector: LectorLibro) -> dict:
+    """Como clasificar, pero a través del lector (grabación y reproducción de fixtures)."""
+    sheets = lector.sheet_names
+    tipo = tipo_estudio(file_path, sheets, lector.existe)
+    comunidad = None
+    if tipo == 'AvanceAutonomicas':
+        texto = ''
+        try:
+            ficha_sheet = next((s for s in sheets if 'ficha' in s.lower()), None)
+            if ficha_sheet:
+                with tramo('leer_hoja', hoja=ficha_sheet):
+                    texto = lector.leer_hoja(ficha_sheet).head(FILAS_FICHA).to_string()
         except:
             pass
-        
-        if not comunidad:
-            comunidad = 'ARAGON'  # Default si no se detecta
-        return AvanceAutonomicas(file_path, comunidad)
-    elif tiene_pdf or (not tiene_estimacion and tiene_rv_eg):
-        return BarometroNacional(file_path)
+        comunidad = detectar_comunidad(texto, sheets)
+    return {'clase': tipo, 'comunidad': comunidad}
+
+
+@instrumentar()
+def crear_estudio(file_path: str, lector: LectorLibro = None, clasificacion: dict = None,
+                  microdatos: str = None) -> EstudioCIS:
+    """
+    Factory que crea el tipo correcto de estudio basándose en el archivo.
+    
+    El libro se abre una sola vez: el estudio reutiliza el mismo lector.
+    `clasificacion` ({'clase', 'comunidad'}, p. ej. del manifiesto de cis_catalogo)
+    evita volver a detectar el tipo; sin lector propio se detecta con clasificar().
+    `microdatos` (ruta .sav/.csv, ver cis_microdatos) hace que los insumos salgan de
+    los microdatos del estudio en lugar de las hojas del libro.
+    """
+    if clasificacion is None:
+        clasificacion = clasificar(file_path) if lector is None else _clasificar_con_lector(file_path, lector)
+    lector = lector or LectorLibro(file_path)
+    tipo = clasificacion['clase']
+    
+    if tipo == 'AvanceAutonomicas':
+        estudio = AvanceAutonomicas(file_path, clasificacion.get('comunidad') or 'ARAGON', lector)
+    elif tipo == 'BarometroNacional':
+        estudio = BarometroNacional(file_path, lector)
     else:
-        return AvanceGenerales(file_path)
+        estudio = AvanceGenerales(file_path, lector)
+    if microdatos:
+        import cis_microdatos
+        estudio.microdatos = cis_microdatos.cargar(microdatos)
+    return estudio
 
 
 if __name__ == "__main__":
@@ -0,0 +1,325 @@
+"""
+Fixtures compactas a nivel de celda para comprobar los extractores sin abrir los libros.
+
+`grabar` ejecuta los extractores de EstudioCIS sobre un libro real con un
+LectorGrabador: cada celda se entrega como un valor "marcado" (subclase de str,
+float o int) que anota su posición en cuanto un extractor lo usa (str(), float(),
+comparaciones, métodos...). La fixture guarda solo esas celdas, la columna 0 de
+cada hoja leída (las etiquetas se recorren con operaciones vectorizadas de pandas
+que no pasan por los valores), el texto de los PDF consultados y los resultados
+esperados. Antes de guardarla se reproduce con un LectorFixture y se exige el mismo
+resultado; si alguna hoja no reproduce, se guarda completa.
+
+`comprobar` reproduce todas las fixtures de data/fixtures y compara con lo esperado.
+No se abre ningún libro, pero los extractores se ejecutan completos: el corpus
+actual (8 estudios) tarda unos 2 s, casi todo en construir los cruces
+(cis_cruces) y en los cálculos de contexto, no en la lectura. El tiempo real se
+imprime al terminar.
+
+Uso:
+    python cis_fixtures.py grabar                      # todo data/cis_studies
+    python cis_fixtures.py grabar data/cis_studies/3543-multi_A.xlsx
+    python cis_fixtures.py comprobar                   # exit 1 si algún estudio cambia
+"""
+
+import argparse
+import glob
+import gzip
+import json
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from cis_cache import es_libro_valido, firma_archivo
+from cis_estudios import LectorLibro, crear_estudio, HOJAS
+
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+FIXTURES_DIR = os.path.join(ROOT_DIR, "data", "fixtures")
+PATRON_CORPUS = os.path.join(ROOT_DIR, "data", "cis_studies", "*.xlsx")
+
+VERSION_FIXTURE = 1
+
+# Operadores y conversiones que cuentan como uso de la celda
+_DUNDER_TEXTO = ('__str__', '__repr__', '__format__', '__eq__', '__ne__', '__lt__', '__le__', '__gt__',
+                 '__ge__', '__hash__', '__contains__', '__len__', '__iter__', '__getitem__', '__add__',
+                 '__mod__', '__mul__')
+_DUNDER_NUMERO = ('__str__', '__repr__', '__format__', '__eq__', '__ne__', '__lt__', '__le__', '__gt__',
+                  '__ge__', '__hash__', '__bool__', '__float__', '__int__', '__index__', '__round__',
+                  '__add__', '__radd__', '__sub__', '__rsub__', '__mul__', '__rmul__', '__truediv__',
+                  '__rtruediv__', '__floordiv__', '__mod__', '__neg__', '__abs__', '__pos__')
+
+
+def _clase_marcada(base, dunders):
+    """Subclase de `base` cuyas instancias anotan su `_pos` en `_registro` al usarse."""
+    def anotar(valor):
+        object.__getattribute__(valor, '_registro').add(object.__getattribute__(valor, '_pos'))
+
+    def envolver(nombre):
+        original = getattr(base, nombre)
+
+        def metodo(self, *args, **kwargs):
+            anotar(self)
+            return original(self, *args, **kwargs)
+        return metodo
+
+    def __getattribute__(self, nombre):
+        if not nombre.startswith('_'):
+            anotar(self)
+        return base.__getattribute__(self, nombre)
+
+    atributos = {n: envolver(n) for n in dunders if hasattr(base, n)}
+    atributos['__getattribute__'] = __getattribute__
+    return type(f"{base.__name__.capitalize()}Marcado", (base,), atributos)
+
+
+_TextoMarcado = _clase_marcada(str, _DUNDER_TEXTO)
+_RealMarcado = _clase_marcada(float, _DUNDER_NUMERO)
+_EnteroMarcado = _clase_marcada(int, _DUNDER_NUMERO)
+
+
+def _marcar(valor, pos, registro):
+    if isinstance(valor, str):
+        marcado = _TextoMarcado(valor)
+    elif isinstance(valor, (bool, np.bool_)):
+        return valor
+    elif isinstance(valor, (int, np.integer)):
+        marcado = _EnteroMarcado(int(valor))
+    elif isinstance(valor, (float, np.floating)):
+        if np.isnan(valor):
+            return valor
+        marcado = _RealMarcado(float(valor))
+    else:
+        return valor
+    marcado._pos = pos
+    marcado._registro = registro
+    return marcado
+
+
+def _valor_json(valor):
+    """Valor Python nativo de una celda (None si está vacía)."""
+    if isinstance(valor, (np.integer, int)) and not isinstance(valor, (bool, np.bool_)):
+        return int(valor)
+    if isinstance(valor, (np.floating, float)):
+        return None if np.isnan(valor) else float(valor)
+    if isinstance(valor, (bool, np.bool_)):
+        return bool(valor)
+    if isinstance(valor, str):
+        return str.__str__(valor)
+    return None if pd.isna(valor) else str(valor)
+
+
+class LectorGrabador(LectorLibro):
+    """Lector real que entrega hojas con celdas marcadas y anota todo lo consultado."""
+
+    def __init__(self, file_path: str):
+        super().__init__(file_path)
+        # Firma propia: las hojas marcadas no se mezclan en HOJAS con las del libro real
+        self.firma = ('grabacion', id(self))
+        self.originales = {}     # hoja -> DataFrame leído
+        self.celdas = set()      # (hoja, fila, columna) usadas por los extractores
+        self.existencias = {}    # nombre de archivo -> existe
+        self.pdfs = {}           # nombre de PDF -> texto
+
+    def leer_hoja(self, hoja: str) -> pd.DataFrame:
+        df = super().leer_hoja(hoja)
+        self.originales[hoja] = df
+        valores = df.to_numpy(dtype=object, copy=True)
+        for i in range(valores.shape[0]):
+            for j in range(valores.shape[1]):
+                valores[i, j] = _marcar(valores[i, j], (hoja, i, j), self.celdas)
+        marcado = pd.DataFrame(valores)
+        self.celdas.difference_update({c for c in self.celdas if c[0] == hoja})
+        return marcado
+
+    def existe(self, ruta: str) -> bool:
+        resultado = super().existe(ruta)
+        self.existencias[os.path.basename(ruta)] = resultado
+        return resultado
+
+    def texto_pdf(self, ruta: str) -> str:
+        texto = super().texto_pdf(ruta)
+        self.pdfs[os.path.basename(ruta)] = texto
+        return texto
+
+    def hojas_fixture(self, completas=()) -> dict:
+        """{hoja: {forma, reales, celdas}} con las celdas usadas y la columna 0 (o todo si `completas`)."""
+        hojas = {}
+        for hoja, df in self.originales.items():
+            usadas = {(i, j) for h, i, j in self.celdas if h == hoja}
+            usadas |= {(i, 0) for i in range(len(df))} if len(df.columns) else set()
+            if hoja in completas:
+                usadas = {(i, j) for i in range(df.shape[0]) for j in range(df.shape[1])}
+            celdas = []
+            for i, j in sorted(usadas):
+                v = _valor_json(df.iat[i, j])
+                if v is not None:
+                    celdas.append([i, j, v])
+            hojas[hoja] = {
+                'forma': list(df.shape),
+                'reales': [j for j in range(df.shape[1]) if df.dtypes.iloc[j].kind == 'f'],
+                'celdas': celdas
+            }
+        return hojas
+
+
+class LectorFixture:
+    """Reproduce los accesos de un estudio a partir de su fixture (sin abrir archivos)."""
+
+    def __init__(self, fixture: dict):
+        self.fixture = fixture
+        self.file_path = fixture['ruta']
+        self.firma = ('fixture', fixture['archivo'], tuple(fixture['firma']))
+        self.sheet_names = fixture['hojas_libro']
+
+    def leer_hoja(self, hoja: str) -> pd.DataFrame:
+        datos = self.fixture['hojas'].get(hoja)
+        if datos is None:
+            raise KeyError(f"La fixture de {self.fixture['archivo']} no contiene la hoja '{hoja}'")
+        valores = np.full(datos['forma'], np.nan, dtype=object)
+        for i, j, v in datos['celdas']:
+            valores[i, j] = v
+        df = pd.DataFrame(valores)
+        for j in datos['reales']:
+            df[j] = df[j].astype('float64')
+        return df
+
+    def existe(self, ruta: str) -> bool:
+        return self.fixture['existe'].get(os.path.basename(ruta), False)
+
+    def texto_pdf(self, ruta: str) -> str:
+        return self.fixture['pdf'][os.path.basename(ruta)]
+
+
+def resultados_estudio(estudio) -> dict:
+    """Salida de los extractores y de la estimación, normalizada a JSON."""
+    resultados = {
+        'clase': type(estudio).__name__,
+        'comunidad': getattr(estudio, 'comunidad', None),
+        'ficha': estudio.extraer_ficha_tecnica(),
+        'voto_directo': estudio.extraer_voto_directo(),
+        'estimacion_cis': estudio.extraer_estimacion_cis(),
+        'recuerdo': estudio.extraer_recuerdo_voto(),
+        'contexto': estudio._infer_context(),
+        'aldabon': estudio.calcular_aldabon_gemini()
+    }
+    return json.loads(json.dumps(resultados, ensure_ascii=False, default=_valor_json))
+
+
+def _descartar_cache(firma):
+    for clave in list(HOJAS):
+        if clave[1] == firma:
+            HOJAS.pop(clave)
+
+
+def reproducir(fixture: dict) -> dict:
+    """Resultados de los extractores ejecutados sobre la fixture."""
+    return resultados_estudio(crear_estudio(fixture['ruta'], LectorFixture(fixture)))
+
+
+def diferencias(esperado: dict, obtenido: dict, prefijo: str = '') -> list:
+    """Rutas 'campo.subcampo' en las que difieren dos resultados."""
+    if isinstance(esperado, dict) and isinstance(obtenido, dict):
+        cambios = []
+        for k in sorted(set(esperado) | set(obtenido), key=str):
+            cambios += diferencias(esperado.get(k), obtenido.get(k), f"{prefijo}{k}.")
+        return cambios
+    return [] if esperado == obtenido else [prefijo.rstrip('.')]
+
+
+def grabar(path: str) -> dict:
+    """Graba la fixture de un libro y comprueba que reproduce los mismos resultados."""
+    esperado = resultados_estudio(crear_estudio(path))
+
+    lector = LectorGrabador(path)
+    grabado = resultados_estudio(crear_estudio(path, lector))
+    _descartar_cache(lector.firma)
+    if grabado != esperado:
+        raise RuntimeError(f"La grabación altera los resultados en {diferencias(esperado, grabado)}")
+
+    fixture = {
+        'version': VERSION_FIXTURE,
+        'archivo': os.path.basename(path),
+        'ruta': os.path.relpath(os.path.abspath(path), ROOT_DIR),
+        'firma': list(firma_archivo(path)),
+        'hojas_libro': lector.sheet_names,
+        'existe': lector.existencias,
+        'pdf': lector.pdfs,
+        'hojas': lector.hojas_fixture(),
+        'esperado': esperado
+    }
+    # Si alguna hoja no reproduce, se guarda completa (en orden de lectura) hasta que reproduzca
+    completas = []
+    for hoja in [None] + list(lector.originales):
+        if hoja is not None:
+            completas.append(hoja)
+            fixture['hojas'] = lector.hojas_fixture(completas)
+        obtenido = reproducir(fixture)
+        _descartar_cache(LectorFixture(fixture).firma)
+        if obtenido == esperado:
+            fixture['hojas_completas'] = completas
+            return fixture
+    raise RuntimeError(f"La fixture de {path} no reproduce: {diferencias(esperado, obtenido)}")
+
+
+def ruta_fixture(path: str) -> str:
+    return os.path.join(FIXTURES_DIR, os.path.basename(path) + '.json.gz')
+
+
+def guardar(fixture: dict, ruta: str):
+    os.makedirs(os.path.dirname(ruta), exist_ok=True)
+    with gzip.open(ruta, 'wt', encoding='utf-8', compresslevel=9) as f:
+        json.dump(fixture, f, ensure_ascii=False, separators=(',', ':'))
+
+
+def cargar(ruta: str) -> dict:
+    with gzip.open(ruta, 'rt', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def comprobar(rutas: list) -> int:
+    """Reproduce cada fixture y compara con sus resultados esperados. Devuelve los fallos."""
+    fallos = 0
+    t0 = time.perf_counter()
+    for ruta in rutas:
+        fixture = cargar(ruta)
+        try:
+            cambios = diferencias(fixture['esperado'], reproducir(fixture))
+        except Exception as e:
+            cambios = [f"error: {e}"]
+        estado = "OK" if not cambios else "CAMBIA " + ", ".join(cambios[:8]) + (" ..." if len(cambios) > 8 else "")
+        print(f"  {fixture['archivo']:<22} {estado}")
+        fallos += bool(cambios)
+    print(f"{len(rutas)} fixtures comprobadas en {time.perf_counter() - t0:.2f} s, {fallos} con cambios")
+    return fallos
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fixtures de celdas para comprobar los extractores")
+    parser.add_argument('accion', choices=['grabar', 'comprobar'])
+    parser.add_argument('archivos', nargs='*', help="Libros (grabar) o fixtures (comprobar); por defecto, todos")
+    args = parser.parse_args()
+
+    if args.accion == 'grabar':
+        archivos = args.archivos or sorted(p for p in glob.glob(PATRON_CORPUS) if es_libro_valido(p))
+        for path in archivos:
+            try:
+                fixture = grabar(path)
+            except Exception as e:
+                print(f"  {os.path.basename(path):<22} ERROR: {e}")
+                continue
+            ruta = ruta_fixture(path)
+            guardar(fixture, ruta)
+            n = sum(len(h['celdas']) for h in fixture['hojas'].values())
+            completas = f", hojas completas: {fixture['hojas_completas']}" if fixture['hojas_completas'] else ""
+            print(f"  {fixture['archivo']:<22} {n:>6} celdas de {len(fixture['hojas'])} hojas, "
+                  f"{os.path.getsize(ruta) / 1024:.1f} KB{completas}")
+    else:
+        rutas = args.archivos or sorted(glob.glob(os.path.join(FIXTURES_DIR, '*.json.gz')))
+        sys.exit(1 if comprobar(rutas) else 0)
+
+
+if __name__ == "__main__":
+    main()
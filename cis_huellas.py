@@ -0,0 +1,258 @@
+"""
+Huellas estructurales de los Excel del CIS para detectar cambios de maquetación.
+
+En una sola pasada en streaming sobre el zip (cis_xlsx) se calcula por hoja:
+nombres, bloques "Pregunta X" (fila de inicio, alto, ancho, hash de las etiquetas de
+la columna A) y forma de la tabla. La huella se guarda en data/cache/huellas/ y se
+compara con la del estudio anterior del mismo tipo para saber qué bloques se movieron
+antes de ingerir un estudio nuevo.
+
+Uso:
+    python cis_huellas.py                          # todo el corpus, cada uno contra su anterior
+    python cis_huellas.py data/cis_studies/3545-multi_A.xlsx --hojas "RV EG23" "Escala de ideología"
+"""
+
+import argparse
+import glob
+import hashlib
+import json
+import os
+import re
+import sys
+import zipfile
+
+import cis_xlsx
+from cis_cache import firma_archivo, ruta_artefacto, es_libro_valido
+from cis_estudios import fuzzy_normalize, tipo_estudio
+
+PATRON_CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "cis_studies", "*.xlsx")
+
+# Versión del formato de huella (cambiarla invalida las huellas guardadas)
+VERSION_HUELLA = 1
+
+# Hojas que alimentan el modelo (recuerdo de voto y estimación), ver es_compatible
+HOJAS_CRITICAS = ('RV EA', 'RV EG', 'ESTIMACI')
+
+# Cabecera de bloque en las hojas de preguntas
+_PREGUNTA = re.compile(r'^\s*Pregunta\s+\S+', re.IGNORECASE)
+
+
+def _hash(etiquetas: list) -> str:
+    return hashlib.sha1('\x1f'.join(etiquetas).encode('utf-8')).hexdigest()[:12]
+
+
+def _cerrar_bloque(bloque: dict, fin: int) -> dict:
+    etiquetas = bloque.pop('_etiquetas')
+    bloque['filas'] = fin - bloque['fila']
+    bloque['etiquetas'] = _hash(etiquetas)
+    return bloque
+
+
+def huella_hoja(zf, ruta_xml: str, cadenas: list) -> dict:
+    """Huella de una hoja: forma, hash de etiquetas y bloques 'Pregunta X'."""
+    bloques = []
+    vistos = {}
+    # Las filas anteriores a la primera pregunta (o la hoja entera si no hay preguntas)
+    actual = {'id': '(inicio)', 'fila': 0, 'columnas': 0, 'texto': '', '_etiquetas': []}
+    todas = []
+    n_filas = ancho_max = 0
+    for fila, valores, ancho in cis_xlsx.filas(zf, ruta_xml, cadenas, columnas={0}):
+        n_filas = fila + 1
+        ancho_max = max(ancho_max, ancho)
+        etiqueta = valores.get(0)
+        if isinstance(etiqueta, str) and _PREGUNTA.match(etiqueta):
+            bloques.append(_cerrar_bloque(actual, fila))
+            id_bloque = etiqueta.strip()
+            # Ids repetidos en la misma hoja (p. ej. dos tablas de la misma pregunta)
+            vistos[id_bloque] = vistos.get(id_bloque, 0) + 1
+            if vistos[id_bloque] > 1:
+                id_bloque = f"{id_bloque} #{vistos[id_bloque]}"
+            actual = {'id': id_bloque, 'fila': fila, 'columnas': 0, 'texto': '', '_etiquetas': []}
+            continue
+        actual['columnas'] = max(actual['columnas'], ancho)
+        if etiqueta is not None:
+            norm = fuzzy_normalize(str(etiqueta))
+            actual['_etiquetas'].append(norm)
+            todas.append(norm)
+            if not actual['texto'] and isinstance(etiqueta, str) and actual['id'] != '(inicio)':
+                actual['texto'] = etiqueta.strip()[:80]
+    bloques.append(_cerrar_bloque(actual, n_filas))
+    # El bloque inicial vacío de las hojas que empiezan directamente con una pregunta sobra
+    bloques = [b for b in bloques if not (b['id'] == '(inicio)' and b['filas'] == 0)]
+    return {'filas': n_filas, 'columnas': ancho_max, 'etiquetas': _hash(todas), 'bloques': bloques}
+
+
+def calcular_huella(path: str) -> dict:
+    """Huella estructural completa del libro en una pasada en streaming."""
+    with zipfile.ZipFile(path) as zf:
+        cadenas = cis_xlsx.cadenas_compartidas(zf)
+        hojas = {nombre: huella_hoja(zf, ruta, cadenas) for nombre, ruta in cis_xlsx.hojas(zf)}
+    resumen = json.dumps([[n, h['etiquetas'], [(b['id'], b['fila'], b['filas'], b['columnas'])
+                                               for b in h['bloques']]] for n, h in hojas.items()])
+    return {
+        'version': VERSION_HUELLA,
+        'archivo': os.path.basename(path),
+        'estudio': re.split(r'[_-]', os.path.basename(path))[0],
+        'tipo': tipo_estudio(path, list(hojas)),
+        'firma': list(firma_archivo(path)),
+        'huella': hashlib.sha1(resumen.encode('utf-8')).hexdigest()[:16],
+        'hojas': hojas,
+    }
+
+
+def cargar_huella(path: str, recalcular: bool = False) -> dict:
+    """Huella desde data/cache/huellas (se recalcula si el Excel cambió)."""
+    ruta = ruta_artefacto('huellas', path, '.json')
+    if not recalcular and os.path.exists(ruta):
+        try:
+            with open(ruta, encoding='utf-8') as f:
+                huella = json.load(f)
+            if huella.get('version') == VERSION_HUELLA and huella.get('firma') == list(firma_archivo(path)):
+                return huella
+        except Exception:
+            pass
+    huella = calcular_huella(path)
+    with open(ruta, 'w', encoding='utf-8') as f:
+        json.dump(huella, f, ensure_ascii=False, indent=1)
+    return huella
+
+
+def comparar(anterior: dict, nueva: dict, hojas: list = None) -> dict:
+    """Diferencias estructurales entre dos huellas (opcionalmente solo en `hojas`).
+
+    Los bloques se emparejan por id ('Pregunta 16R'); un bloque 'movido' cambió de fila,
+    'redimensionado' cambió de alto o ancho y 'reetiquetado' cambió sus etiquetas.
+    """
+    h_ant, h_nue = anterior['hojas'], nueva['hojas']
+    if hojas:
+        h_ant = {n: h for n, h in h_ant.items() if n in hojas}
+        h_nue = {n: h for n, h in h_nue.items() if n in hojas}
+    diff = {
+        'anterior': anterior['archivo'], 'nueva': nueva['archivo'],
+        'hojas_nuevas': [n for n in h_nue if n not in h_ant],
+        'hojas_eliminadas': [n for n in h_ant if n not in h_nue],
+        'hojas_comunes': [n for n in h_nue if n in h_ant],
+        'primer_bloque': {},
+        'bloques': []
+    }
+    for nombre in diff['hojas_comunes']:
+        ant = {b['id']: b for b in h_ant[nombre]['bloques']}
+        nue = {b['id']: b for b in h_nue[nombre]['bloques']}
+        primeros = [next((b['id'] for b in h[nombre]['bloques'] if b['id'] != '(inicio)'), None)
+                    for h in (h_ant, h_nue)]
+        if primeros[0] != primeros[1]:
+            diff['primer_bloque'][nombre] = primeros
+        for id_bloque, b in nue.items():
+            a = ant.get(id_bloque)
+            if a is None:
+                diff['bloques'].append({'hoja': nombre, 'bloque': id_bloque, 'cambio': 'nuevo', 'fila': b['fila']})
+                continue
+            cambios = []
+            if a['fila'] != b['fila']:
+                cambios.append('movido')
+            if (a['filas'], a['columnas']) != (b['filas'], b['columnas']):
+                cambios.append('redimensionado')
+            if a['etiquetas'] != b['etiquetas']:
+                cambios.append('reetiquetado')
+            if cambios:
+                diff['bloques'].append({
+                    'hoja': nombre, 'bloque': id_bloque, 'cambio': '+'.join(cambios),
+                    'fila': [a['fila'], b['fila']], 'forma': [[a['filas'], a['columnas']], [b['filas'], b['columnas']]]
+                })
+        for id_bloque, a in ant.items():
+            if id_bloque not in nue:
+                diff['bloques'].append({'hoja': nombre, 'bloque': id_bloque, 'cambio': 'eliminado', 'fila': a['fila']})
+    return diff
+
+
+def es_compatible(diff: dict, criticas: tuple = HOJAS_CRITICAS) -> bool:
+    """Puerta de ingesta para los extractores de cis_estudios.
+
+    Bloquea si desaparece alguna hoja crítica (buscada por palabra clave, como hace
+    _encontrar_hoja, así que 'Estimación' -> 'Estimación de Voto' pasa) o si cambia el
+    primer bloque de una hoja crítica (de él salen la fila de partidos y la primera fila
+    (N) del recuerdo). Movimientos, etiquetas nuevas y cambios en el resto del
+    cuestionario solo se informan.
+    """
+    for c in criticas:
+        antes = any(c in h.upper() for h in diff['hojas_eliminadas'])
+        despues = any(c in h.upper() for h in diff['hojas_nuevas'] + diff['hojas_comunes'])
+        if antes and not despues:
+            return False
+    return not any(any(c in h.upper() for c in criticas) for h in diff['primer_bloque'])
+
+
+def huella_anterior(huella: dict, patron: str = PATRON_CORPUS) -> dict:
+    """Huella del estudio anterior (id menor más próximo) del mismo tipo, o None."""
+    candidatas = []
+    for path in glob.glob(patron):
+        if not es_libro_valido(path) or os.path.basename(path) == huella['archivo']:
+            continue
+        h = cargar_huella(path)
+        if h['tipo'] == huella['tipo'] and h['estudio'] < huella['estudio']:
+            candidatas.append(h)
+    return max(candidatas, key=lambda h: h['estudio']) if candidatas else None
+
+
+def informe(diff: dict) -> str:
+    """Texto legible de un diff de huellas."""
+    lineas = [f"{diff['anterior']} -> {diff['nueva']}"]
+    for n in diff['hojas_nuevas']:
+        lineas.append(f"  + hoja nueva: {n}")
+    for n in diff['hojas_eliminadas']:
+        lineas.append(f"  - hoja eliminada: {n}")
+    for n, (a, b) in diff['primer_bloque'].items():
+        lineas.append(f"  [{n}] primer bloque: {a} -> {b}")
+    # Las hojas de cruces repiten la misma columna A: sus cambios se listan una sola vez
+    por_hoja = {}
+    for b in diff['bloques']:
+        por_hoja.setdefault(b['hoja'], []).append(b)
+    vistas = {}
+    for hoja, bloques in por_hoja.items():
+        # La cabecera '(inicio)' es propia de cada hoja de cruces: siempre se muestra
+        cabecera = [b for b in bloques if b['bloque'] == '(inicio)']
+        resto = [b for b in bloques if b['bloque'] != '(inicio)']
+        clave = json.dumps([(b['bloque'], b['cambio'], b['fila']) for b in resto])
+        if resto and clave in vistas:
+            lineas.append(f"  [{hoja}] mismos cambios que [{vistas[clave]}]")
+            resto = []
+        elif resto:
+            vistas[clave] = hoja
+        for b in cabecera + resto:
+            if b['cambio'] in ('nuevo', 'eliminado'):
+                lineas.append(f"  [{hoja}] {b['bloque']}: {b['cambio']} (fila {b['fila']})")
+            else:
+                (f0, f1), (s0, s1) = b['fila'], b['forma']
+                lineas.append(f"  [{hoja}] {b['bloque']}: {b['cambio']} fila {f0}->{f1} ({f1 - f0:+d}), "
+                              f"forma {s0[0]}x{s0[1]}->{s1[0]}x{s1[1]}")
+    if len(lineas) == 1:
+        lineas.append("  sin cambios estructurales")
+    return "\n".join(lineas)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Huellas estructurales de los Excel del CIS")
+    parser.add_argument('archivos', nargs='*', help="Libros a comprobar (por defecto, todo el corpus)")
+    parser.add_argument('--hojas', nargs='+', help="Comparar solo estas hojas")
+    parser.add_argument('--recalcular', action='store_true', help="Ignorar la caché en disco")
+    args = parser.parse_args()
+
+    archivos = args.archivos or sorted(p for p in glob.glob(PATRON_CORPUS) if es_libro_valido(p))
+    incompatibles = 0
+    for path in archivos:
+        huella = cargar_huella(path, args.recalcular)
+        anterior = huella_anterior(huella)
+        print(f"\n{huella['archivo']} [{huella['tipo']}] huella {huella['huella']}")
+        if anterior is None:
+            print("  (sin estudio anterior del mismo tipo)")
+            continue
+        diff = comparar(anterior, huella, args.hojas)
+        print(informe(diff))
+        if not es_compatible(diff):
+            incompatibles += 1
+            print("  ** INCOMPATIBLE: revisar extractores antes de ingerir")
+    sys.exit(1 if incompatibles else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,212 @@
+"""
+Índice numérico del corpus de Excel del CIS para búsquedas forenses.
+
+Extrae una sola vez por libro todas las celdas numéricas (valor, archivo, hoja, fila,
+columna, etiqueta de fila) a arrays NumPy ordenados por valor, persistidos en
+data/cache/indice_numerico/. Las consultas por rango y por proximidad de filas usan
+búsqueda binaria (np.searchsorted) y tardan milisegundos sobre todo el corpus.
+
+Uso:
+    python cis_indice_numerico.py 13.5 27.5 --tol 0.1 --cerca 15
+"""
+
+import argparse
+import glob
+import os
+
+import numpy as np
+import pandas as pd
+
+from cis_cache import firma_archivo, ruta_artefacto, es_libro_valido
+
+PATRON_CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "cis_studies", "*.xlsx")
+
+# Las filas de una hoja se codifican como grupo * _FILAS_MAX + fila para las búsquedas de proximidad
+_FILAS_MAX = 1 << 32
+
+
+def _celdas_numericas(df: pd.DataFrame):
+    """(filas, columnas, valores) de las celdas convertibles a número, como float(str(v).replace(',', '.'))."""
+    filas, cols, valores = [], [], []
+    for j in range(df.shape[1]):
+        col = df.iloc[:, j]
+        if pd.api.types.is_bool_dtype(col):
+            continue
+        if pd.api.types.is_numeric_dtype(col):
+            num = col.astype(float)
+        else:
+            texto = col.map(lambda v: v if isinstance(v, (int, float)) and not isinstance(v, bool)
+                            else str(v).replace(',', '.').strip())
+            num = pd.to_numeric(texto, errors='coerce')
+        mask = num.notna().to_numpy()
+        if mask.any():
+            idx = np.nonzero(mask)[0]
+            filas.append(idx)
+            cols.append(np.full(len(idx), j))
+            valores.append(num.to_numpy(dtype=float)[idx])
+    if not filas:
+        return np.array([], dtype=int), np.array([], dtype=int), np.array([], dtype=float)
+    return np.concatenate(filas), np.concatenate(cols), np.concatenate(valores)
+
+
+def indexar_libro(path: str) -> dict:
+    """Extrae todas las celdas numéricas de un libro (todas las hojas, sin cabecera)."""
+    hojas = pd.read_excel(path, sheet_name=None, header=None)
+    partes = {'valor': [], 'hoja': [], 'fila': [], 'col': [], 'etiqueta': []}
+    nombres_hoja = list(hojas.keys())
+    for h, (nombre, df) in enumerate(hojas.items()):
+        filas, cols, valores = _celdas_numericas(df)
+        etiquetas = df.iloc[:, 0].map(lambda v: '' if pd.isna(v) else str(v)).to_numpy() if df.shape[1] else np.array([])
+        partes['valor'].append(valores)
+        partes['hoja'].append(np.full(len(valores), h))
+        partes['fila'].append(filas)
+        partes['col'].append(cols)
+        partes['etiqueta'].append(etiquetas[filas] if len(filas) else np.array([], dtype=str))
+    datos = {k: np.concatenate(v) if v else np.array([]) for k, v in partes.items()}
+    codigos, etiquetas = pd.factorize(pd.Series(datos['etiqueta'], dtype=object))
+    return {
+        'valor': datos['valor'].astype(float),
+        'hoja': datos['hoja'].astype(np.int32),
+        'fila': datos['fila'].astype(np.int32),
+        'col': datos['col'].astype(np.int32),
+        'etiqueta': codigos.astype(np.int32),
+        'etiquetas': np.array(list(etiquetas), dtype=str),
+        'hojas': np.array(nombres_hoja, dtype=str),
+    }
+
+
+def cargar_libro(path: str, reconstruir: bool = False) -> dict:
+    """Índice de un libro desde la caché en disco (se regenera si el Excel cambió)."""
+    ruta = ruta_artefacto('indice_numerico', path, '.npz')
+    firma = np.array(firma_archivo(path), dtype=np.int64)
+    if not reconstruir and os.path.exists(ruta):
+        try:
+            with np.load(ruta) as npz:
+                if np.array_equal(npz['firma'], firma):
+                    return {k: npz[k] for k in npz.files if k != 'firma'}
+        except Exception:
+            pass  # caché corrupta o de otra versión: regenerar
+    datos = indexar_libro(path)
+    np.savez(ruta, firma=firma, **datos)
+    return datos
+
+
+class IndiceNumerico:
+    """Índice de todas las celdas numéricas de un conjunto de libros, ordenado por valor."""
+
+    def __init__(self, libros: dict):
+        """libros: {ruta: datos de cargar_libro()}."""
+        self.archivos = [os.path.basename(p) for p in libros]
+        self.hojas = []       # por grupo (archivo, hoja)
+        self.grupo_archivo = []
+        etiquetas, bloques = [], []
+        offset_grupo = offset_etiqueta = 0
+        for a, datos in enumerate(libros.values()):
+            n_hojas = len(datos['hojas'])
+            self.hojas.extend(datos['hojas'].tolist())
+            self.grupo_archivo.extend([a] * n_hojas)
+            etiquetas.extend(datos['etiquetas'].tolist())
+            bloques.append((datos['valor'], datos['hoja'] + offset_grupo, datos['fila'],
+                            datos['col'], datos['etiqueta'] + offset_etiqueta))
+            offset_grupo += n_hojas
+            offset_etiqueta += len(datos['etiquetas'])
+        self.etiquetas = etiquetas
+
+        if bloques:
+            valor, grupo, fila, col, etiqueta = (np.concatenate(x) for x in zip(*bloques))
+        else:
+            valor = np.array([], dtype=float)
+            grupo = fila = col = etiqueta = np.array([], dtype=np.int32)
+        orden = np.argsort(valor, kind='stable')
+        self.valor, self.grupo, self.fila = valor[orden], grupo[orden], fila[orden]
+        self.col, self.etiqueta = col[orden], etiqueta[orden]
+
+    def __len__(self):
+        return len(self.valor)
+
+    def rango(self, minimo: float, maximo: float) -> np.ndarray:
+        """Posiciones (sobre los arrays ordenados) de las celdas con minimo <= valor <= maximo."""
+        ini = np.searchsorted(self.valor, minimo, side='left')
+        fin = np.searchsorted(self.valor, maximo, side='right')
+        return np.arange(ini, fin)
+
+    def buscar(self, valor: float, tolerancia: float = 0.05) -> list:
+        """Celdas con |v - valor| < tolerancia (mismo criterio que exhaustive_search.py)."""
+        pos = self.rango(valor - tolerancia, valor + tolerancia)
+        pos = pos[np.abs(self.valor[pos] - valor) < tolerancia]
+        return [self.celda(p) for p in pos]
+
+    def proximidad(self, rango1: tuple, rango2: tuple, k: int = 15) -> list:
+        """Pares de celdas (v1 en rango1, v2 en rango2) en la misma hoja a menos de k filas.
+
+        Las filas de v2 se ordenan por (hoja, fila) y para cada v1 se localiza la ventana
+        (fila - k, fila + k) con dos búsquedas binarias.
+        """
+        p1, p2 = self.rango(*rango1), self.rango(*rango2)
+        clave2 = self.grupo[p2].astype(np.int64) * _FILAS_MAX + self.fila[p2]
+        orden = np.argsort(clave2, kind='stable')
+        clave2, p2 = clave2[orden], p2[orden]
+        clave1 = self.grupo[p1].astype(np.int64) * _FILAS_MAX + self.fila[p1]
+        ini = np.searchsorted(clave2, clave1 - (k - 1), side='left')
+        fin = np.searchsorted(clave2, clave1 + (k - 1), side='right')
+        pares = []
+        for a, i, f in zip(p1, ini, fin):
+            for b in p2[i:f]:
+                pares.append((self.celda(a), self.celda(b)))
+        return pares
+
+    def celda(self, pos: int) -> dict:
+        """Descripción legible de la celda en la posición `pos` del índice."""
+        g = int(self.grupo[pos])
+        return {
+            'valor': float(self.valor[pos]),
+            'archivo': self.archivos[self.grupo_archivo[g]],
+            'hoja': self.hojas[g],
+            'fila': int(self.fila[pos]),
+            'col': int(self.col[pos]),
+            'etiqueta': self.etiquetas[int(self.etiqueta[pos])],
+        }
+
+
+def cargar_indice(patron: str = PATRON_CORPUS, reconstruir: bool = False) -> IndiceNumerico:
+    """Índice de todos los libros que casan con `patron` (usa la caché por libro)."""
+    libros = {}
+    for path in sorted(glob.glob(patron)):
+        if not es_libro_valido(path):
+            continue
+        try:
+            libros[path] = cargar_libro(path, reconstruir)
+        except Exception as e:
+            print(f"Error indexando {path}: {e}")
+    return IndiceNumerico(libros)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Búsqueda de cifras en el corpus de Excel del CIS")
+    parser.add_argument('valores', type=float, nargs='+', help="Cifras a buscar (p. ej. 13.5 27.5)")
+    parser.add_argument('--tol', type=float, default=0.05, help="Tolerancia absoluta")
+    parser.add_argument('--cerca', type=int, default=None,
+                        help="Con dos valores: mostrar solo pares a menos de N filas en la misma hoja")
+    parser.add_argument('--patron', default=PATRON_CORPUS, help="Glob de los libros a indexar")
+    parser.add_argument('--reconstruir', action='store_true', help="Ignorar la caché en disco")
+    args = parser.parse_args()
+
+    indice = cargar_indice(args.patron, args.reconstruir)
+    print(f"Índice: {len(indice)} celdas numéricas en {len(indice.archivos)} libros")
+
+    if args.cerca is not None and len(args.valores) == 2:
+        v1, v2 = args.valores
+        pares = indice.proximidad((v1 - args.tol, v1 + args.tol), (v2 - args.tol, v2 + args.tol), args.cerca)
+        for c1, c2 in pares:
+            print(f"PROXIMITY MATCH in {c1['archivo']} - Sheet: {c1['hoja']}")
+            print(f"  V1 {c1['valor']} at row {c1['fila']}: {c1['etiqueta']}")
+            print(f"  V2 {c2['valor']} at row {c2['fila']}: {c2['etiqueta']}")
+        return
+
+    for v in args.valores:
+        for c in indice.buscar(v, args.tol):
+            print(f"Match: {c['valor']} at {c['archivo']} / {c['hoja']} [R{c['fila']}, C{c['col']}]. Row label: {c['etiqueta']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+"""
+Índice de texto completo del corpus de Excel del CIS (etiquetas y enunciados).
+
+Cada celda de texto se tokeniza y normaliza con las reglas de fuzzy_normalize
+(sin acentos ni mayúsculas/minúsculas) en un índice invertido por libro, guardado en
+data/cache/indice_texto/ junto con una instantánea de las filas para mostrar contexto.
+Los libros solo se releen si cambian (mtime/tamaño), y las búsquedas nunca abren un Excel.
+
+Uso:
+    python cis_indice_texto.py "Si mañana se celebrasen" --contexto 3
+    python cis_indice_texto.py "+ simpatía" --archivo 3536 --hoja Resultados
+"""
+
+import argparse
+import glob
+import gzip
+import json
+import os
+import re
+
+import pandas as pd
+
+from cis_cache import firma_archivo, ruta_artefacto, es_libro_valido
+from cis_estudios import fuzzy_normalize
+
+PATRON_CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "cis_studies", "*.xlsx")
+
+# Versión del formato de los shards en disco
+VERSION_SHARD = 1
+
+# Columnas y caracteres por celda guardados en la instantánea de filas (contexto)
+COLUMNAS_CONTEXTO = 8
+CARACTERES_CONTEXTO = 120
+
+# Separadores de palabra (conservando los caracteres que fuzzy_normalize traduce a letras)
+_SEPARADORES = re.compile(r"[^\w±¾═]+")
+
+
+def tokenizar(texto: str) -> list:
+    """Palabras normalizadas (fuzzy_normalize) de un texto, en orden."""
+    return [t for t in (fuzzy_normalize(p) for p in _SEPARADORES.split(str(texto))) if t]
+
+
+def _celda_a_texto(v) -> str:
+    if isinstance(v, float) and v.is_integer():
+        v = int(v)
+    return str(v)[:CARACTERES_CONTEXTO]
+
+
+def indexar_libro(path: str) -> dict:
+    """Índice invertido y filas de un libro: {'hojas', 'celdas', 'indice', 'filas'}."""
+    hojas = pd.read_excel(path, sheet_name=None, header=None)
+    celdas = []   # [hoja, fila, col, texto]
+    indice = {}   # palabra -> [id de celda]
+    filas = []    # por hoja: {fila: [valores de las primeras columnas]}
+    for h, df in enumerate(hojas.values()):
+        instantanea = {}
+        valores = df.to_numpy(dtype=object)
+        for i in range(valores.shape[0]):
+            fila = valores[i]
+            if any(isinstance(v, str) or not pd.isna(v) for v in fila[:COLUMNAS_CONTEXTO]):
+                instantanea[i] = ['' if (not isinstance(v, str) and pd.isna(v)) else _celda_a_texto(v)
+                                  for v in fila[:COLUMNAS_CONTEXTO]]
+            for j, v in enumerate(fila):
+                if not isinstance(v, str) or not v.strip():
+                    continue
+                tokens = tokenizar(v)
+                if not tokens:
+                    continue
+                id_celda = len(celdas)
+                celdas.append([h, i, j, v])
+                for t in set(tokens):
+                    indice.setdefault(t, []).append(id_celda)
+        filas.append(instantanea)
+    return {'hojas': list(hojas.keys()), 'celdas': celdas, 'indice': indice, 'filas': filas}
+
+
+def cargar_libro(path: str, reconstruir: bool = False) -> dict:
+    """Shard del libro desde data/cache (se regenera solo si el Excel cambió)."""
+    ruta = ruta_artefacto('indice_texto', path, '.json.gz')
+    firma = list(firma_archivo(path))
+    if not reconstruir and os.path.exists(ruta):
+        try:
+            with gzip.open(ruta, 'rt', encoding='utf-8') as f:
+                shard = json.load(f)
+            if shard.get('firma') == firma and shard.get('version') == VERSION_SHARD:
+                shard['filas'] = [{int(k): v for k, v in h.items()} for h in shard['filas']]
+                return shard
+        except Exception:
+            pass  # caché corrupta: regenerar
+    shard = indexar_libro(path)
+    shard.update(firma=firma, version=VERSION_SHARD)
+    with gzip.open(ruta, 'wt', encoding='utf-8') as f:
+        json.dump(shard, f, ensure_ascii=False, separators=(',', ':'))
+    return shard
+
+
+class IndiceTexto:
+    """Índice invertido de todas las celdas de texto de un conjunto de libros."""
+
+    def __init__(self, libros: dict):
+        """libros: {ruta: shard de cargar_libro()}."""
+        self.libros = {os.path.basename(p): shard for p, shard in libros.items()}
+        self._vocabulario = {a: sorted(s['indice']) for a, s in self.libros.items()}
+
+    def __len__(self):
+        return sum(len(s['celdas']) for s in self.libros.values())
+
+    def _candidatas(self, archivo: str, palabra: str) -> list:
+        """Ids de celdas con alguna palabra que contiene `palabra` (la más selectiva de la consulta)."""
+        shard = self.libros[archivo]
+        ids = set()
+        for termino in self._vocabulario[archivo]:
+            if palabra in termino:
+                ids.update(shard['indice'][termino])
+        return sorted(ids)
+
+    def buscar(self, consulta: str, contexto: int = 2, archivo: str = None, hoja: str = None,
+               limite: int = None) -> list:
+        """Celdas cuyo texto normalizado contiene la consulta normalizada.
+
+        Mismo criterio que EstudioCIS._encontrar_hoja: fuzzy_normalize(consulta) in
+        fuzzy_normalize(texto), con la palabra más larga de la consulta contenida en
+        alguna palabra de la celda. `archivo` y `hoja` filtran por subcadena del nombre.
+        Cada resultado incluye `contexto` filas antes y después de la instantánea.
+        """
+        objetivo = fuzzy_normalize(consulta)
+        if not objetivo:
+            return []
+        # Candidatas por la palabra más larga; el resto de la frase se verifica sobre el texto
+        palabras = tokenizar(consulta)
+        clave = max(palabras, key=len) if palabras else objetivo
+        resultados = []
+        for nombre, shard in self.libros.items():
+            if archivo and archivo not in nombre:
+                continue
+            for id_celda in self._candidatas(nombre, clave):
+                h, fila, col, texto = shard['celdas'][id_celda]
+                nombre_hoja = shard['hojas'][h]
+                if hoja and fuzzy_normalize(hoja) not in fuzzy_normalize(nombre_hoja):
+                    continue
+                if objetivo not in fuzzy_normalize(texto):
+                    continue
+                resultados.append({
+                    'archivo': nombre, 'hoja': nombre_hoja, 'fila': fila, 'col': col, 'texto': texto,
+                    'contexto': self.contexto(nombre, h, fila, contexto)
+                })
+                if limite and len(resultados) >= limite:
+                    return resultados
+        return resultados
+
+    def contexto(self, archivo: str, hoja: int, fila: int, n: int = 2) -> list:
+        """[(fila, valores)] de las filas con contenido entre fila - n y fila + n."""
+        filas = self.libros[archivo]['filas'][hoja]
+        return [(i, filas[i]) for i in range(max(0, fila - n), fila + n + 1) if i in filas]
+
+    def filas(self, archivo: str, hoja: str, desde: int, hasta: int) -> list:
+        """Instantánea de un bloque de filas [desde, hasta) de una hoja, sin abrir el Excel."""
+        shard = self.libros[archivo]
+        filas = shard['filas'][shard['hojas'].index(hoja)]
+        return [(i, filas[i]) for i in range(desde, hasta) if i in filas]
+
+
+def cargar_indice(patron: str = PATRON_CORPUS, reconstruir: bool = False) -> IndiceTexto:
+    """Índice de todos los libros que casan con `patron`; solo reindexa los que cambiaron."""
+    libros = {}
+    for path in sorted(glob.glob(patron)):
+        if not es_libro_valido(path):
+            continue
+        try:
+            libros[path] = cargar_libro(path, reconstruir)
+        except Exception as e:
+            print(f"Error indexando {path}: {e}")
+    return IndiceTexto(libros)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Búsqueda de texto en el corpus de Excel del CIS")
+    parser.add_argument('consulta', help="Frase a buscar (sin distinguir acentos ni mayúsculas)")
+    parser.add_argument('--contexto', type=int, default=2, help="Filas de contexto antes y después")
+    parser.add_argument('--archivo', help="Filtrar por nombre de archivo (subcadena)")
+    parser.add_argument('--hoja', help="Filtrar por nombre de hoja")
+    parser.add_argument('--limite', type=int, default=50, help="Máximo de resultados")
+    parser.add_argument('--patron', default=PATRON_CORPUS, help="Glob de los libros a indexar")
+    parser.add_argument('--reconstruir', action='store_true', help="Ignorar la caché en disco")
+    args = parser.parse_args()
+
+    indice = cargar_indice(args.patron, args.reconstruir)
+    hits = indice.buscar(args.consulta, args.contexto, args.archivo, args.hoja, args.limite)
+    for hit in hits:
+        print(f"\n{hit['archivo']} / {hit['hoja']} [R{hit['fila']}, C{hit['col']}]: {hit['texto'][:100]}")
+        for i, valores in hit['contexto']:
+            marca = '>' if i == hit['fila'] else ' '
+            print(f"  {marca} R{i}: " + " | ".join(v for v in valores if v))
+    print(f"\n{len(hits)} resultados")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+"""
+Ingesta incremental de estudios nuevos del CIS vigilando data/cis_studies.
+
+Cada pasada (sondeo periódico de la carpeta, sin dependencias de inotify):
+  1. Detecta libros (XXXX-multi_A.xlsx, XXXX_multi.xlsx...) y PDFs de estimación nuevos
+     o cambiados: primero por firma (mtime + tamaño) y, si difiere, por hash del
+     contenido, así que una re-descarga idéntica no se reprocesa. Los ficheros de
+     bloqueo de Excel (~$...) se ignoran y un archivo solo se ingiere cuando su firma
+     no cambia entre dos sondeos (no se lee a medio copiar).
+  2. Procesa cada archivo una sola vez en un pool de procesos en segundo plano:
+     huella estructural contra el estudio anterior (cis_huellas.es_compatible),
+     índices de texto y numérico y cubo de cruces (cis_cruces) en data/cache y
+     texto del PDF (sidecar de cis_estudios.texto_pdf).
+  3. Actualiza el catálogo (cis_catalogo): web_app y streamlit_app lo releen en cada
+     petición, así que el estudio queda disponible sin reiniciar nada.
+
+El estado (hash y resultado por archivo) se guarda en data/cache/ingesta.json.
+
+Uso:
+    python cis_ingesta.py                    # vigilar la carpeta (Ctrl+C para salir)
+    python cis_ingesta.py --una-vez          # una pasada y esperar a que termine
+    python cis_ingesta.py --intervalo 60 --procesos 2
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import cis_catalogo
+from cis_cache import CACHE_DIR
+
+RUTA_ESTADO = os.path.join(CACHE_DIR, "ingesta.json")
+
+# Versión del formato de estado (cambiarla fuerza reprocesar todo)
+VERSION_INGESTA = 1
+
+# Segundos entre sondeos de la carpeta
+INTERVALO = 30
+
+
+def procesar(path: str) -> dict:
+    """Genera los artefactos de un archivo nuevo (se ejecuta en un proceso del pool)."""
+    import cis_cruces
+    import cis_huellas
+    import cis_indice_numerico
+    import cis_indice_texto
+    from cis_estudios import texto_pdf
+
+    resultado = {}
+    with contextlib.redirect_stdout(io.StringIO()):
+        if path.endswith('.pdf'):
+            resultado['caracteres_pdf'] = len(texto_pdf(path))
+            return resultado
+        huella = cis_huellas.cargar_huella(path, recalcular=True)
+        anterior = cis_huellas.huella_anterior(huella)
+        resultado['huella'] = huella['huella']
+        if anterior is not None:
+            resultado['anterior'] = anterior['archivo']
+            resultado['compatible'] = cis_huellas.es_compatible(cis_huellas.comparar(anterior, huella))
+        cis_indice_texto.cargar_libro(path)
+        cis_indice_numerico.cargar_libro(path)
+        resultado['filas_cruces'] = len(cis_cruces.cargar_libro(path))
+    return resultado
+
+
+def _cargar_estado() -> dict:
+    try:
+        with open(RUTA_ESTADO, encoding='utf-8') as f:
+            estado = json.load(f)
+        if estado.get('version') == VERSION_INGESTA:
+            return estado
+    except Exception:
+        pass
+    return {'version': VERSION_INGESTA, 'archivos': {}}
+
+
+def _guardar_estado(estado: dict):
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    temporal = RUTA_ESTADO + '.tmp'
+    with open(temporal, 'w', encoding='utf-8') as f:
+        json.dump(estado, f, ensure_ascii=False, indent=1, sort_keys=True)
+    os.replace(temporal, RUTA_ESTADO)
+
+
+class Ingesta:
+    """Vigilancia de una carpeta de estudios: detección por hash y procesado en segundo plano."""
+
+    def __init__(self, data_dir: str = cis_catalogo.DATA_DIR, procesos: int = None, esperar_estable: bool = True):
+        self.data_dir = os.path.abspath(data_dir)
+        self.pool = ProcessPoolExecutor(max_workers=procesos or min(4, os.cpu_count() or 2))
+        self.esperar_estable = esperar_estable
+        self.estado = _cargar_estado()
+        self.pendientes = {}    # nombre -> (firma, sha256, Future)
+        self._vistos = {}       # nombre -> firma en el sondeo anterior
+
+    def _candidatos(self, carpeta: dict) -> list:
+        """[(nombre, firma, sha256)] de los archivos nuevos o con contenido distinto."""
+        candidatos = []
+        for nombre, firma in sorted(carpeta.items()):
+            previa, self._vistos[nombre] = self._vistos.get(nombre), firma
+            if nombre.endswith('.xlsx') and cis_catalogo.variante(nombre) is None:
+                continue
+            if self.esperar_estable and previa != firma:
+                continue  # recién llegado o aún copiándose: se mira en el próximo sondeo
+            registro = self.estado['archivos'].get(nombre)
+            if registro and registro['firma'] == firma:
+                continue
+            pendiente = self.pendientes.get(nombre)
+            if pendiente and pendiente[0] == firma:
+                continue
+            sha = cis_catalogo.hash_contenido(os.path.join(self.data_dir, nombre))
+            if registro and registro['sha256'] == sha:
+                registro['firma'] = firma
+                continue
+            candidatos.append((nombre, firma, sha))
+        return candidatos
+
+    def _recoger(self) -> list:
+        """Resultados de los trabajos terminados (se anotan en el estado)."""
+        terminados = []
+        for nombre, (firma, sha, futuro) in list(self.pendientes.items()):
+            if not futuro.done():
+                continue
+            del self.pendientes[nombre]
+            registro = {'firma': firma, 'sha256': sha, 'fecha': time.strftime('%Y-%m-%d %H:%M:%S')}
+            try:
+                registro.update(futuro.result())
+            except Exception as e:
+                registro['error'] = str(e)
+            self.estado['archivos'][nombre] = registro
+            terminados.append((nombre, registro))
+        return terminados
+
+    def paso(self) -> list:
+        """Un sondeo: encola lo nuevo, recoge lo terminado y actualiza el catálogo."""
+        carpeta = cis_catalogo.estado_carpeta(self.data_dir)
+        for nombre in set(self._vistos) - set(carpeta):
+            del self._vistos[nombre]
+        for nombre in set(self.estado['archivos']) - set(carpeta):
+            del self.estado['archivos'][nombre]
+        for nombre, firma, sha in self._candidatos(carpeta):
+            print(f"  nuevo: {nombre}", flush=True)
+            self.pendientes[nombre] = (firma, sha, self.pool.submit(procesar, os.path.join(self.data_dir, nombre)))
+
+        terminados = self._recoger()
+        for nombre, registro in terminados:
+            if 'error' in registro:
+                print(f"  ERROR {nombre}: {registro['error']}", flush=True)
+            elif registro.get('compatible') is False:
+                print(f"  {nombre}: INCOMPATIBLE con {registro['anterior']} (revisar extractores)", flush=True)
+            else:
+                print(f"  {nombre}: ingerido", flush=True)
+        try:
+            cis_catalogo.actualizar(self.data_dir)
+            _guardar_estado(self.estado)
+        except OSError as e:
+            print(f"Aviso: no se pudo guardar el estado de ingesta ({e})")
+        return terminados
+
+    def esperar(self):
+        """Bloquea hasta que terminen los trabajos encolados."""
+        while self.pendientes:
+            time.sleep(0.2)
+            self.paso()
+
+    def vigilar(self, intervalo: float = INTERVALO):
+        print(f"Vigilando {self.data_dir} cada {intervalo:g} s", flush=True)
+        try:
+            while True:
+                self.paso()
+                time.sleep(intervalo)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.cerrar()
+
+    def cerrar(self):
+        self.pool.shutdown(wait=True, cancel_futures=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ingesta incremental de estudios del CIS")
+    parser.add_argument('--directorio', default=cis_catalogo.DATA_DIR, help="Carpeta vigilada")
+    parser.add_argument('--intervalo', type=float, default=INTERVALO, help="Segundos entre sondeos")
+    parser.add_argument('--procesos', type=int, help="Procesos del pool de ingesta")
+    parser.add_argument('--una-vez', action='store_true', help="Una pasada (sin esperar a que la firma se estabilice)")
+    args = parser.parse_args()
+
+    if args.una_vez:
+        ingesta = Ingesta(args.directorio, args.procesos, esperar_estable=False)
+        t0 = time.perf_counter()
+        ingesta.paso()
+        ingesta.esperar()
+        ingesta.cerrar()
+        errores = sum(1 for r in ingesta.estado['archivos'].values() if 'error' in r)
+        print(f"{len(ingesta.estado['archivos'])} archivos al día en {time.perf_counter() - t0:.1f} s")
+        sys.exit(1 if errores else 0)
+    Ingesta(args.directorio, args.procesos).vigilar(args.intervalo)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,222 @@
+"""
+Instrumentación opcional por etapas (tramos cronometrados anidados con contadores).
+
+Desactivada por defecto: `tramo()` devuelve un contexto nulo compartido, `contar()`
+sale en la primera línea y los métodos decorados con `@instrumentar` llaman
+directamente a la función, así que el coste sin traza es una comprobación de bandera.
+
+Se activa con la variable de entorno CIS_TRAZA (o con activar()):
+    CIS_TRAZA=1          imprime la tabla resumen al salir
+    CIS_TRAZA=traza.json además guarda una traza para chrome://tracing / Perfetto
+
+Uso en código:
+    with tramo('leer_hoja', hoja=nombre):
+        df = ...
+        contar('filas_leidas', len(df))
+
+    @instrumentar()
+    def extraer_voto_directo(self): ...
+
+Cada proceso lleva su propia traza (los workers del pool de web_app no la comparten).
+El resumen se agrega por ruta al cerrar cada tramo; para la traza exportada solo se
+guardan los últimos MAX_TRAMOS tramos, así que un servidor con la traza activa no crece
+sin límite.
+"""
+
+import atexit
+import collections
+import functools
+import json
+import os
+import threading
+import time
+
+_VARIABLE = os.environ.get('CIS_TRAZA', '')
+ACTIVO = _VARIABLE.lower() not in ('', '0', 'false', 'no')
+
+# Tramos cerrados que se conservan para exportar_traza (los más recientes)
+MAX_TRAMOS = 100000
+
+_local = threading.local()
+_cerrados = collections.deque(maxlen=MAX_TRAMOS)
+_agregado = {}      # ruta -> {'ruta', 'llamadas', 'total', 'propio', 'contadores'}
+_lock = threading.Lock()
+_origen = time.perf_counter()
+
+
+class Tramo:
+    """Intervalo cronometrado con atributos y contadores; se anida por hilo."""
+
+    __slots__ = ('nombre', 'atributos', 'contadores', 'padre', 'inicio', 'duracion', 'hilo', 'hijos')
+
+    def __init__(self, nombre: str, atributos: dict = None):
+        self.nombre = nombre
+        self.atributos = atributos or {}
+        self.contadores = {}
+        self.padre = None
+        self.inicio = self.duracion = self.hijos = 0.0
+        self.hilo = threading.get_ident()
+
+    @property
+    def ruta(self) -> str:
+        """'crear_estudio > EstudioCIS.extraer_voto_directo > leer_hoja'."""
+        partes = []
+        t = self
+        while t is not None:
+            partes.append(t.nombre)
+            t = t.padre
+        return ' > '.join(reversed(partes))
+
+    def __enter__(self):
+        pila = _pila()
+        self.padre = pila[-1] if pila else None
+        pila.append(self)
+        self.inicio = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.duracion = time.perf_counter() - self.inicio
+        pila = _pila()
+        if pila and pila[-1] is self:
+            pila.pop()
+        if self.padre is not None:
+            self.padre.hijos += self.duracion
+        ruta = self.ruta
+        with _lock:
+            _cerrados.append(self)
+            f = _agregado.get(ruta)
+            if f is None:
+                f = _agregado[ruta] = {'ruta': ruta, 'llamadas': 0, 'total': 0.0, 'propio': 0.0, 'contadores': {}}
+            f['llamadas'] += 1
+            f['total'] += self.duracion
+            f['propio'] += self.duracion - self.hijos
+            for c, n in self.contadores.items():
+                f['contadores'][c] = f['contadores'].get(c, 0) + n
+        return False
+
+
+class _TramoNulo:
+    """Contexto sin efecto que se devuelve cuando la traza está desactivada."""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULO = _TramoNulo()
+
+
+def _pila() -> list:
+    pila = getattr(_local, 'pila', None)
+    if pila is None:
+        pila = _local.pila = []
+    return pila
+
+
+def activar():
+    global ACTIVO
+    ACTIVO = True
+
+
+def desactivar():
+    global ACTIVO
+    ACTIVO = False
+
+
+def reiniciar():
+    """Descarta los tramos registrados hasta ahora."""
+    global _origen
+    with _lock:
+        _cerrados.clear()
+        _agregado.clear()
+    _origen = time.perf_counter()
+
+
+def tramo(nombre: str, **atributos):
+    """Contexto que cronometra un bloque (nulo si la traza está desactivada)."""
+    if not ACTIVO:
+        return _NULO
+    return Tramo(nombre, atributos)
+
+
+def contar(contador: str, n: int = 1):
+    """Suma `n` al contador del tramo en curso (filas recorridas, regex, celdas convertidas...)."""
+    if not ACTIVO:
+        return
+    pila = getattr(_local, 'pila', None)
+    if pila:
+        c = pila[-1].contadores
+        c[contador] = c.get(contador, 0) + n
+
+
+def instrumentar(nombre: str = None):
+    """Decorador: ejecuta la función dentro de un tramo (por defecto, su __qualname__)."""
+    def decorador(func):
+        etiqueta = nombre or func.__qualname__
+
+        @functools.wraps(func)
+        def envoltura(*args, **kwargs):
+            if not ACTIVO:
+                return func(*args, **kwargs)
+            with Tramo(etiqueta):
+                return func(*args, **kwargs)
+        return envoltura
+    return decorador
+
+
+def tramos() -> list:
+    """Últimos MAX_TRAMOS tramos cerrados, en orden de finalización."""
+    with _lock:
+        return list(_cerrados)
+
+
+def resumen() -> list:
+    """Agregado por ruta de todos los tramos: llamadas, tiempo total y propio (sin hijos) y contadores sumados."""
+    with _lock:
+        filas = [{**f, 'contadores': dict(f['contadores'])} for f in _agregado.values()]
+    return sorted(filas, key=lambda f: f['ruta'])
+
+
+def tabla_resumen() -> str:
+    """Resumen en texto: una fila por ruta, indentada por profundidad."""
+    filas = resumen()
+    if not filas:
+        return "(sin tramos registrados)"
+    lineas = [f"{'Etapa':<60} {'Llamadas':>8} {'Total ms':>10} {'Propio ms':>10}  Contadores",
+              "-" * 110]
+    for f in filas:
+        partes = f['ruta'].split(' > ')
+        etapa = '  ' * (len(partes) - 1) + partes[-1]
+        contadores = ', '.join(f"{c}={n}" for c, n in sorted(f['contadores'].items()))
+        lineas.append(f"{etapa[:60]:<60} {f['llamadas']:>8} {f['total'] * 1000:>10.1f} "
+                      f"{f['propio'] * 1000:>10.1f}  {contadores}")
+    return "\n".join(lineas)
+
+
+def exportar_traza(ruta: str):
+    """Guarda los tramos en formato Trace Event (chrome://tracing, ui.perfetto.dev)."""
+    pid = os.getpid()
+    eventos = [{
+        'name': t.nombre, 'ph': 'X', 'pid': pid, 'tid': t.hilo,
+        'ts': round((t.inicio - _origen) * 1e6, 1), 'dur': round(t.duracion * 1e6, 1),
+        'args': {**{k: str(v) for k, v in t.atributos.items()}, **t.contadores}
+    } for t in tramos()]
+    with open(ruta, 'w', encoding='utf-8') as f:
+        json.dump({'traceEvents': eventos, 'displayTimeUnit': 'ms'}, f, ensure_ascii=False)
+
+
+def _al_salir():
+    if not _agregado:
+        return
+    print("\n" + tabla_resumen())
+    if _VARIABLE.endswith('.json'):
+        exportar_traza(_VARIABLE)
+        print(f"Traza guardada en {_VARIABLE}")
+
+
+if ACTIVO:
+    atexit.register(_al_salir)
@@ -0,0 +1,317 @@
+"""
+Contabilidad de memoria de las cachés en proceso y presupuesto compartido.
+
+Cada capa de caché (hojas de Excel de EstudioCIS, payloads y modelos de web_app...)
+es una CacheMemoria: un LRU que conoce el tamaño de cada entrada (DataFrames con
+memory_usage(deep=True), el resto por recorrido de objetos). Todas las capas comparten
+un presupuesto: al superarlo se desalojan las entradas menos usadas de cualquier capa.
+
+Variables de entorno:
+    CIS_MEMORIA_MB       presupuesto de las cachés registradas en MB (por defecto 512), por proceso
+    CIS_MEMORIA_TRAZA    activa tracemalloc (asignaciones por archivo:línea y coste de abrir libros)
+    CIS_MEMORIA_INFORME  segundos entre informes periódicos en memoria.log (junto a debug.log)
+
+Cada proceso lleva su propia contabilidad (los workers del pool de web_app tienen la suya).
+El presupuesto es por proceso: el pool de procesos de web_app lo reparte entre sus
+workers (repartir_presupuesto), así que el techo total es CIS_MEMORIA_MB para el
+proceso del servidor más CIS_MEMORIA_MB entre todos los workers.
+"""
+
+import itertools
+import os
+import sys
+import threading
+import time
+import tracemalloc
+import weakref
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+RUTA_INFORME = os.path.join(os.path.dirname(os.path.abspath(__file__)), "memoria.log")
+
+PRESUPUESTO_BYTES = int(float(os.environ.get('CIS_MEMORIA_MB', 512)) * 1024 * 1024)
+
+# Entradas de tracemalloc que se muestran en el informe
+TOP_ASIGNACIONES = 10
+
+_lock = threading.RLock()
+_reloj = itertools.count()
+_capas = {}                     # nombre -> CacheMemoria
+_estudios = weakref.WeakSet()   # EstudioCIS vivos
+_hilo_informe = None
+
+
+def tamano(obj, _vistos=None) -> int:
+    """Bytes retenidos por `obj` (DataFrames con deep=True; contenedores de forma recursiva)."""
+    if isinstance(obj, (pd.DataFrame, pd.Series, pd.Index)):
+        uso = obj.memory_usage(deep=True)
+        return int(uso.sum() if hasattr(uso, 'sum') else uso)
+    if isinstance(obj, np.ndarray):
+        return int(obj.nbytes)
+    if _vistos is None:
+        _vistos = set()
+    if id(obj) in _vistos:
+        return 0
+    _vistos.add(id(obj))
+    n = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        n += sum(tamano(k, _vistos) + tamano(v, _vistos) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        n += sum(tamano(v, _vistos) for v in obj)
+    elif hasattr(obj, '__dict__'):
+        n += tamano(vars(obj), _vistos)
+    elif hasattr(obj, '__slots__'):
+        n += sum(tamano(getattr(obj, s), _vistos) for s in obj.__slots__ if hasattr(obj, s))
+    return n
+
+
+class CacheMemoria:
+    """LRU con tamaño por entrada, registrado en el presupuesto global.
+
+    Se usa como un dict (get, [], setdefault, del, in, len, clear); cada escritura
+    mide la entrada y, si el total de todas las capas supera el presupuesto, desaloja
+    las entradas más antiguas (en uso) de cualquier capa. Los valores devueltos se
+    comparten: no deben modificarse.
+    """
+
+    def __init__(self, nombre: str):
+        self.nombre = nombre
+        self._entradas = OrderedDict()   # clave -> [valor, bytes, último uso]
+        self.bytes = 0
+        self.desalojos = 0
+        self.aciertos = 0
+        self.fallos = 0
+        with _lock:
+            _capas[nombre] = self
+
+    def get(self, clave, defecto=None):
+        with _lock:
+            entrada = self._entradas.get(clave)
+            if entrada is None:
+                self.fallos += 1
+                return defecto
+            self.aciertos += 1
+            entrada[2] = next(_reloj)
+            self._entradas.move_to_end(clave)
+            return entrada[0]
+
+    def __getitem__(self, clave):
+        with _lock:
+            if clave not in self._entradas:
+                raise KeyError(clave)
+            return self.get(clave)
+
+    def __setitem__(self, clave, valor):
+        n = tamano(valor)
+        with _lock:
+            anterior = self._entradas.pop(clave, None)
+            if anterior is not None:
+                self.bytes -= anterior[1]
+            self._entradas[clave] = [valor, n, next(_reloj)]
+            self.bytes += n
+            _ajustar_presupuesto(protegida=(self, clave))
+
+    def setdefault(self, clave, valor):
+        with _lock:
+            if clave in self._entradas:
+                return self.get(clave)
+            self[clave] = valor
+            return valor
+
+    def __delitem__(self, clave):
+        with _lock:
+            self.bytes -= self._entradas.pop(clave)[1]
+
+    def pop(self, clave, defecto=None):
+        with _lock:
+            if clave not in self._entradas:
+                return defecto
+            valor, n, _ = self._entradas.pop(clave)
+            self.bytes -= n
+            return valor
+
+    def __contains__(self, clave):
+        with _lock:
+            return clave in self._entradas
+
+    def __len__(self):
+        return len(self._entradas)
+
+    def __iter__(self):
+        with _lock:
+            return iter(list(self._entradas))
+
+    def clear(self):
+        with _lock:
+            self._entradas.clear()
+            self.bytes = 0
+
+    def desglose(self) -> list:
+        """[(clave, bytes)] de las entradas, de la más a la menos reciente."""
+        with _lock:
+            return [(k, e[1]) for k, e in reversed(self._entradas.items())]
+
+    def _mas_antigua(self):
+        """(último uso, clave) de la entrada LRU de la capa, o None si está vacía."""
+        if not self._entradas:
+            return None
+        clave, entrada = next(iter(self._entradas.items()))
+        return entrada[2], clave
+
+
+def _ajustar_presupuesto(protegida=None):
+    """Desaloja entradas LRU de cualquier capa mientras el total supere el presupuesto.
+
+    La entrada recién escrita (`protegida`) no se desaloja aunque por sí sola lo supere.
+    """
+    while retenido_total() > PRESUPUESTO_BYTES:
+        candidatas = []
+        for capa in _capas.values():
+            antigua = capa._mas_antigua()
+            if antigua and (capa, antigua[1]) != protegida:
+                candidatas.append((antigua[0], capa, antigua[1]))
+        if not candidatas:
+            return
+        _, capa, clave = min(candidatas, key=lambda c: c[0])
+        del capa[clave]
+        capa.desalojos += 1
+
+
+def retenido_total() -> int:
+    with _lock:
+        return sum(c.bytes for c in _capas.values())
+
+
+def establecer_presupuesto(mb: float):
+    """Cambia el presupuesto compartido y desaloja lo que sobre."""
+    global PRESUPUESTO_BYTES
+    with _lock:
+        PRESUPUESTO_BYTES = int(mb * 1024 * 1024)
+        _ajustar_presupuesto()
+
+
+def repartir_presupuesto(procesos: int):
+    """Inicializador de los workers de un pool: cada uno se queda con 1/procesos del presupuesto."""
+    establecer_presupuesto(PRESUPUESTO_BYTES / max(1, procesos) / (1024 * 1024))
+
+
+def registrar_estudio(estudio):
+    """Anota un EstudioCIS vivo para el desglose por estudio (referencia débil)."""
+    _estudios.add(estudio)
+
+
+def medir_asignacion():
+    """Bytes asignados hasta ahora según tracemalloc (None si no está activo)."""
+    return tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else None
+
+
+def _rss() -> int:
+    """Memoria residente del proceso en bytes (None si no se puede leer)."""
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except Exception:
+        pass
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except Exception:
+        return None
+
+
+def informe() -> dict:
+    """Foto de la memoria: capas, estudios vivos y (si está activo) tracemalloc."""
+    with _lock:
+        capas = [{'capa': c.nombre, 'entradas': len(c), 'bytes': c.bytes, 'aciertos': c.aciertos,
+                  'fallos': c.fallos, 'desalojos': c.desalojos} for c in _capas.values()]
+        hojas = _capas['hojas_excel'].desglose() if 'hojas_excel' in _capas else []
+        estudios = []
+        for e in list(_estudios):
+            propias = {clave[2]: n for clave, n in hojas if clave[:2] == (e.file_path, e._firma)}
+            inferidos = tamano(e._inferred_data) if e._inferred_data else 0
+            derivados = tamano(dict(e._cache))
+            apertura = getattr(e, '_bytes_apertura', None)
+            estudios.append({
+                'archivo': os.path.basename(e.file_path), 'clase': type(e).__name__,
+                'hojas': propias, 'bytes_hojas': sum(propias.values()),
+                'bytes_libro': apertura, 'bytes_inferidos': inferidos, 'bytes_cache': derivados,
+                'bytes': sum(propias.values()) + inferidos + derivados + (apertura or 0)
+            })
+    datos = {
+        'fecha': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'pid': os.getpid(),
+        'presupuesto': PRESUPUESTO_BYTES,
+        'retenido': sum(c['bytes'] for c in capas),
+        'rss': _rss(),
+        'capas': capas,
+        'estudios': sorted(estudios, key=lambda e: -e['bytes']),
+        'tracemalloc': None
+    }
+    if tracemalloc.is_tracing():
+        actual, pico = tracemalloc.get_traced_memory()
+        top = tracemalloc.take_snapshot().statistics('lineno')[:TOP_ASIGNACIONES]
+        datos['tracemalloc'] = {
+            'actual': actual, 'pico': pico,
+            'top': [{'origen': f"{s.traceback[0].filename}:{s.traceback[0].lineno}",
+                     'bytes': s.size, 'bloques': s.count} for s in top]
+        }
+    return datos
+
+
+def _mb(n) -> str:
+    return "n/d" if n is None else f"{n / (1024 * 1024):.1f} MB"
+
+
+def texto_informe(datos: dict = None) -> str:
+    """Informe legible (el mismo que se escribe en memoria.log)."""
+    datos = datos or informe()
+    lineas = [f"=== Memoria {datos['fecha']} (proceso {datos.get('pid', 'n/d')}) | RSS {_mb(datos['rss'])}"
+              f" | cachés {_mb(datos['retenido'])} de {_mb(datos['presupuesto'])} por proceso ==="]
+    for c in datos['capas']:
+        lineas.append(f"  capa {c['capa']:<18} {c['entradas']:>5} entradas {_mb(c['bytes']):>10}"
+                      f"  aciertos {c['aciertos']} fallos {c['fallos']} desalojos {c['desalojos']}")
+    for e in datos['estudios']:
+        lineas.append(f"  estudio {e['archivo']} ({e['clase']}): {_mb(e['bytes'])}"
+                      f" [libro {_mb(e['bytes_libro'])}, hojas {_mb(e['bytes_hojas'])}, inferidos {_mb(e['bytes_inferidos'])},"
+                      f" derivados {_mb(e.get('bytes_cache'))}]")
+        for hoja, n in sorted(e['hojas'].items(), key=lambda h: -h[1]):
+            lineas.append(f"      {hoja}: {_mb(n)}")
+    if datos['tracemalloc']:
+        t = datos['tracemalloc']
+        lineas.append(f"  tracemalloc: actual {_mb(t['actual'])}, pico {_mb(t['pico'])}")
+        for s in t['top']:
+            lineas.append(f"      {_mb(s['bytes']):>10} {s['bloques']:>8} bloques  {s['origen']}")
+    return "\n".join(lineas)
+
+
+def escribir_informe(ruta: str = RUTA_INFORME):
+    """Añade el informe actual al final de memoria.log."""
+    with open(ruta, 'a', encoding='utf-8') as f:
+        f.write(texto_informe() + "\n\n")
+
+
+def iniciar_informe_periodico(intervalo: float, ruta: str = RUTA_INFORME):
+    """Hilo (daemon) que escribe el informe cada `intervalo` segundos. Idempotente."""
+    global _hilo_informe
+    if _hilo_informe is not None:
+        return
+
+    def bucle():
+        while True:
+            time.sleep(intervalo)
+            try:
+                escribir_informe(ruta)
+            except Exception as e:
+                print(f"Error escribiendo informe de memoria: {e}")
+
+    _hilo_informe = threading.Thread(target=bucle, name='informe-memoria', daemon=True)
+    _hilo_informe.start()
+
+
+if os.environ.get('CIS_MEMORIA_TRAZA') and not tracemalloc.is_tracing():
+    tracemalloc.start()
+
+if float(os.environ.get('CIS_MEMORIA_INFORME', 0) or 0) > 0:
+    iniciar_informe_periodico(float(os.environ['CIS_MEMORIA_INFORME']))
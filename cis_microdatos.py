@@ -0,0 +1,312 @@
+"""
+Microdatos del CIS (una fila por entrevista) en columnas compactas.
+
+Con cada estudio el CIS publica el fichero de microdatos (SPSS .sav o CSV) con todas
+las variables del cuestionario y la ponderación. Se lee por bloques de filas
+(TAMANO_BLOQUE, sin cargar el fichero entero) y cada variable queda como códigos
+enteros (int16; -1 = sin dato) más su lista de etiquetas, en el orden de los códigos
+del CIS; el peso, en float32. Las tablas ponderadas (voto directo, recuerdo,
+simpatía o cualquier cruce) son un np.bincount sobre los códigos, sin recorrer filas.
+
+Las columnas se guardan en data/cache/microdatos/<fichero>.npz junto a la firma del
+fichero: mientras no cambie, no se vuelve a leer el CSV o el .sav.
+
+crear_estudio(libro, microdatos=ruta) los conecta a EstudioCIS: voto directo,
+recuerdo, voto+simpatía, matriz de transferencia y métricas de contexto salen de
+estas tablas en lugar de las hojas del Excel (ficha técnica, estimación del CIS y
+lo que no tenga variable siguen saliendo del libro). Las variables se localizan
+por rol (ROLES) con los nombres habituales del CIS.
+
+Los .sav requieren pyreadstat (se importa solo al leerlos); el CSV (separador ';' o
+',', UTF-8 o Latin-1) puede traer etiquetas o códigos.
+
+Uso:
+    python cis_microdatos.py data/cis_studies/MD3543.sav                    # variables y roles
+    python cis_microdatos.py data/cis_studies/MD3543.sav INTENCIONGR --por RECUVOTOG
+    python cis_microdatos.py data/cis_studies/MD3543.sav --libro data/cis_studies/3543-multi_A.xlsx
+"""
+
+import argparse
+import glob
+import os
+import re
+import time
+
+import numpy as np
+import pandas as pd
+
+from cis_cache import firma_archivo, ruta_artefacto
+from cis_instrumentacion import tramo, contar
+
+# Versión del formato de la caché (cambiarla fuerza releer los ficheros)
+VERSION_MICRODATOS = 1
+
+# Filas por bloque de lectura
+TAMANO_BLOQUE = 50000
+
+# Nombres de variable del CIS por rol, por preferencia (sin distinguir mayúsculas)
+ROLES = {
+    'intencion': ['INTENCIONGR', 'INTENCIONG', 'INTENCION', 'INTENCIONVOTO'],
+    'recuerdo': ['RECUVOTOGR', 'RECUVOTOG', 'RECUERDO', 'RECUVOTO'],
+    'simpatia': ['SIMPATIAGR', 'SIMPATIAG', 'SIMPATIA'],
+    'voto_simpatia': ['VOTOSIMGR', 'VOTOSIMG', 'VOTOSIMPATIA'],
+    'tamuni': ['TAMUNI', 'TAMUNIGR'],
+    'ideologia': ['ESCIDEOL', 'IDEOLOGIA'],
+    'sexo': ['SEXO'],
+    'edad': ['EDADGR', 'EDAD'],
+    'peso': ['PESO', 'PONDERA', 'PONDERACION'],
+}
+
+# Ficheros de microdatos junto al libro ({id} = id del CIS)
+PATRONES = ['MD{id}.sav', 'MD{id}.csv', '{id}.sav', '{id}_microdatos.csv', '{id}-microdatos.csv']
+
+
+def _texto(valor) -> str:
+    """Etiqueta de un valor (5.0 -> '5')."""
+    if isinstance(valor, float) and valor.is_integer():
+        return str(int(valor))
+    return str(valor).strip()
+
+
+def _clave_orden(valor, posicion: int) -> tuple:
+    """Orden de las categorías: por código numérico ('5', 5.0, '1 Izquierda') si lo hay; si no, por aparición."""
+    if isinstance(valor, (int, float)):
+        return (0, float(valor), posicion)
+    match = re.match(r'\s*(\d+)(\s|$)', str(valor))
+    return (0, float(match.group(1)), posicion) if match else (1, 0.0, posicion)
+
+
+class Microdatos:
+    """Variables de un fichero de microdatos como códigos enteros, etiquetas y peso."""
+
+    def __init__(self, codigos: dict = None, etiquetas: dict = None, peso: np.ndarray = None):
+        self.codigos = codigos or {}        # variable -> np.ndarray de códigos (-1 = sin dato)
+        self.etiquetas = etiquetas or {}    # variable -> [etiqueta de cada código]
+        filas = len(next(iter(self.codigos.values()))) if self.codigos else 0
+        self.peso = peso if peso is not None else np.ones(filas, dtype=np.float32)
+        self._nombres = {v.upper(): v for v in self.codigos}
+
+    def __len__(self):
+        return len(self.peso)
+
+    @property
+    def columnas(self) -> list:
+        return list(self.codigos)
+
+    def variable(self, nombre: str) -> str:
+        """Columna por nombre (sin distinguir mayúsculas) o por rol de ROLES; None si no está."""
+        if not nombre:
+            return None
+        candidatos = [nombre] + ROLES.get(nombre, [])
+        return next((self._nombres[c.upper()] for c in candidatos if c.upper() in self._nombres), None)
+
+    def _conteos(self, variable: str = None, por: str = None) -> pd.DataFrame:
+        """Entrevistas ponderadas categorías × (TOTAL + segmentos de `por`), sin categorías ni segmentos vacíos."""
+        if variable:
+            codigos, etiquetas = self.codigos[variable], self.etiquetas[variable]
+        else:
+            codigos, etiquetas = np.zeros(len(self), dtype=np.int16), ['TOTAL']
+        valido = codigos >= 0
+        k = len(etiquetas)
+        total = np.bincount(codigos[valido], weights=self.peso[valido], minlength=k)
+        columnas = {'TOTAL': total}
+        if por:
+            segmentos = self.codigos[por]
+            m = len(self.etiquetas[por])
+            cruce = valido & (segmentos >= 0)
+            combinados = codigos[cruce].astype(np.int64) * m + segmentos[cruce]
+            matriz = np.bincount(combinados, weights=self.peso[cruce], minlength=k * m).reshape(k, m)
+            for j, segmento in enumerate(self.etiquetas[por]):
+                if matriz[:, j].sum() > 0:
+                    columnas[segmento] = columnas.get(segmento, 0) + matriz[:, j]
+        contar('celdas_convertidas', int(valido.sum()))
+        tabla = pd.DataFrame(columnas, index=pd.Index(etiquetas))
+        return tabla[tabla['TOTAL'] > 0]
+
+    def tabla(self, variable: str, por: str = None) -> pd.DataFrame:
+        """
+        Tabla categorías × segmentos en porcentajes (cada columna suma 100 sobre las
+        respuestas con dato), con la columna TOTAL: la misma forma que CuboCruces.crosstab.
+        """
+        conteos = self._conteos(variable, por)
+        return conteos / conteos.sum(axis=0).where(lambda s: s > 0) * 100
+
+    def n(self, variable: str = None, por: str = None) -> pd.Series:
+        """N ponderada de cada segmento de `por` (y TOTAL) entre quienes responden `variable` (todos si None)."""
+        return self._conteos(variable, por).sum(axis=0)
+
+
+def _codificacion(path: str) -> str:
+    with open(path, 'rb') as f:
+        muestra = f.read(1 << 16)
+    try:
+        muestra.decode('utf-8')
+        return 'utf-8'
+    except UnicodeDecodeError as e:
+        return 'utf-8' if e.start > len(muestra) - 4 else 'latin-1'  # carácter cortado al final
+
+
+def _bloques_csv(path: str, variables: set, tamano: int):
+    """(DataFrame, etiquetas de valor) por bloque de un CSV."""
+    codificacion = _codificacion(path)
+    with open(path, encoding=codificacion) as f:
+        cabecera = f.readline()
+    separador = ';' if cabecera.count(';') >= cabecera.count(',') else ','
+    usecols = (lambda c: c.strip().upper() in variables) if variables else None
+    lector = pd.read_csv(path, sep=separador, encoding=codificacion, dtype=str, usecols=usecols,
+                         chunksize=tamano, keep_default_na=False, na_values=[''])
+    for df in lector:
+        df.columns = [c.strip() for c in df.columns]
+        yield df, {}
+
+
+def _bloques_sav(path: str, variables: set, tamano: int):
+    """(DataFrame de códigos, etiquetas de valor) por bloque de un .sav (requiere pyreadstat)."""
+    import pyreadstat
+    _, meta = pyreadstat.read_sav(path, metadataonly=True)
+    usecols = [c for c in meta.column_names if c.upper() in variables] if variables else None
+    for df, meta in pyreadstat.read_file_in_chunks(pyreadstat.read_sav, path, chunksize=tamano, usecols=usecols):
+        yield df, meta.variable_value_labels
+
+
+def leer(path: str, variables: list = None, tamano_bloque: int = TAMANO_BLOQUE) -> Microdatos:
+    """
+    Lee un fichero de microdatos por bloques. `variables`: nombres o roles a cargar
+    (todas si None; el peso se añade siempre).
+    """
+    if variables:
+        variables = {c.upper() for v in variables for c in [v] + ROLES.get(v, [])} | set(ROLES['peso'])
+    bloques = _bloques_sav if path.lower().endswith('.sav') else _bloques_csv
+
+    columnas = {}   # variable -> {'codigos': [arrays], 'etiquetas': [], 'posicion': {}, 'claves': []}
+    pesos = []
+    columna_peso = None
+    with tramo('leer_microdatos', archivo=os.path.basename(path)):
+        for df, etiquetas_valor in bloques(path, variables, tamano_bloque):
+            contar('filas_leidas', len(df))
+            if columna_peso is None:
+                nombres = {c.upper(): c for c in df.columns}
+                columna_peso = next((nombres[c] for c in ROLES['peso'] if c in nombres), '')
+            if columna_peso:
+                peso = pd.to_numeric(df[columna_peso].astype(str).str.replace(',', '.'), errors='coerce')
+                pesos.append(peso.fillna(1.0).to_numpy(dtype=np.float32))
+            else:
+                pesos.append(np.ones(len(df), dtype=np.float32))
+
+            for nombre in df.columns:
+                if nombre == columna_peso:
+                    continue
+                col = columnas.setdefault(nombre, {'codigos': [], 'etiquetas': [], 'posicion': {}, 'claves': []})
+                codigos, unicos = pd.factorize(df[nombre], use_na_sentinel=True)
+                etiquetas = etiquetas_valor.get(nombre, {})
+                mapa = np.empty(len(unicos), dtype=np.int32)
+                for i, valor in enumerate(unicos):
+                    etiqueta = _texto(etiquetas.get(valor, valor))
+                    if etiqueta not in col['posicion']:
+                        col['posicion'][etiqueta] = len(col['etiquetas'])
+                        col['etiquetas'].append(etiqueta)
+                        col['claves'].append(_clave_orden(valor, len(col['claves'])))
+                    mapa[i] = col['posicion'][etiqueta]
+                col['codigos'].append(np.where(codigos >= 0, mapa[codigos] if len(mapa) else -1, -1))
+
+    codigos, etiquetas = {}, {}
+    for nombre, col in columnas.items():
+        # Categorías en el orden de los códigos del CIS (o de aparición si son texto)
+        orden = sorted(range(len(col['etiquetas'])), key=lambda i: col['claves'][i])
+        nuevo = np.empty(len(orden) + 1, dtype=np.int32)
+        nuevo[orden] = np.arange(len(orden))
+        nuevo[-1] = -1
+        tipo = np.int16 if len(orden) < np.iinfo(np.int16).max else np.int32
+        codigos[nombre] = nuevo[np.concatenate(col['codigos'])].astype(tipo)
+        etiquetas[nombre] = [col['etiquetas'][i] for i in orden]
+    peso = np.concatenate(pesos) if pesos else np.zeros(0, dtype=np.float32)
+    return Microdatos(codigos, etiquetas, peso)
+
+
+def cargar(path: str, reconstruir: bool = False) -> Microdatos:
+    """Todas las variables del fichero, desde data/cache/microdatos si no ha cambiado."""
+    firma = np.array(firma_archivo(path), dtype=np.int64)
+    sidecar = ruta_artefacto('microdatos', path, '.npz')
+    if not reconstruir:
+        try:
+            with np.load(sidecar) as npz:
+                if np.array_equal(npz['firma'], firma) and int(npz['version']) == VERSION_MICRODATOS:
+                    nombres = npz['columnas'].tolist()
+                    codigos = {c: npz[f'{i}_codigos'] for i, c in enumerate(nombres)}
+                    etiquetas = {c: npz[f'{i}_etiquetas'].tolist() for i, c in enumerate(nombres)}
+                    contar('microdatos_en_cache')
+                    return Microdatos(codigos, etiquetas, npz['peso'])
+        except Exception:
+            pass  # sin caché, corrupta o de otra versión
+
+    microdatos = leer(path)
+    arrays = {'firma': firma, 'version': np.array(VERSION_MICRODATOS), 'peso': microdatos.peso,
+              'columnas': np.array(microdatos.columnas, dtype=str)}
+    for i, c in enumerate(microdatos.columnas):
+        arrays[f'{i}_codigos'] = microdatos.codigos[c]
+        arrays[f'{i}_etiquetas'] = np.array(microdatos.etiquetas[c], dtype=str)
+    try:
+        np.savez(sidecar, **arrays)
+    except OSError as e:
+        print(f"Aviso: no se pudo guardar la caché de microdatos ({e})")
+    return microdatos
+
+
+def buscar(path_libro: str) -> str:
+    """Fichero de microdatos junto a un libro del CIS (por id del estudio), o None."""
+    from cis_catalogo import id_estudio
+    carpeta = os.path.dirname(os.path.abspath(path_libro))
+    sid = id_estudio(os.path.basename(path_libro))
+    for patron in PATRONES:
+        encontrados = glob.glob(os.path.join(carpeta, patron.format(id=sid)))
+        if encontrados:
+            return encontrados[0]
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Microdatos del CIS: tablas ponderadas")
+    parser.add_argument('fichero', help="Microdatos (.sav o .csv)")
+    parser.add_argument('variable', nargs='?', help="Variable o rol a tabular (intencion, recuerdo...)")
+    parser.add_argument('--por', help="Variable o rol de cruce")
+    parser.add_argument('--libro', help="Excel del estudio: comparar insumos del libro y de los microdatos")
+    parser.add_argument('--reconstruir', action='store_true', help="Ignorar la caché en disco")
+    args = parser.parse_args()
+
+    t0 = time.perf_counter()
+    microdatos = cargar(args.fichero, args.reconstruir)
+    print(f"{len(microdatos)} entrevistas, {len(microdatos.columnas)} variables "
+          f"(peso total {microdatos.peso.sum():.1f}) en {time.perf_counter() - t0:.2f} s")
+
+    if args.libro:
+        import contextlib
+        import io
+        from cis_estudios import crear_estudio
+        with contextlib.redirect_stdout(io.StringIO()):
+            libro = crear_estudio(args.libro)
+            micro = crear_estudio(args.libro, microdatos=args.fichero)
+        for nombre, metodo in (('Voto directo', 'extraer_voto_directo'), ('Recuerdo', 'extraer_recuerdo_voto'),
+                               ('Voto+simpatía', 'extraer_voto_simpatia')):
+            a, b = getattr(libro, metodo)(), getattr(micro, metodo)()
+            print(f"\n{nombre:<20} {'Libro':>8} {'Microdatos':>11}")
+            for clave in sorted(set(a) | set(b), key=lambda k: -max(a.get(k, 0), b.get(k, 0))):
+                print(f"  {clave:<18} {a.get(clave, 0):>8.1f} {b.get(clave, 0):>11.1f}")
+        return
+
+    if not args.variable:
+        for rol in list(ROLES)[:-1]:
+            print(f"  {rol:<14} {microdatos.variable(rol) or '-'}")
+        return
+
+    variable = microdatos.variable(args.variable)
+    por = microdatos.variable(args.por) if args.por else None
+    if variable is None or (args.por and por is None):
+        print(f"Sin variable '{args.variable if variable is None else args.por}'")
+        return
+    with pd.option_context('display.max_rows', 200, 'display.max_columns', 30, 'display.width', 200):
+        print(microdatos.tabla(variable, por).round(1))
+        print(microdatos.n(variable, por).round(0).to_frame('N').T)
+
+
+if __name__ == "__main__":
+    main()
@@ -96,7 +96,9 @@ def append_to_excel(excel_path, df_official):
         print(f"Error appending to Excel: {e}")
 
 if __name__ == "__main__":
-    study_id = "3536"
+    import sys
+    # Uso: python cis_pdf_processor.py [id_estudio]  (la ingesta automática está en cis_ingesta.py)
+    study_id = sys.argv[1] if len(sys.argv) > 1 else "3536"
     base_dir = "data/cis_studies"
     pdf_path = os.path.join(base_dir, f"{study_id}_Estimacion.pdf")
     excel_path = os.path.join(base_dir, f"{study_id}_multi.xlsx")
@@ -0,0 +1,255 @@
+"""
+Rastrillado (raking, ajuste proporcional iterativo) de los pesos de un estudio.
+
+El factor K de Aldabón corrige el recuerdo en una sola dimensión: al llevar el
+recuerdo al resultado real descuadra la edad, el sexo o el tamaño de municipio de
+la muestra. El rastrillado ajusta a la vez varios márgenes: recuerdo de voto al
+resultado de referencia y sexo, edad y tamaño de municipio a los del propio
+estudio (la muestra ponderada del CIS, representativa por diseño).
+
+Con microdatos (cis_microdatos) se rastrillan los pesos de cada entrevista. Con
+solo los libros, las celdas son una población sintética intención × recuerdo ×
+sexo × edad × tamaño construida con los cruces de las hojas (hoja RV y hojas de
+cruce de la pregunta de intención), suponiendo que los cruces por sexo, edad y
+tamaño son independientes dado la intención. El resultado son la intención y el
+recuerdo ya reponderados, que sustituyen a voto directo y recuerdo en la
+estimación (EstudioCIS.extraer_insumos(rastrillado=True)): el recuerdo queda en la
+referencia y K queda en 1 (salvo lo que el recorte no deje cuadrar).
+
+ipf trabaja sobre arrays de NumPy (un np.bincount por margen e iteración) con
+control de convergencia y recorte de pesos; rastrillar_lote resuelve muchos
+estudios en una sola pasada apilando sus celdas (márgenes disjuntos por estudio).
+
+Uso:
+    python cis_raking.py                                      # todo el corpus en lote
+    python cis_raking.py data/cis_studies/3543-multi_A.xlsx --recorte 0.5 2
+"""
+
+import argparse
+import contextlib
+import glob
+import io
+import os
+import time
+
+import numpy as np
+
+from cis_instrumentacion import instrumentar
+
+# Iteraciones máximas y error máximo admitido (diferencia absoluta de cuota en cualquier margen)
+MAX_ITERACIONES = 100
+TOLERANCIA = 1e-6
+
+# Límites del peso rastrillado respecto al peso de partida (recorte)
+RECORTE = (0.2, 5.0)
+
+# Hojas de cruce cuyos márgenes se conservan, con su rol en los microdatos
+MARGENES = [('Sexo', 'sexo'), ('Edad', 'edad'), ('Tamaño de municipio', 'tamuni')]
+
+
+@instrumentar()
+def ipf(base: np.ndarray, dimensiones: list, objetivos: list, max_iteraciones: int = MAX_ITERACIONES,
+        tolerancia: float = TOLERANCIA, recorte: tuple = RECORTE):
+    """
+    Rastrilla los pesos `base` (uno por celda o entrevista) hasta que cada margen
+    cuadre con su objetivo (o hasta que el error deje de bajar: con recorte puede no
+    haber solución exacta).
+
+    dimensiones[k] es el código de categoría de cada celda en el margen k (-1: la
+    celda no cuenta en ese margen) y objetivos[k] la masa deseada por categoría; se
+    reescala a la masa de partida de las celdas con dato, así que basta con cuotas.
+    `recorte` = (mínimo, máximo) del cociente peso / base (None: sin recorte).
+    Devuelve (pesos, {'iteraciones', 'error', 'convergido'}).
+    """
+    base = np.asarray(base, dtype=float)
+    pesos = base.copy()
+    margenes = []
+    for codigos, objetivo in zip(dimensiones, objetivos):
+        codigos = np.asarray(codigos)
+        valido = codigos >= 0
+        objetivo = np.asarray(objetivo, dtype=float)
+        masa = base[valido].sum()
+        if masa <= 0 or objetivo.sum() <= 0:
+            continue
+        margenes.append((valido, codigos[valido], objetivo * masa / objetivo.sum(), masa))
+
+    error, anterior, iteracion = np.inf, np.inf, 0
+    for iteracion in range(1, max_iteraciones + 1):
+        for valido, codigos, objetivo, _ in margenes:
+            actual = np.bincount(codigos, weights=pesos[valido], minlength=len(objetivo))
+            factor = np.divide(objetivo, actual, out=np.ones_like(objetivo), where=actual > 0)
+            pesos[valido] *= factor[codigos]
+        if recorte:
+            np.clip(pesos, base * recorte[0], base * recorte[1], out=pesos)
+        error = max((np.abs(np.bincount(codigos, weights=pesos[valido], minlength=len(objetivo)) - objetivo).max() / masa
+                     for valido, codigos, objetivo, masa in margenes), default=0.0)
+        if error < tolerancia or anterior - error < tolerancia * 1e-3:
+            break
+        anterior = error
+    return pesos, {'iteraciones': iteracion, 'error': float(error), 'convergido': bool(error < tolerancia)}
+
+
+def opciones_ipf(**opciones) -> dict:
+    """Opciones de ipf completadas con los valores por defecto (para comparar ejecuciones)."""
+    completas = {'max_iteraciones': MAX_ITERACIONES, 'tolerancia': TOLERANCIA, 'recorte': RECORTE}
+    completas.update(opciones)
+    completas['recorte'] = tuple(completas['recorte'])
+    return completas
+
+
+def rastrillar_lote(problemas: list, **opciones) -> list:
+    """
+    Rastrilla varios problemas ({'base', 'dimensiones', 'objetivos'}) en una sola
+    llamada a ipf: las celdas se apilan y las categorías de cada problema se desplazan
+    para que sus márgenes no se mezclen. [(pesos, info)] en el orden de `problemas`
+    (info con la convergencia de su propio problema).
+    """
+    if not problemas:
+        return []
+    n_dim = max(len(p['dimensiones']) for p in problemas)
+    bases, dimensiones, objetivos = [], [[] for _ in range(n_dim)], [[] for _ in range(n_dim)]
+    desplazamiento = [0] * n_dim
+    for p in problemas:
+        base = np.asarray(p['base'], dtype=float)
+        bases.append(base)
+        for k in range(n_dim):
+            if k < len(p['dimensiones']):
+                codigos = np.asarray(p['dimensiones'][k])
+                # Objetivo en masa de este problema (ipf solo reescala el total del lote)
+                objetivo = np.asarray(p['objetivos'][k], dtype=float)
+                masa = base[codigos >= 0].sum()
+                objetivo = objetivo * masa / objetivo.sum() if objetivo.sum() > 0 else np.zeros_like(objetivo)
+                dimensiones[k].append(np.where(codigos >= 0, codigos + desplazamiento[k], -1))
+                objetivos[k].append(objetivo)
+                desplazamiento[k] += len(objetivo)
+            else:
+                dimensiones[k].append(np.full(len(base), -1))
+    pesos, info = ipf(np.concatenate(bases), [np.concatenate(d) for d in dimensiones],
+                      [np.concatenate(o) for o in objetivos], **opciones)
+
+    resultados, inicio = [], 0
+    for p, base in zip(problemas, bases):
+        propios = pesos[inicio:inicio + len(base)]
+        inicio += len(base)
+        error = 0.0
+        for codigos, objetivo in zip(p['dimensiones'], p['objetivos']):
+            codigos, objetivo = np.asarray(codigos), np.asarray(objetivo, dtype=float)
+            valido = codigos >= 0
+            if objetivo.sum() <= 0 or not valido.any():
+                continue
+            actual = np.bincount(codigos[valido], weights=propios[valido], minlength=len(objetivo))
+            error = max(error, np.abs(actual / actual.sum() - objetivo / objetivo.sum()).max())
+        resultados.append((propios, {'iteraciones': info['iteraciones'], 'error': float(error),
+                                     'convergido': bool(error < opciones.get('tolerancia', TOLERANCIA))}))
+    return resultados
+
+
+def celdas_agregadas(intencion_recuerdo: np.ndarray, condicionales: list):
+    """
+    Población sintética de celdas a partir de cruces agregados. `intencion_recuerdo`
+    es la masa D × O (intención × recuerdo) y cada condicional una matriz D × S con
+    P(segmento | intención). Devuelve (masa de cada celda, [códigos de intención,
+    de recuerdo y de cada segmento]) sin celdas vacías.
+    """
+    masa = np.asarray(intencion_recuerdo, dtype=float)
+    formas = [masa.shape[0], masa.shape[1]] + [c.shape[1] for c in condicionales]
+    conjunta = masa.reshape(formas[:2] + [1] * len(condicionales))
+    for k, condicional in enumerate(condicionales):
+        forma = [formas[0], 1] + [1] * len(condicionales)
+        forma[2 + k] = condicional.shape[1]
+        conjunta = conjunta * np.asarray(condicional, dtype=float).reshape(forma)
+    conjunta = conjunta.ravel()
+    llenas = np.flatnonzero(conjunta > 0)
+    codigos = np.unravel_index(llenas, formas)
+    return conjunta[llenas], list(codigos)
+
+
+def objetivo_recuerdo(masa: np.ndarray, claves: list, referencia: dict) -> np.ndarray:
+    """
+    Masa objetivo de cada categoría de recuerdo. Las categorías con clave en
+    `referencia` (resultado real, en %) se reparten la masa de todas ellas en
+    proporción al resultado real (las de una misma clave, según su masa actual);
+    el resto (no votó, no recuerda, partidos sin referencia) conserva su masa.
+    """
+    masa = np.asarray(masa, dtype=float)
+    objetivo = masa.copy()
+    referenciadas = [i for i, c in enumerate(claves) if c and referencia.get(c, 0) > 0]
+    if not referenciadas:
+        return objetivo
+    por_clave = {}
+    for i in referenciadas:
+        por_clave[claves[i]] = por_clave.get(claves[i], 0.0) + masa[i]
+    total_ref = sum(referencia[c] for c in por_clave)
+    disponible = masa[referenciadas].sum()
+    for i in referenciadas:
+        c = claves[i]
+        reparto = masa[i] / por_clave[c] if por_clave[c] > 0 else 1.0 / sum(1 for j in referenciadas if claves[j] == c)
+        objetivo[i] = disponible * referencia[c] / total_ref * reparto
+    return objetivo
+
+
+def rastrillar_estudios(estudios: list, **opciones) -> list:
+    """
+    Rastrilla varios estudios en lote y devuelve el resultado de cada uno ({} sin cruce
+    de recuerdo); cada estudio lo guarda con sus opciones (EstudioCIS.rastrillar).
+    """
+    problemas = [e.problema_rastrillado() for e in estudios]
+    con_problema = [(e, p) for e, p in zip(estudios, problemas) if p]
+    soluciones = iter(rastrillar_lote([p for _, p in con_problema], **opciones))
+    resultados = []
+    for estudio, problema in zip(estudios, problemas):
+        if problema:
+            pesos, info = next(soluciones)
+            resultados.append(estudio.aplicar_rastrillado(problema, pesos, info, opciones))
+        else:
+            resultados.append({})
+    return resultados
+
+
+def main():
+    from cis_cache import es_libro_valido
+    from cis_estudios import crear_estudio, estimar_aldabon_gemini
+
+    parser = argparse.ArgumentParser(description="Rastrillado de recuerdo y márgenes sociodemográficos")
+    parser.add_argument('archivos', nargs='*', help="Libros (por defecto, todo data/cis_studies)")
+    parser.add_argument('--microdatos', help="Fichero de microdatos (solo con un libro)")
+    parser.add_argument('--recorte', type=float, nargs=2, default=RECORTE, metavar=('MIN', 'MAX'),
+                        help="Límites del peso respecto al de partida")
+    parser.add_argument('--tolerancia', type=float, default=TOLERANCIA)
+    args = parser.parse_args()
+
+    raiz = os.path.dirname(os.path.abspath(__file__))
+    archivos = args.archivos or sorted(p for p in glob.glob(os.path.join(raiz, 'data', 'cis_studies', '*.xlsx'))
+                                       if es_libro_valido(p))
+    with contextlib.redirect_stdout(io.StringIO()):
+        estudios = [crear_estudio(p, microdatos=args.microdatos) for p in archivos]
+        problemas = [e.problema_rastrillado() for e in estudios]
+    celdas = sum(len(p['base']) for p in problemas if p)
+    t0 = time.perf_counter()
+    soluciones = rastrillar_lote([p for p in problemas if p], recorte=tuple(args.recorte), tolerancia=args.tolerancia)
+    t_lote = time.perf_counter() - t0
+    print(f"{len(soluciones)} estudios ({celdas} celdas) rastrillados en lote en {t_lote * 1000:.1f} ms")
+
+    soluciones = iter(soluciones)
+    for estudio, problema in zip(estudios, problemas):
+        nombre = os.path.basename(estudio.file_path)
+        if not problema:
+            print(f"\n{nombre}: sin cruces para rastrillar")
+            continue
+        pesos, info = next(soluciones)
+        rastrillado = estudio.aplicar_rastrillado(problema, pesos, info,
+                                                  {'recorte': tuple(args.recorte), 'tolerancia': args.tolerancia})
+        with contextlib.redirect_stdout(io.StringIO()):
+            insumos = estudio.extraer_insumos()
+            clasica = estimar_aldabon_gemini(**insumos)
+            nueva = estimar_aldabon_gemini(**estudio.extraer_insumos(rastrillado=True))
+        print(f"\n{nombre}: {info['iteraciones']} iteraciones, error {info['error']:.1e}, "
+              f"márgenes {', '.join(rastrillado['margenes'])}, efecto de diseño {rastrillado['efecto_diseno']:.2f}")
+        print(f"  {'Partido':<16} {'VD':>6} {'VD rastr.':>9} {'Est. K':>7} {'Est. rastr.':>11}")
+        for p in sorted(clasica, key=lambda k: -clasica[k])[:10]:
+            print(f"  {p:<16} {insumos['voto_directo'].get(p, 0):>6.1f} {rastrillado['voto_directo'].get(p, 0):>9.1f} "
+                  f"{clasica[p]:>7.1f} {nueva.get(p, 0):>11.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,375 @@
+"""
+Generador de libros CIS sintéticos y parametrizables para pruebas de carga.
+
+Produce libros con la forma de los avances del CIS (Contenidos, Ficha técnica,
+Estimación de Voto, Resultados con N bloques de preguntas, cruces por Sexo, Edad,
+Tamaño de municipio, Escala de ideología y RV EG23/EA23) que crear_estudio reconoce
+y procesa igual que los reales. En modo barómetro no hay hoja de estimación y se
+genera además el PDF <estudio>_Estimacion.pdf con la tabla que lee
+_extraer_estimacion_cis_pdf.
+
+El tamaño crece con --preguntas (bloques por hoja), --filas (respuestas por bloque),
+--cruces/--columnas (hojas de cruce genéricas y sus categorías) y --partidos; las
+escalas predefinidas van de unos cientos de KB (pequeno) a cientos de MB (enorme).
+Se escribe en modo write_only de openpyxl, sin cargar el libro en memoria.
+
+Uso:
+    python cis_sintetico.py --tipo generales --escala mediano
+    python cis_sintetico.py --tipo autonomicas --comunidad EXTREMADURA --preguntas 500
+    python cis_sintetico.py --tipo barometro --estudio 3599 --escala grande
+    python benchmark_cis.py data/sinteticos/3599_multi_A.xlsx     # medir cómo escalan los extractores
+"""
+
+import argparse
+import os
+import time
+
+import numpy as np
+from openpyxl import Workbook
+
+from cis_estudios import AvanceGenerales, AvanceAutonomicas
+
+SALIDA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "sinteticos")
+
+TIPOS = ('generales', 'autonomicas', 'barometro')
+
+# Parámetros de tamaño predefinidos (bloques, filas por bloque, cruces extra, columnas por cruce)
+ESCALAS = {
+    'pequeno': {'preguntas': 40, 'filas': 8, 'cruces': 0, 'columnas': 8},
+    'mediano': {'preguntas': 120, 'filas': 8, 'cruces': 4, 'columnas': 12},
+    'grande': {'preguntas': 400, 'filas': 10, 'cruces': 20, 'columnas': 30},
+    'enorme': {'preguntas': 1000, 'filas': 12, 'cruces': 60, 'columnas': 60},
+}
+
+# Etiqueta con la que el CIS publica cada partido (todas se normalizan a la clave canónica)
+ETIQUETAS = {
+    'PP': 'PP', 'PSOE': 'PSOE', 'VOX': 'VOX', 'SUMAR': 'Sumar', 'PODEMOS': 'Podemos',
+    'SALF': 'Se Acabó la Fiesta', 'ERC': 'ERC', 'JUNTS': 'Junts', 'BILDU': 'EH Bildu',
+    'PNV': 'EAJ-PNV', 'BNG': 'BNG', 'CCA': 'CCa', 'UPN': 'UPN', 'CHA': 'CHA', 'PAR': 'PAR',
+    'TERUEL EXISTE': 'Teruel Existe', 'UPL': 'UPL', 'Soria Ya': 'Soria ¡Ya!',
+    'Por Ávila': 'Por Ávila', 'JUNTOS-LEVANTA': 'Juntos-Levanta'
+}
+
+# Texto de la ficha técnica por comunidad (crear_estudio detecta la comunidad en ella)
+NOMBRES_COMUNIDAD = {
+    'ARAGON': 'Aragón', 'EXTREMADURA': 'Extremadura', 'CASTILLA Y LEON': 'Castilla y León'
+}
+
+NO_PARTIDOS_RV = ['En blanco', 'Voto nulo', 'No tenía edad', 'No votó', 'No recuerda', 'N.C.']
+NO_PARTIDOS_INTENCION = ['Otros partidos', 'En blanco', 'Voto nulo', 'No votaría', 'No sabe todavía', 'N.C.']
+
+CRUCES_FIJOS = {
+    'Sexo': ('Sexo de la persona entrevistada', ['Hombre', 'Mujer']),
+    'Edad': ('Edad de la persona entrevistada',
+             ['18-24 años', '25-34 años', '35-44 años', '45-54 años', '55-64 años', '65 y más años']),
+    'Tamaño de municipio': ('Tamaño de municipio',
+                            ['Menos o igual a 2.000 habitantes', '2.001 a 10.000 habitantes',
+                             '10.001 a 50.000 habitantes', '50.001 a 100.000 habitantes',
+                             '100.001 a 400.000 habitantes', '400.001 a 1.000.000 habitantes',
+                             'Más de 1.000.000 habitantes']),
+    'Escala de ideología': ('Escala de autoubicación ideológica (1-10)',
+                            ['1 Izquierda'] + [str(i) for i in range(2, 10)] + ['10 Derecha', 'N.S.', 'N.C.']),
+}
+
+MESES = ['enero', 'febrero', 'marzo', 'abril', 'mayo', 'junio', 'julio', 'agosto',
+         'septiembre', 'octubre', 'noviembre', 'diciembre']
+
+
+class Generador:
+    """Genera un estudio sintético con valores aleatorios reproducibles (semilla)."""
+
+    def __init__(self, tipo: str = 'generales', estudio: str = '3599', comunidad: str = 'ARAGON',
+                 preguntas: int = 15, filas: int = 6, cruces: int = 0, columnas: int = 8,
+                 partidos: int = None, n: int = 4000, semilla: int = 0):
+        if tipo not in TIPOS:
+            raise ValueError(f"Tipo desconocido: {tipo} (usar {', '.join(TIPOS)})")
+        self.tipo = tipo
+        self.estudio = str(estudio)
+        self.comunidad = comunidad.upper()
+        self.preguntas = max(0, preguntas)
+        self.filas = max(2, filas)
+        self.cruces = max(0, cruces)
+        self.columnas = max(2, columnas)
+        self.n = n
+        self.rng = np.random.default_rng(semilla)
+
+        if tipo == 'autonomicas':
+            referencia = AvanceAutonomicas.VOTO_REAL_AUTONOMICAS.get(self.comunidad) or \
+                AvanceAutonomicas.VOTO_REAL_AUTONOMICAS['ARAGON']
+        else:
+            referencia = AvanceGenerales.VOTO_REAL_2023
+        reales = sorted(((p, v) for p, v in referencia.items()
+                         if p not in ('En Blanco', 'Voto Nulo', 'OTROS') and v > 0), key=lambda x: -x[1])
+        if partidos is not None and partidos < len(reales):
+            reales = reales[:max(2, partidos)]
+        extra = max(0, (partidos or 0) - len(reales))
+        # Candidaturas ficticias de poco peso para estresar el número de columnas de los RV
+        reales += [(f'Candidatura {k + 1}', 0.3) for k in range(extra)]
+        self.partidos = [ETIQUETAS.get(p, p) for p, _ in reales]
+        cuotas = np.array([v for _, v in reales], dtype=float)
+        self.cuotas = self._ruido(cuotas / cuotas.sum(), 0.1)
+
+        titulos = {'generales': 'AVANCE DE RESULTADOS ELECCIONES GENERALES',
+                   'autonomicas': 'PREELECTORAL ELECCIONES AUTONÓMICAS',
+                   'barometro': 'BARÓMETRO'}
+        self.titulo = f"{self.estudio}/0 {titulos[tipo]} (SINTÉTICO)"
+        self.mes = MESES[int(self.rng.integers(12))]
+        self.voto = self._voto_directo()
+
+    # --- valores ---
+
+    def _ruido(self, v: np.ndarray, escala: float) -> np.ndarray:
+        """Reparte de nuevo `v` (que suma 1) con ruido relativo `escala`."""
+        r = v * self.rng.lognormal(0, escala, len(v))
+        return r / r.sum()
+
+    def _porcentajes(self, filas: int, columnas: int) -> np.ndarray:
+        """Matriz filas x columnas de porcentajes que suman 100 por columna."""
+        return (self.rng.dirichlet(np.ones(filas), columnas).T * 100).round(6)
+
+    def _ns(self, columnas: int) -> np.ndarray:
+        pesos = self.rng.dirichlet(np.ones(columnas))
+        return (pesos * self.n).round(6)
+
+    def _voto_directo(self) -> list:
+        """[(etiqueta, voto directo % censo, estimación % voto válido)] incluida la no respuesta."""
+        directo = self.cuotas * 70 * self.rng.uniform(0.85, 1.15, len(self.cuotas))
+        estimacion = self._ruido(self.cuotas, 0.05) * 97
+        filas = [(p, round(float(d), 1), round(float(e), 1)) for p, d, e in zip(self.partidos, directo, estimacion)]
+        resto = 100 - sum(f[1] for f in filas)
+        reparto = self.rng.dirichlet([3, 1.5, 6, 12, 2]) * resto
+        filas += [('Otros partidos', round(float(reparto[0]), 1), round(float(97 - estimacion.sum() + 2), 1)),
+                  ('En blanco', round(float(reparto[1]), 1), 1.0),
+                  ('Voto Nulo', round(float(reparto[2]) / 4, 1), None),
+                  ('Abstención ("No votaría")', round(float(reparto[2]) * 3 / 4, 1), None),
+                  ('No sabe', round(float(reparto[3]), 1), None),
+                  ('No contesta', round(float(reparto[4]), 1), None)]
+        return filas
+
+    # --- hojas ---
+
+    def _cabecera(self, hoja, subtitulo: str):
+        hoja.append([])
+        hoja.append([None, self.titulo])
+        hoja.append([None, 'AVANCE DE RESULTADOS'])
+        hoja.append([None, subtitulo])
+
+    def _ficha(self, hoja):
+        self._cabecera(hoja, 'FICHA TÉCNICA DEL ESTUDIO')
+        if self.tipo == 'autonomicas':
+            ambito = f"{NOMBRES_COMUNIDAD.get(self.comunidad, self.comunidad.title())}   (aut.)."
+        else:
+            ambito = 'Nacional.'
+        dia = int(self.rng.integers(1, 20))
+        for fila in [[], ['FICHA TÉCNICA'], [],
+                     ['Ámbito', ambito],
+                     ['Universo', 'Población española con derecho a voto de ambos sexos de 18 años y más.'],
+                     ['Tamaño de la muestra:'],
+                     ['Diseñada', f"{self.n:,} entrevistas.".replace(',', '.')],
+                     ['Realizada', f"{self.n:,} entrevistas.".replace(',', '.')],
+                     ['Error muestral', 'Para un nivel de confianza del 95,5% (dos sigmas), y P = Q.'],
+                     ['Fecha de realización', f"Del {dia} al {dia + 4} de {self.mes} de 2026."]]:
+            hoja.append(fila)
+
+    def _estimacion(self, hoja):
+        self._cabecera(hoja, 'ESTIMACIÓN DE VOTO')
+        hoja.append([])
+        hoja.append([])
+        hoja.append([None, f"{self.titulo.split(' ', 1)[1].title()}. N={self.n}"])
+        hoja.append([None, 'Voto directo en la encuesta (en % sobre censo)', 'Margen teórico de error*',
+                     'Estimación de voto CIS (en % sobre voto válido)'])
+        for etiqueta, directo, estimacion in self.voto:
+            margen = f"±{2 * np.sqrt(max(directo, 0.01) * (100 - directo) / self.n):.1f}".replace('.', ',')
+            hoja.append([etiqueta, directo, margen, estimacion])
+        hoja.append(['(N)', self.n])
+        hoja.append([])
+        hoja.append(['Como consecuencia del efecto de redondeo, el total puede no sumar 100.'])
+        hoja.append(['* Intervalo de confianza (95%).'])
+
+    def _bloques(self):
+        """Bloques (identificador, texto, respuestas) de las hojas de resultados y cruces."""
+        yield 'Pregunta A1', 'Sexo:', ['Hombre', 'Mujer']
+        yield 'Pregunta A2', '¿Qué edad tiene Ud.?', CRUCES_FIJOS['Edad'][1]
+        previas = min(self.preguntas, 10)
+        for k in range(1, previas + 1):
+            yield f'Pregunta {k}', f'Texto de la pregunta sintética {k}.', self._respuestas(k)
+        yield ('Pregunta 11', 'Y si mañana se celebrasen elecciones, ¿a qué partido o coalición votaría Ud. '
+               'en las próximas elecciones? (Respuesta espontánea).', self.partidos + NO_PARTIDOS_INTENCION)
+        yield ('Pregunta 12', 'En el caso de que por cualquier razón finalmente no votase por ese partido, '
+               '¿a qué otro partido votaría Ud.? (Segunda opción).', self.partidos + ['Ninguno', 'N.C.'])
+        for k in range(13, self.preguntas + 3):
+            yield f'Pregunta {k}', f'Texto de la pregunta sintética {k}.', self._respuestas(k)
+
+    def _respuestas(self, k: int) -> list:
+        return [f'Respuesta {i + 1} a la pregunta {k}' for i in range(self.filas - 2)] + ['N.S.', 'N.C.']
+
+    def _resultados(self, hoja):
+        self._cabecera(hoja, 'INFORME DE MARGINALES')
+        for ident, texto, respuestas in self._bloques():
+            hoja.append([ident])
+            hoja.append([texto])
+            if ident == 'Pregunta 11':
+                valores = [d for _, d, _ in self.voto]
+            else:
+                valores = self._porcentajes(len(respuestas), 1)[:, 0]
+            for r, v in zip(respuestas, valores):
+                hoja.append([r, float(v)])
+            hoja.append(['(N)', self.n])
+            hoja.append([])
+            hoja.append([])
+
+    def _cruce(self, hoja, titulo: str, categorias: list, ns: np.ndarray = None):
+        """Hoja de cruce: cada bloque con TOTAL + una columna por categoría y fila (N)."""
+        self._cabecera(hoja, f"CRUCE POR {titulo.upper()}")
+        ns = self._ns(len(categorias)) if ns is None else ns
+        for ident, texto, respuestas in self._bloques():
+            hoja.append([ident])
+            hoja.append([texto])
+            hoja.append([None, None, titulo])
+            hoja.append([None, 'TOTAL'] + categorias)
+            total = self._porcentajes(len(respuestas), 1)[:, 0]
+            celdas = self._porcentajes(len(respuestas), len(categorias))
+            for r, t, fila in zip(respuestas, total, celdas.tolist()):
+                hoja.append([r, float(t)] + fila)
+            hoja.append(['(N)', float(self.n)] + ns.tolist())
+            hoja.append([])
+            hoja.append([])
+
+    def _ns_recuerdo(self) -> np.ndarray:
+        """(N) por columna de los RV: recuerdo de los partidos cercano al resultado real."""
+        votantes = self.n * 0.72
+        partidos = self._ruido(self.cuotas, 0.15) * votantes
+        resto = self._ruido(np.array([0.03, 0.03, 0.12, 0.5, 0.25, 0.07]), 0.1) * (self.n - votantes)
+        return np.concatenate([partidos, resto]).round(6)
+
+    def _contenidos(self, hoja, hojas: list):
+        self._cabecera(hoja, '')
+        hoja.append(['ÍNDICE DE CONTENIDOS'])
+        for nombre in hojas:
+            hoja.append([f'☞ {nombre}', nombre])
+
+    # --- salida ---
+
+    def nombre_base(self) -> str:
+        """Nombre del libro sin extensión, con el sufijo de su variante en cis_catalogo.VARIANTES."""
+        if self.tipo == 'barometro':
+            return f"{self.estudio}_multi"
+        return f"{self.estudio}_multi_A"
+
+    def hojas(self) -> list:
+        """Nombres de las hojas en el orden del libro."""
+        hojas = ['Ficha técnica']
+        if self.tipo == 'autonomicas':
+            hojas.append(f"Resultados {NOMBRES_COMUNIDAD.get(self.comunidad, self.comunidad.title())}")
+        else:
+            hojas.append('Resultados')
+        hojas += list(CRUCES_FIJOS)
+        if self.tipo == 'autonomicas':
+            hojas.append('RV EA23')
+        hojas.append('RV EG23')
+        hojas += [f'Cruce {k + 1}' for k in range(self.cruces)]
+        if self.tipo != 'barometro':
+            hojas.append('Estimación de Voto' if self.tipo == 'generales' else 'Estimación')
+        return hojas
+
+    def escribir(self, carpeta: str = SALIDA_DIR) -> list:
+        """Escribe el libro (y el PDF en modo barómetro). Devuelve las rutas generadas."""
+        os.makedirs(carpeta, exist_ok=True)
+        ruta = os.path.join(carpeta, self.nombre_base() + '.xlsx')
+        hojas = self.hojas()
+        wb = Workbook(write_only=True)
+        self._contenidos(wb.create_sheet('Contenidos'), hojas)
+        for nombre in hojas:
+            hoja = wb.create_sheet(nombre)
+            if nombre == 'Ficha técnica':
+                self._ficha(hoja)
+            elif nombre.startswith('Resultados'):
+                self._resultados(hoja)
+            elif nombre.startswith('Estimación'):
+                self._estimacion(hoja)
+            elif nombre.startswith('RV '):
+                eleccion = 'autonómicas' if nombre.startswith('RV EA') else 'generales'
+                self._cruce(hoja, f"Participación + Recuerdo de voto en elecciones {eleccion} 2023",
+                            self.partidos + NO_PARTIDOS_RV, self._ns_recuerdo())
+            elif nombre in CRUCES_FIJOS:
+                self._cruce(hoja, *CRUCES_FIJOS[nombre])
+            else:
+                self._cruce(hoja, f"Variable sintética {nombre.split()[-1]}",
+                            [f'Categoría {i + 1}' for i in range(self.columnas)])
+        wb.save(ruta)
+        rutas = [ruta]
+        if self.tipo == 'barometro':
+            rutas.append(self.escribir_pdf(os.path.join(carpeta, f"{self.estudio}_Estimacion.pdf")))
+        return rutas
+
+    def escribir_pdf(self, ruta: str) -> str:
+        """PDF de estimación con la tabla 'partido voto-directo ±margen estimación'."""
+        lineas = ['ESTIMACIÓN DE VOTO', f'Estudio nº {self.estudio} (sintético)', '']
+        for etiqueta, directo, estimacion in self.voto:
+            if estimacion is None:
+                continue
+            lineas.append(f"{etiqueta} {directo:.1f} ± {2 * np.sqrt(directo * (100 - directo) / self.n):.1f} "
+                          f"{estimacion:.1f}".replace('.', ','))
+        escribir_pdf_texto(ruta, lineas)
+        return ruta
+
+
+def escribir_pdf_texto(ruta: str, lineas: list):
+    """PDF mínimo de una página con líneas de texto Helvetica (sin dependencias externas)."""
+    def literal(texto):
+        return texto.encode('cp1252', 'replace').replace(b'\\', b'\\\\').replace(b'(', b'\\(').replace(b')', b'\\)')
+
+    contenido = b"BT /F1 11 Tf 14 TL 60 780 Td\n" + \
+        b"".join(b"(" + literal(l) + b") Tj T*\n" for l in lineas) + b"ET"
+    objetos = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+        b"/Resources << /Font << /F1 4 0 R >> >> /Contents 5 0 R >>",
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>",
+        b"<< /Length %d >>\nstream\n" % len(contenido) + contenido + b"\nendstream",
+    ]
+    salida = bytearray(b"%PDF-1.4\n")
+    posiciones = []
+    for i, obj in enumerate(objetos, 1):
+        posiciones.append(len(salida))
+        salida += b"%d 0 obj\n" % i + obj + b"\nendobj\n"
+    inicio_xref = len(salida)
+    salida += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objetos) + 1)
+    salida += b"".join(b"%010d 00000 n \n" % p for p in posiciones)
+    salida += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objetos) + 1, inicio_xref)
+    with open(ruta, 'wb') as f:
+        f.write(salida)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generador de libros CIS sintéticos para pruebas de carga")
+    parser.add_argument('--tipo', choices=TIPOS, default='generales')
+    parser.add_argument('--escala', choices=list(ESCALAS), default='pequeno',
+                        help="Tamaño predefinido (los parámetros explícitos lo sobrescriben)")
+    parser.add_argument('--estudio', default='3599', help="Número de estudio (35XX)")
+    parser.add_argument('--comunidad', default='ARAGON', help="Comunidad en modo autonómicas")
+    parser.add_argument('--preguntas', type=int, help="Bloques de preguntas por hoja")
+    parser.add_argument('--filas', type=int, help="Respuestas por bloque")
+    parser.add_argument('--cruces', type=int, help="Hojas de cruce genéricas adicionales")
+    parser.add_argument('--columnas', type=int, help="Categorías de cada cruce genérico")
+    parser.add_argument('--partidos', type=int, help="Número de partidos (se añaden candidaturas ficticias)")
+    parser.add_argument('--n', type=int, default=4000, help="Entrevistas realizadas")
+    parser.add_argument('--semilla', type=int, default=0)
+    parser.add_argument('--salida', default=SALIDA_DIR, help="Carpeta de salida")
+    args = parser.parse_args()
+
+    parametros = dict(ESCALAS[args.escala])
+    for clave in parametros:
+        if getattr(args, clave) is not None:
+            parametros[clave] = getattr(args, clave)
+    generador = Generador(args.tipo, args.estudio, args.comunidad, partidos=args.partidos,
+                          n=args.n, semilla=args.semilla, **parametros)
+    t0 = time.perf_counter()
+    for ruta in generador.escribir(args.salida):
+        print(f"{ruta}: {os.path.getsize(ruta) / 1048576:.2f} MB")
+    print(f"Generado en {time.perf_counter() - t0:.1f} s ({parametros})")
+
+
+if __name__ == "__main__":
+    main()
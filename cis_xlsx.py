@@ -0,0 +1,128 @@
+"""
+Lectura en streaming de libros .xlsx directamente desde el zip (sin pandas ni openpyxl).
+
+Pensado para pasadas baratas sobre la estructura (nombres de hoja, etiquetas de la
+columna A, anchura de cada fila): recorre el XML con iterparse y no construye
+DataFrames ni objetos de celda.
+"""
+
+import posixpath
+import re
+import zipfile
+import xml.etree.ElementTree as ET
+
+_NS = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+_NS_REL = '{http://schemas.openxmlformats.org/officeDocument/2006/relationships}'
+_REF = re.compile(r'([A-Z]+)(\d+)')
+
+
+def columna_a_indice(letras: str) -> int:
+    """'A' -> 0, 'Z' -> 25, 'AA' -> 26."""
+    n = 0
+    for c in letras:
+        n = n * 26 + ord(c) - 64
+    return n - 1
+
+
+def hojas(zf: zipfile.ZipFile) -> list:
+    """[(nombre, ruta xml dentro del zip)] en el orden del libro."""
+    rels = {}
+    with zf.open('xl/_rels/workbook.xml.rels') as f:
+        for rel in ET.parse(f).getroot():
+            destino = rel.get('Target')
+            if destino.startswith('/'):
+                destino = destino[1:]
+            else:
+                destino = posixpath.normpath(posixpath.join('xl', destino))
+            rels[rel.get('Id')] = destino
+    with zf.open('xl/workbook.xml') as f:
+        raiz = ET.parse(f).getroot()
+    return [(h.get('name'), rels.get(h.get(_NS_REL + 'id'))) for h in raiz.iter(_NS + 'sheet')]
+
+
+def nombres_hojas(path: str) -> list:
+    """Nombres de las hojas leyendo solo workbook.xml (milisegundos, sin abrir las hojas)."""
+    with zipfile.ZipFile(path) as zf:
+        with zf.open('xl/workbook.xml') as f:
+            return [h.get('name') for h in ET.parse(f).getroot().iter(_NS + 'sheet')]
+
+
+def cadenas_compartidas(zf: zipfile.ZipFile) -> list:
+    """Tabla sharedStrings (texto plano de cada entrada, uniendo los fragmentos con formato)."""
+    if 'xl/sharedStrings.xml' not in zf.namelist():
+        return []
+    cadenas = []
+    with zf.open('xl/sharedStrings.xml') as f:
+        for _, elem in ET.iterparse(f):
+            if elem.tag == _NS + 'si':
+                cadenas.append(''.join(t.text or '' for t in elem.iter(_NS + 't')))
+                elem.clear()
+    return cadenas
+
+
+def _valor(c, cadenas):
+    tipo = c.get('t')
+    if tipo == 'inlineStr':
+        return ''.join(t.text or '' for t in c.iter(_NS + 't'))
+    v = c.find(_NS + 'v')
+    if v is None or v.text is None:
+        return None
+    if tipo == 's':
+        return cadenas[int(v.text)]
+    if tipo in ('str', 'e'):
+        return v.text
+    if tipo == 'b':
+        return v.text == '1'
+    # Igual que openpyxl: entero salvo que lleve decimales o exponente
+    try:
+        if '.' in v.text or 'E' in v.text or 'e' in v.text:
+            return float(v.text)
+        return int(v.text)
+    except ValueError:
+        return v.text
+
+
+def filas(zf: zipfile.ZipFile, ruta_xml: str, cadenas: list, columnas=None):
+    """Itera (fila, {col: valor}, ancho) por cada fila con algún valor (índices base 0).
+
+    `columnas`: conjunto de índices de columna cuyos valores interesan (None = todas);
+    el ancho (última columna con valor + 1) se calcula siempre.
+    """
+    fila = -1
+    with zf.open(ruta_xml) as f:
+        for _, elem in ET.iterparse(f):
+            if elem.tag != _NS + 'row':
+                continue
+            # 'r' es opcional en filas y celdas: si falta, es la siguiente a la anterior
+            fila = int(elem.get('r')) - 1 if elem.get('r') else fila + 1
+            valores = {}
+            ancho = 0
+            col = -1
+            for c in elem:
+                m = _REF.match(c.get('r', ''))
+                col = columna_a_indice(m.group(1)) if m else col + 1
+                # Las celdas vacías o solo con formato no cuentan para el ancho (como en pandas)
+                valor = _valor(c, cadenas)
+                if valor is None or valor == '':
+                    continue
+                ancho = col + 1
+                if columnas is None or col in columnas:
+                    valores[col] = valor
+            elem.clear()
+            if ancho:
+                yield fila, valores, ancho
+
+
+def primeras_filas(path: str, hoja: str, n: int) -> list:
+    """[(fila, {col: valor})] de las primeras `n` filas con datos de una hoja; deja de leer ahí."""
+    with zipfile.ZipFile(path) as zf:
+        ruta_xml = dict(hojas(zf)).get(hoja)
+        if ruta_xml is None:
+            return []
+        cadenas = cadenas_compartidas(zf)
+        resultado = []
+        for fila, valores, _ in filas(zf, ruta_xml, cadenas):
+            resultado.append((fila, valores))
+            if len(resultado) >= n:
+                break
+        return resultado
@@ -1,9 +1,15 @@
 """
 Script de diagnóstico profundo de la estructura de archivos CIS.
 Analiza CADA archivo Excel para entender las diferencias.
+
+Lee los libros en streaming (cis_xlsx) y usa las huellas estructurales de
+cis_huellas: no carga ninguna hoja con pandas.
 """
-import pandas as pd
 import os
+import zipfile
+
+import cis_xlsx
+from cis_huellas import cargar_huella
 
 DATA_DIR = "data/cis_studies"
 files = [f for f in os.listdir(DATA_DIR) if f.endswith('.xlsx') and not f.startswith('~$')]
@@ -17,35 +23,41 @@ for filename in sorted(files):
     print(f"\n{'='*80}")
     print(f"ARCHIVO: {filename}")
     print(f"{'='*80}")
-    
+
     try:
-        xl = pd.ExcelFile(filepath)
-        print(f"Hojas disponibles: {xl.sheet_names}")
-        
+        huella = cargar_huella(filepath)
+        print(f"Hojas disponibles: {list(huella['hojas'])}")
+        print(f"Tipo de estudio: {huella['tipo']} (huella {huella['huella']})")
+
         # Buscar hoja de Estimación
         hoja_estim = None
-        for sheet in xl.sheet_names:
+        for sheet in huella['hojas']:
             if 'estimaci' in sheet.lower() or 'estimación' in sheet.lower():
                 hoja_estim = sheet
                 break
-        
+
         print(f"Hoja de Estimación encontrada: {hoja_estim}")
-        
+
         if hoja_estim:
-            df = pd.read_excel(xl, sheet_name=hoja_estim, header=None)
-            print(f"Dimensiones: {df.shape[0]} filas x {df.shape[1]} columnas")
-            
+            forma = huella['hojas'][hoja_estim]
+            print(f"Dimensiones: {forma['filas']} filas x {forma['columnas']} columnas")
+
             # Mostrar primeras filas con datos en columna 0
             print("\nPrimeras filas con datos:")
-            for i in range(min(25, len(df))):
-                if pd.notna(df.iloc[i, 0]) and str(df.iloc[i, 0]).strip():
-                    col0 = str(df.iloc[i, 0])[:25]
-                    col1 = str(df.iloc[i, 1])[:12] if len(df.columns) > 1 and pd.notna(df.iloc[i, 1]) else "N/A"
-                    col3 = str(df.iloc[i, 3])[:12] if len(df.columns) > 3 and pd.notna(df.iloc[i, 3]) else "N/A"
-                    print(f"  Fila {i}: col0='{col0}' | col1='{col1}' | col3='{col3}'")
+            with zipfile.ZipFile(filepath) as zf:
+                ruta = dict(cis_xlsx.hojas(zf))[hoja_estim]
+                cadenas = cis_xlsx.cadenas_compartidas(zf)
+                for i, valores, _ in cis_xlsx.filas(zf, ruta, cadenas, columnas={0, 1, 3}):
+                    if i >= 25:
+                        break
+                    if str(valores.get(0, '')).strip():
+                        col0 = str(valores[0])[:25]
+                        col1 = str(valores[1])[:12] if 1 in valores else "N/A"
+                        col3 = str(valores[3])[:12] if 3 in valores else "N/A"
+                        print(f"  Fila {i}: col0='{col0}' | col1='{col1}' | col3='{col3}'")
         else:
             print("NO HAY HOJA DE ESTIMACIÓN - Este archivo requiere PDF externo")
-            
+
     except Exception as e:
         print(f"ERROR: {e}")
 
@@ -1,6 +1,8 @@
 
 import pandas as pd
+import os
 import sys
+from cis_indice_texto import cargar_indice
 
 # Encoding fix
 sys.stdout.reconfigure(encoding='utf-8')
@@ -32,27 +34,26 @@ try:
              f.write(df_rv.head(20).to_string())
              f.write("\n-------------------\n")
 
-        # Search for Intention Questions in Resultados
+        # Search for Intention Questions in Resultados (índice de texto: sin releer la hoja)
         sheet = 'Resultados'
         if sheet in xl.sheet_names:
              f.write(f"\n--- Searching {sheet} for Vote Intention ---\n")
-             df = pd.read_excel(xl, sheet_name=sheet)
-             # Search for keywords
+             indice = cargar_indice(file_path)
+             archivo = os.path.basename(file_path)
              keywords = ["Si mañana se celebrasen", "intención de voto", "+ simpatía", "VOTO+SIMPATÍA"]
              for key in keywords:
-                 # Use regex=False to avoid errors with '+'
-                 matches = df[df.apply(lambda row: row.astype(str).str.contains(key, case=False, regex=False).any(), axis=1)]
-                 if not matches.empty:
+                 matches = [h for h in indice.buscar(key, contexto=0, archivo=archivo, hoja=sheet) if h['hoja'] == sheet]
+                 if matches:
                      f.write(f"Found '{key}' at rows:\n")
-                     f.write(matches.head(10).to_string())
-                     f.write("\n")
+                     for h in matches[:10]:
+                         f.write(f"  R{h['fila']} C{h['col']}: {h['texto']}\n")
                      
                      # Print context around first match
-                     first_idx = matches.index[0]
-                     start = max(0, first_idx - 5)
-                     end = min(len(df), first_idx + 40) # Show 40 rows to see the options
+                     first_idx = matches[0]['fila']
                      f.write(f"Context for first '{key}' match:\n")
-                     f.write(df.iloc[start:end].to_string())
+                     # Show 40 rows to see the options
+                     for i, valores in indice.filas(archivo, sheet, max(0, first_idx - 5), first_idx + 40):
+                         f.write(f"  R{i}: " + " | ".join(valores) + "\n")
                      f.write("\n-------------------\n")
              
     print(f"Done. Wrote to {output_file}")
@@ -0,0 +1,210 @@
+"""
+Regresión contra resultados dorados (golden) de todos los estudios del corpus.
+
+Calcula en paralelo (un proceso por libro) el bundle completo de extracción y
+estimación de cada estudio (engine_v2.get_study_bundle: ficha, voto directo,
+recuerdo, estimación CIS, factores K, configuración y Aldabón-Gemini) y lo compara
+con data/golden/<archivo>.json con tolerancias por campo. El campo 'sin_rv' fija
+además la estimación del estudio como si no tuviera hoja RV (Φ y transvases por
+defecto, matriz de sector de su cruce de ideología) con MOMENTUM_PRUEBA, y
+'sin_blanco' la de sus insumos sin 'En Blanco' en el voto directo, comprobando que
+el motor vectorial (cis_escenarios) coincide con el escalar. Imprime una línea por
+estudio y, si algo cambia, un diff compacto campo a campo.
+
+Uso:
+    python regresion_cis.py                        # comparar todo el corpus (exit 1 si hay cambios)
+    python regresion_cis.py --actualizar           # regenerar los golden tras un cambio intencionado
+    python regresion_cis.py data/cis_studies/3543-multi_A.xlsx --tolerancia aldabon_gemini=0.1
+"""
+
+import argparse
+import glob
+import json
+import math
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(ROOT_DIR, 'web_app'))
+
+from cis_cache import es_libro_valido
+
+GOLDEN_DIR = os.path.join(ROOT_DIR, "data", "golden")
+PATRON_CORPUS = os.path.join(ROOT_DIR, "data", "cis_studies", "*.xlsx")
+
+# Tolerancia absoluta por campo (ruta con puntos; se aplica la del prefijo más largo).
+# Los porcentajes publicados se redondean a 0.1: lo extraído debe coincidir exactamente;
+# los resultados calculados admiten solo ruido de coma flotante.
+TOLERANCIAS = {
+    '': 1e-9,
+    'aldabon_gemini': 1e-6,
+    'sin_rv': 1e-6,
+    'sin_blanco': 1e-6,
+    'k_factors': 1e-6,
+    'insumos.recuerdo': 1e-6,
+    'estimacion_cis': 0.0,
+    'insumos.voto_directo': 0.0,
+}
+
+# Líneas de diff por estudio antes de resumir
+MAX_DIFERENCIAS = 12
+
+# Momentum no neutro para que la matriz de sector intervenga en 'sin_rv'
+MOMENTUM_PRUEBA = {'PSOE': 0.9, 'PP': 1.1, 'VOX': 0.85, 'SUMAR': 1.05, 'En Blanco': 0.8}
+
+
+def estimacion_sin_rv(path: str) -> dict:
+    """Aldabón-Gemini del estudio sin coeficientes de la hoja RV (solo el cruce de ideología)."""
+    from cis_estudios import crear_estudio
+    estudio = crear_estudio(path)
+    estudio._cache['coeficientes_transferencia'] = {}
+    return {
+        'sector_ideologico': bool(estudio.sector_ideologico()),
+        'aldabon_gemini': estudio.calcular_aldabon_gemini(),
+        'escenario': estudio.calcular_aldabon_gemini(custom_momentum=MOMENTUM_PRUEBA)
+    }
+
+
+def estimacion_sin_blanco(bundle: dict) -> dict:
+    """Motores escalar y vectorial con 'En Blanco' solo como destino de transvases (y
+    origen de la matriz de sector): Φ a la mitad para que su masa pese tras redondear."""
+    from cis_escenarios import construir_modelo
+    from cis_estudios import estimar_aldabon_gemini
+    from engine_v2 import _test_vector
+    insumos = dict(bundle['insumos'])
+    insumos['voto_directo'] = {p: v for p, v in insumos['voto_directo'].items() if p != 'En Blanco'}
+    modelo = construir_modelo(insumos)
+    momentum, _ = _test_vector(modelo)
+    fidelidad = {p: float(f) * 0.5 for p, f in zip(modelo.categorias[:modelo.n_base], modelo.fidelidad)}
+    config = dict(insumos['config'], fidelidad={**insumos['config']['fidelidad'], **fidelidad})
+    esperado = estimar_aldabon_gemini(insumos['voto_directo'], insumos['recuerdo'],
+                                      insumos['partidos_ref'], config, custom_momentum=momentum)
+    valores, _ = modelo.evaluar(modelo.vector(momentum, modelo.momentum),
+                                modelo.vector(fidelidad, modelo.fidelidad))
+    return {'aldabon_gemini': esperado, 'vectorial_coincide': modelo.a_dicts(valores)[0] == esperado}
+
+
+def calcular(path: str) -> dict:
+    """Bundle de un estudio (se ejecuta en un proceso del pool)."""
+    import contextlib
+    import io
+    from engine_v2 import get_study_bundle
+    with contextlib.redirect_stdout(io.StringIO()):
+        bundle = get_study_bundle(path)
+        if bundle.get('status') == 'success':
+            bundle['sin_rv'] = estimacion_sin_rv(path)
+            bundle['sin_blanco'] = estimacion_sin_blanco(bundle)
+        return json.loads(json.dumps(bundle, ensure_ascii=False, default=float))
+
+
+def ruta_golden(path: str) -> str:
+    return os.path.join(GOLDEN_DIR, os.path.basename(path) + '.json')
+
+
+def tolerancia(ruta: str, tolerancias: dict) -> float:
+    mejor = ''
+    for prefijo in tolerancias:
+        if (ruta == prefijo or ruta.startswith(prefijo + '.')) and len(prefijo) > len(mejor):
+            mejor = prefijo
+    return tolerancias.get(mejor, TOLERANCIAS[''])
+
+
+def comparar(golden, actual, tolerancias: dict = TOLERANCIAS, ruta: str = '') -> list:
+    """[(campo, golden, actual)] de los valores que difieren más de su tolerancia."""
+    if isinstance(golden, dict) and isinstance(actual, dict):
+        cambios = []
+        for k in sorted(set(golden) | set(actual), key=str):
+            sub = f"{ruta}.{k}" if ruta else str(k)
+            if k not in actual:
+                cambios.append((sub, golden[k], '(falta)'))
+            elif k not in golden:
+                cambios.append((sub, '(nuevo)', actual[k]))
+            else:
+                cambios += comparar(golden[k], actual[k], tolerancias, sub)
+        return cambios
+    if isinstance(golden, list) and isinstance(actual, list) and len(golden) == len(actual):
+        cambios = []
+        for i, (g, a) in enumerate(zip(golden, actual)):
+            cambios += comparar(g, a, tolerancias, f"{ruta}[{i}]")
+        return cambios
+    numeros = (int, float)
+    if isinstance(golden, numeros) and isinstance(actual, numeros) \
+            and not isinstance(golden, bool) and not isinstance(actual, bool):
+        if math.isnan(golden) and math.isnan(actual):
+            return []
+        return [] if abs(golden - actual) <= tolerancia(ruta, tolerancias) else [(ruta, golden, actual)]
+    return [] if golden == actual else [(ruta, golden, actual)]
+
+
+def _corto(valor) -> str:
+    texto = json.dumps(valor, ensure_ascii=False) if not isinstance(valor, str) else valor
+    return texto if len(texto) <= 40 else texto[:37] + '...'
+
+
+def formato_diff(cambios: list) -> str:
+    lineas = []
+    for campo, antes, despues in cambios[:MAX_DIFERENCIAS]:
+        delta = ''
+        if isinstance(antes, (int, float)) and isinstance(despues, (int, float)) and not isinstance(antes, bool):
+            delta = f"  (Δ {despues - antes:+.4g})"
+        lineas.append(f"      {campo}: {_corto(antes)} -> {_corto(despues)}{delta}")
+    if len(cambios) > MAX_DIFERENCIAS:
+        lineas.append(f"      ... y {len(cambios) - MAX_DIFERENCIAS} diferencias más")
+    return "\n".join(lineas)
+
+
+def ejecutar(archivos: list, procesos: int = None) -> dict:
+    """{ruta: bundle} calculados en paralelo."""
+    with ProcessPoolExecutor(max_workers=procesos or min(len(archivos), os.cpu_count() or 2)) as pool:
+        return dict(zip(archivos, pool.map(calcular, archivos)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Regresión de extracción y estimación contra golden JSON")
+    parser.add_argument('archivos', nargs='*', help="Libros a comprobar (por defecto, todo data/cis_studies)")
+    parser.add_argument('--actualizar', action='store_true', help="Reescribir los golden con los resultados actuales")
+    parser.add_argument('--procesos', type=int, help="Procesos en paralelo (por defecto, uno por libro)")
+    parser.add_argument('--tolerancia', action='append', default=[], metavar='CAMPO=VALOR',
+                        help="Tolerancia absoluta para un campo (repetible)")
+    args = parser.parse_args()
+
+    tolerancias = dict(TOLERANCIAS)
+    for t in args.tolerancia:
+        campo, _, valor = t.partition('=')
+        tolerancias[campo] = float(valor)
+
+    archivos = args.archivos or sorted(p for p in glob.glob(PATRON_CORPUS) if es_libro_valido(p))
+    t0 = time.perf_counter()
+    resultados = ejecutar(archivos, args.procesos)
+
+    con_cambios = 0
+    for path, actual in resultados.items():
+        nombre = os.path.basename(path)
+        ruta = ruta_golden(path)
+        if args.actualizar:
+            os.makedirs(GOLDEN_DIR, exist_ok=True)
+            with open(ruta, 'w', encoding='utf-8') as f:
+                json.dump(actual, f, ensure_ascii=False, indent=1, sort_keys=True)
+            print(f"  {nombre:<22} golden actualizado")
+            continue
+        if not os.path.exists(ruta):
+            print(f"  {nombre:<22} SIN GOLDEN (usar --actualizar)")
+            con_cambios += 1
+            continue
+        with open(ruta, encoding='utf-8') as f:
+            golden = json.load(f)
+        cambios = comparar(golden, actual, tolerancias)
+        if cambios:
+            con_cambios += 1
+            print(f"  {nombre:<22} CAMBIA ({len(cambios)} campos)\n{formato_diff(cambios)}")
+        else:
+            print(f"  {nombre:<22} OK")
+
+    print(f"{len(resultados)} estudios en {time.perf_counter() - t0:.1f} s, {con_cambios} con cambios")
+    sys.exit(1 if con_cambios and not args.actualizar else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -6,7 +6,9 @@ import tempfile
 
 # Import new class-based module
 try:
-    from cis_estudios import crear_estudio, AvanceGenerales, AvanceAutonomicas, BarometroNacional
+    from cis_estudios import crear_estudio, AvanceGenerales, AvanceAutonomicas, BarometroNacional, HOJAS
+    from cis_memoria import texto_informe
+    import cis_catalogo
 except Exception as e:
     st.error(f"Error importing cis_estudios: {e}")
     st.stop()
@@ -29,17 +31,18 @@ st.markdown("""
 # --- SIDEBAR: SELECTOR Y SUBIDA ---
 st.sidebar.header("🗄️ Estudios Disponibles")
 
-# Listar estudios existentes (filtrar archivos temporales ~$)
-DATA_DIR = "data/cis_studies"
-if os.path.exists(DATA_DIR):
-    existing_files = [f for f in os.listdir(DATA_DIR) 
-                      if f.endswith('.xlsx') and not f.startswith('~$')]
-else:
-    existing_files = []
+# Listar estudios del catálogo (manifiesto en data/cache, sin abrir ningún libro)
+DATA_DIR = cis_catalogo.DATA_DIR
+catalogo = {e['archivo']: e for e in cis_catalogo.estudios(DATA_DIR)}
+
+def etiqueta_estudio(archivo):
+    e = catalogo[archivo]
+    detalle = e.get('comunidad') or e.get('clase') or ''
+    return f"{e['id']} · {detalle} · {archivo}" if detalle else archivo
 
 # Selector de estudio existente
-if existing_files:
-    selected_file = st.sidebar.selectbox("Seleccionar Estudio:", sorted(existing_files, reverse=True))
+if catalogo:
+    selected_file = st.sidebar.selectbox("Seleccionar Estudio:", list(catalogo), format_func=etiqueta_estudio)
     file_path = os.path.join(DATA_DIR, selected_file)
 else:
     st.sidebar.warning("No hay estudios disponibles")
@@ -74,7 +77,7 @@ st.sidebar.markdown("---")
 # --- ANÁLISIS Y VISUALIZACIÓN ---
 if file_path and os.path.exists(file_path):
     try:
-        estudio = crear_estudio(file_path)
+        estudio = crear_estudio(file_path, clasificacion=cis_catalogo.clasificacion(file_path))
         
         # Mostrar ficha técnica
         ficha = estudio.extraer_ficha_tecnica()
@@ -91,6 +94,7 @@ if file_path and os.path.exists(file_path):
         with st.sidebar.expander("⚙️ Configuración del Modelo", expanded=True):
             if st.button("🧹 Limpiar Caché y Recargar"):
                 st.cache_data.clear()
+                HOJAS.clear()
                 st.rerun()
             
             try:
@@ -168,6 +172,14 @@ if file_path and os.path.exists(file_path):
             custom_momentum = momentum_values
             aldabon_gemini = estudio.calcular_aldabon_gemini(custom_momentum=custom_momentum)
             
+            # Etapa opcional: reparto de indecisos (se guarda por estudio en data/cache/indecisos)
+            asignar_indecisos = st.sidebar.checkbox(
+                "Asignar indecisos (NS/NC)", value=False,
+                help="Reparte No Sabe / No Contesta según simpatía y los cruces de ideología y recuerdo"
+            )
+            if asignar_indecisos:
+                aldabon_indecisos = estudio.calcular_aldabon_gemini(custom_momentum=custom_momentum, indecisos=True)
+            
             # Mostrar valores de momentum aplicados
             lam_display = " | ".join([f"{p}={v:.2f}" for p, v in momentum_values.items()])
             st.info(f"**Λ aplicados:** {lam_display}")
@@ -184,6 +196,9 @@ if file_path and os.path.exists(file_path):
                 'Aldabón-Gemini': [aldabon_gemini.get(p, 0) if p in cats_estimacion else 0 for p in parties],
             }
             
+            if asignar_indecisos:
+                table_data['Aldabón-Gemini + Indecisos'] = [aldabon_indecisos.get(p, 0) if p in cats_estimacion else 0 for p in parties]
+            
             df = pd.DataFrame(table_data)
             # Diferencia real: (Aldabón-Gemini - Estimación CIS)
             # Solo si la Estimación CIS es > 0, sino mostrar Aldabón-Gemini
@@ -198,6 +213,7 @@ if file_path and os.path.exists(file_path):
                     'Voto Directo (Crudo)': '{:.1f}%',
                     'Estimación CIS': '{:.1f}%',
                     'Aldabón-Gemini': '{:.1f}%',
+                    'Aldabón-Gemini + Indecisos': '{:.1f}%',
                     'Diff (Gemini - CIS)': '{:+.1f}%'
                 }).applymap(
                     lambda v: 'color: green' if v > 0 else 'color: red' if v < 0 else '',
@@ -205,6 +221,13 @@ if file_path and os.path.exists(file_path):
                 ),
                 use_container_width=True
             )
+            if asignar_indecisos:
+                asignacion = estudio.asignacion_indecisos()
+                if asignacion:
+                    st.caption(f"Indecisos repartidos con: {', '.join(asignacion['fuentes'])} "
+                               f"({asignacion['simpatia']:.0%} por simpatía)")
+                else:
+                    st.caption("Sin datos para repartir indecisos: la columna coincide con Aldabón-Gemini")
             
             # --- GRÁFICO DE BARRAS ---
             st.subheader("📈 Comparativa Visual")
@@ -380,3 +403,7 @@ else:
 st.markdown("---")
 st.markdown("*Desarrollado para análisis crítico de la 'cocina' electoral del CIS.*")
 
+
+# Memoria retenida por las cachés de este proceso (presupuesto: CIS_MEMORIA_MB)
+with st.sidebar.expander("🧠 Memoria", expanded=False):
+    st.code(texto_informe())
@@ -1,9 +1,38 @@
-from flask import Flask, render_template, jsonify, send_file
-from engine_v2 import get_cis_data
+from flask import Flask, render_template, jsonify, send_file, request, Response
+from engine_v2 import get_cis_data, get_study_bundle, get_study_scenario, get_study_model, get_study_model_state, batch_scenarios
+from cache import ResultCache, CachedPayload
+from pool import pool_from_env, PoolSaturated, ParseTimeout
+from cis_data_manager import get_study_file_by_id, list_study_ids
+import cis_catalogo
+from cis_memoria import CacheMemoria, informe as informe_memoria
+import asyncio
+import json
+import math
 import os
 
 app = Flask(__name__)
 
+# Cache de resultados en memoria (clave: ruta + mtime + tamaño del Excel), dentro del
+# presupuesto de memoria compartido (CIS_MEMORIA_MB, ver cis_memoria.py)
+result_cache = ResultCache(store=CacheMemoria('web_payloads'))
+
+# El parseo de Excel/PDF se hace en este pool acotado (procesos por defecto, ver pool.py),
+# nunca en el hilo de la petición
+parse_pool = pool_from_env()
+
+# Segundos que una petición espera al pool antes de responder 202 (el parseo sigue en segundo plano)
+PARSE_WAIT_SECONDS = 15
+
+# Segundos sugeridos al cliente cuando el pool está saturado o un parseo caducó (503)
+RETRY_AFTER_SECONDS = 5
+
+# Límite de escenarios por petición en /scenarios
+MAX_BATCH_SCENARIOS = 100000
+
+# Modelos vectorizados y su exportación JSON por versión del estudio (clave: ETag del bundle)
+study_models = CacheMemoria('web_modelos')
+model_states = CacheMemoria('web_estados_modelo')
+
 # Path to the CIS Excel file
 CIS_FILE = os.path.join(os.path.dirname(os.path.dirname(__file__)), '3540_avance.xlsx')
 
@@ -12,12 +41,247 @@ def index():
     return render_template('index.html')
 
 @app.route('/api/data')
-def api_data():
+async def api_data():
     """
     API endpoint to fetch the analysis data.
+    The payload is computed once per version of the Excel file and served with a
+    strong ETag, so repeated dashboard loads get a 304 without re-parsing the workbook.
+    """
+    future = result_cache.get_future(CIS_FILE, get_cis_data, namespace='api_data',
+                                     should_cache=_is_success, executor=parse_pool)
+    cached, error = await await_parse(future, "Datos del barómetro")
+    if error:
+        return error
+    return cached_response(cached)
+
+
+def cached_response(cached):
+    """Builds a JSON response with ETag that answers If-None-Match with 304."""
+    response = Response(cached.body, mimetype='application/json')
+    response.set_etag(cached.etag)
+    # Obliga al navegador a revalidar: barato (304) y nunca sirve datos obsoletos
+    response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
+
+def _is_success(payload):
+    return payload.get('status') == 'success'
+
+
+def study_bundle_future(study_id):
+    """Returns (future, error) for the cached extraction bundle of a study id."""
+    if not study_id.isdigit():
+        return None, "Identificador de estudio no válido."
+    path, status = get_study_file_by_id(study_id)
+    if not path:
+        return None, status
+    future = result_cache.get_future(path, get_study_bundle, namespace='study',
+                                     should_cache=_is_success, executor=parse_pool)
+    return future, None
+
+
+async def _wait_future(future, timeout):
+    """
+    Awaits a concurrent Future shared with other requests. Unlike wrap_future, giving up
+    never cancels it: the parse keeps running in the pool for the next request.
     """
-    data = get_cis_data(CIS_FILE)
-    return jsonify(data)
+    loop = asyncio.get_running_loop()
+    waiter = loop.create_future()
+
+    def _wake(_):
+        try:
+            loop.call_soon_threadsafe(lambda: waiter.done() or waiter.set_result(None))
+        except RuntimeError:
+            pass  # el loop de la petición ya terminó (respondió 202)
+    future.add_done_callback(_wake)
+    await asyncio.wait_for(waiter, timeout)
+    return future.result()
+
+
+async def await_parse(future, label):
+    """
+    Awaits (bounded) a parse Future from the pool without blocking the event loop.
+    Returns (CachedPayload, None) or (None, error response): 202 while the parse is
+    still running, 503 if the pool is saturated or the parse exceeded its time limit.
+    """
+    try:
+        cached = await _wait_future(future, PARSE_WAIT_SECONDS)
+    except asyncio.TimeoutError:
+        response = jsonify({"status": "pending", "message": f"{label} en proceso de carga."})
+        response.headers['Retry-After'] = '2'
+        return None, (response, 202)
+    except (PoolSaturated, ParseTimeout) as e:
+        response = jsonify({"status": "unavailable", "message": str(e)})
+        response.headers['Retry-After'] = str(RETRY_AFTER_SECONDS)
+        return None, (response, 503)
+    except Exception as e:
+        return None, (jsonify({"status": "error", "message": str(e)}), 500)
+    if not _is_success(cached.payload):
+        return None, (Response(cached.body, mimetype='application/json'), 500)
+    return cached, None
+
+
+async def wait_bundle(study_id):
+    """Waits (bounded) for a study bundle. Returns (CachedPayload, None) or (None, error response)."""
+    future, error = study_bundle_future(study_id)
+    if future is None:
+        return None, (jsonify({"status": "error", "message": error}), 404)
+    return await await_parse(future, f"Estudio {study_id}")
+
+
+@app.route('/api/studies')
+def api_studies():
+    """
+    Lists the studies of the catalogue. Does not open any workbook: metadata comes from
+    the last published catalogue manifest, 'pendiente' marks workbooks that are new or
+    changed since then (refreshed in the background) and 'cargado' tells whether the
+    study is already in the warm cache.
+    """
+    studies = []
+    for name, study_id in list_study_ids():
+        path, status = get_study_file_by_id(study_id)
+        entrada = cis_catalogo.buscar(study_id) or {}
+        studies.append({
+            "id": study_id,
+            "nombre": name,
+            "archivo": os.path.basename(path) if path else None,
+            "tipo_archivo": status if path else None,
+            "clase": entrada.get('clase'),
+            "comunidad": entrada.get('comunidad'),
+            "campo": entrada.get('campo'),
+            "n": entrada.get('n'),
+            "pdf": entrada.get('pdf') is not None,
+            "disponible": path is not None,
+            "pendiente": bool(entrada.get('pendiente')),
+            "cargado": bool(path) and result_cache.peek(path, namespace='study') is not None
+        })
+    return jsonify({"status": "success", "studies": studies, "parseos_pendientes": parse_pool.pending})
+
+
+@app.route('/api/memoria')
+def api_memoria():
+    """
+    Memory accounting of this server process: bytes per cache layer (payloads, models),
+    per live study and per cached sheet, against the shared budget (CIS_MEMORIA_MB).
+    Parse workers keep their own accounting (see their memoria.log reports).
+    """
+    return jsonify({"status": "success", **informe_memoria()})
+
+
+@app.route('/api/studies/<study_id>')
+async def api_study(study_id):
+    """Full extraction and default estimate of one study (cached, with ETag)."""
+    cached, error = await wait_bundle(study_id)
+    if error:
+        return error
+    return cached_response(cached)
+
+
+@app.route('/api/studies/<study_id>/scenario', methods=['GET', 'POST'])
+async def api_study_scenario(study_id):
+    """
+    Re-estimates a study with custom momentum (Λ) over the cached extraction.
+    GET: /api/studies/3543/scenario?PP=0.95&PSOE=1.05
+    POST: {"momentum": {"PP": 0.95, "PSOE": 1.05}}
+    """
+    if request.method == 'POST':
+        body = request.get_json(silent=True)
+        if body is None:
+            body = {}
+        if not isinstance(body, dict) or not isinstance(body.get('momentum', {}), dict):
+            return jsonify({"status": "error", "message": "Se requiere un objeto JSON con 'momentum' {partido: número}."}), 400
+        raw = body.get('momentum', {})
+    else:
+        raw = request.args.to_dict()
+    try:
+        momentum = {str(p): float(v) for p, v in raw.items()}
+    except (TypeError, ValueError, AttributeError):
+        return jsonify({"status": "error", "message": "Momentum debe ser un objeto {partido: número}."}), 400
+    if any(not (0.0 < v <= 3.0) for v in momentum.values()):
+        return jsonify({"status": "error", "message": "Los valores de Λ deben estar en (0, 3]."}), 400
+
+    cached, error = await wait_bundle(study_id)
+    if error:
+        return error
+    scenario = get_study_scenario(cached.payload, momentum)
+    scenario["study_id"] = study_id
+    return cached_response(CachedPayload(scenario))
+
+
+@app.route('/api/studies/<study_id>/scenarios', methods=['POST'])
+async def api_study_batch(study_id):
+    """
+    Evaluates many momentum (Λ) and optional fidelity (Φ) vectors in one vectorised pass.
+    Body: {"parties": ["PP", "PSOE"], "momentum": [[0.9, 1.1], ...], "fidelidad": [...] (optional),
+           "format": "columnar" | "ndjson"}
+    Rows may also be given as dicts ({"PP": 0.9}); parties not given keep the study default.
+    """
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict) or 'momentum' not in body:
+        return jsonify({"status": "error", "message": "Se requiere un objeto JSON con 'momentum'."}), 400
+    n_rows = len(body['momentum']) if isinstance(body['momentum'], list) else 1
+    if n_rows > MAX_BATCH_SCENARIOS:
+        return jsonify({"status": "error", "message": f"Máximo {MAX_BATCH_SCENARIOS} escenarios por petición."}), 413
+
+    cached, error = await wait_bundle(study_id)
+    if error:
+        return error
+    model = study_model(cached)
+    try:
+        categories, values = batch_scenarios(model, body['momentum'], body.get('fidelidad'), body.get('parties'))
+    except (ValueError, TypeError) as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+
+    wants_ndjson = body.get('format') == 'ndjson' or 'application/x-ndjson' in request.headers.get('Accept', '')
+    if wants_ndjson:
+        return Response(_ndjson_rows(study_id, categories, values), mimetype='application/x-ndjson')
+    columns = {cat: [None if math.isnan(v) else v for v in col] for cat, col in zip(categories, values.T.tolist())}
+    payload = {"status": "success", "study_id": study_id, "n": len(values),
+               "categorias": categories, "estimaciones": columns}
+    return Response(json.dumps(payload, ensure_ascii=False, separators=(',', ':')), mimetype='application/json')
+
+
+def study_model(cached):
+    """Vectorised model for a cached bundle, built once per bundle version."""
+    model = study_models.get(cached.etag)
+    if model is None:
+        model = study_models.setdefault(cached.etag, get_study_model(cached.payload))
+    return model
+
+
+@app.route('/api/studies/<study_id>/model')
+async def api_study_model(study_id):
+    """
+    Exports the precomputed model state (base vector, K, Φ, Λ, transvase and sector
+    matrices, abstention thresholds) so the dashboard can re-estimate locally.
+    The document carries a test vector checked against the Python engine.
+    """
+    cached, error = await wait_bundle(study_id)
+    if error:
+        return error
+    state = model_states.get(cached.etag)
+    if state is None:
+        payload = get_study_model_state(cached.payload, study_model(cached))
+        payload["study_id"] = study_id
+        state = CachedPayload(payload)
+        if not _is_success(payload):
+            return Response(state.body, mimetype='application/json'), 500
+        model_states[cached.etag] = state
+    return cached_response(state)
+
+
+def _ndjson_rows(study_id, categories, values, chunk=2000):
+    """Header line with the categories, then one JSON array per scenario (null = not applicable)."""
+    yield json.dumps({"study_id": study_id, "n": len(values), "categorias": categories}, ensure_ascii=False) + "\n"
+    for start in range(0, len(values), chunk):
+        rows = values[start:start + chunk].tolist()
+        yield "".join(json.dumps([None if math.isnan(v) else v for v in row]) + "\n" for row in rows)
+
+
+def warm_cache():
+    """Queues every available study in the parse pool so the first requests hit a warm cache."""
+    for _, study_id in list_study_ids():
+        study_bundle_future(study_id)
+
 
 @app.route('/report/download')
 def download_report():
@@ -35,7 +299,18 @@ def download_report():
     else:
         return "Informe no generado. Ejecute el análisis primero.", 404
 
+def warm_all():
+    """Warm cache for production start-up: every study plus the /api/data barometer."""
+    warm_cache()
+    result_cache.get_future(CIS_FILE, get_cis_data, namespace='api_data',
+                            should_cache=_is_success, executor=parse_pool)
+
+
 if __name__ == '__main__':
+    # Modo desarrollo. En producción: python wsgi.py (servidor WSGI con hilos, ver wsgi.py)
     print(f" * Servidor CIS Aldabón-Gemini iniciado")
     print(f" * Archivo de Datos: {CIS_FILE}")
+    # Con el reloader de debug solo el proceso hijo sirve peticiones: calentar solo ahí
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        warm_cache()
     app.run(debug=True, port=5000)
@@ -0,0 +1,122 @@
+import hashlib
+import json
+import os
+import threading
+from concurrent.futures import Future
+
+
+def file_signature(path):
+    """
+    Returns (absolute path, mtime_ns, size) for the file, or None if it does not exist.
+    Any change to the workbook (re-upload, sheet appended by cis_pdf_processor...) changes the signature.
+    """
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (os.path.abspath(path), st.st_mtime_ns, st.st_size)
+
+
+class CachedPayload:
+    """Serialised payload ready to be served: JSON body bytes plus its strong ETag."""
+
+    def __init__(self, payload):
+        self.payload = payload
+        self.body = json.dumps(payload, ensure_ascii=False, sort_keys=True, separators=(',', ':')).encode('utf-8')
+        self.etag = hashlib.sha256(self.body).hexdigest()[:32]
+
+
+class ResultCache:
+    """
+    In-process cache of computed payloads keyed by file path, mtime and size.
+
+    Concurrent cold requests for the same key are coalesced: the first caller
+    computes, the rest wait on the same Future, so only one parse runs.
+    """
+
+    def __init__(self, store=None):
+        """
+        `store` is the mapping that keeps the entries: a plain dict by default, or a
+        cis_memoria.CacheMemoria so the payloads count against the memory budget.
+        """
+        self._lock = threading.Lock()
+        self._entries = {} if store is None else store   # (path, namespace) -> (signature, CachedPayload)
+        self._inflight = {}  # (path, namespace, signature) -> Future
+
+    def get(self, path, compute, namespace='default', should_cache=None):
+        """
+        Returns the CachedPayload for `path`, calling `compute(path)` only when the
+        file changed (or was never computed). Payloads rejected by `should_cache`
+        (e.g. error responses) are returned but not stored.
+        """
+        return self.get_future(path, compute, namespace=namespace, should_cache=should_cache).result()
+
+    def get_future(self, path, compute, namespace='default', should_cache=None, executor=None):
+        """
+        Future-returning variant of get(). With an `executor`, the computation runs
+        in that pool and the caller can wait with a timeout instead of parsing itself.
+        """
+        future = Future()
+        signature = file_signature(path)
+        if signature is None:
+            # Sin fichero no hay firma: calcular siempre (el motor decide el error)
+            self._run(future, compute, path, executor)
+            return future
+
+        key = (signature[0], namespace)
+        flight_key = key + (signature,)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] == signature:
+                future.set_result(entry[1])
+                return future
+            if flight_key in self._inflight:
+                return self._inflight[flight_key]
+            self._inflight[flight_key] = future
+
+        def _store(f):
+            with self._lock:
+                self._inflight.pop(flight_key, None)
+                if f.exception() is None and (should_cache is None or should_cache(f.result().payload)):
+                    self._entries[key] = (signature, f.result())
+        future.add_done_callback(_store)
+        self._run(future, compute, path, executor)
+        return future
+
+    def peek(self, path, namespace='default'):
+        """Returns the cached entry if it is still current, without computing anything."""
+        signature = file_signature(path)
+        with self._lock:
+            entry = self._entries.get((signature[0], namespace)) if signature else None
+        return entry[1] if entry and entry[0] == signature else None
+
+    @staticmethod
+    def _run(future, compute, path, executor):
+        """Resolves `future` with CachedPayload(compute(path)), inline or in `executor`."""
+        def _finish(fn):
+            try:
+                future.set_result(CachedPayload(fn()))
+            except Exception as e:
+                future.set_exception(e)
+
+        if executor is None:
+            _finish(lambda: compute(path))
+            return
+
+        def _done(inner):
+            _finish(inner.result)
+        try:
+            executor.submit(compute, path).add_done_callback(_done)
+        except Exception as e:
+            # Pool lleno o roto: fallar el Future para que no quede registrado en vuelo
+            future.set_exception(e)
+
+    def invalidate(self, path=None):
+        """Drops every entry for `path` (or the whole cache if no path is given)."""
+        with self._lock:
+            if path is None:
+                self._entries.clear()
+                return
+            abs_path = os.path.abspath(path)
+            for key in [k for k in self._entries if k[0] == abs_path]:
+                del self._entries[key]
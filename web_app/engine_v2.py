@@ -1,5 +1,16 @@
 import pandas as pd
 import os
+import sys
+
+# Los módulos del proyecto (cis_estudios, cis_data_manager) viven en el directorio padre
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+from cis_estudios import crear_estudio, estimar_aldabon_gemini, calcular_factores_k
+from cis_catalogo import clasificacion
+from cis_escenarios import construir_modelo, MODELO_VERSION
+import numpy as np
 
 def get_cis_data(file_path):
     """
@@ -79,6 +90,131 @@ def get_cis_data(file_path):
     except Exception as e:
         return {"status": "error", "message": str(e)}
 
+def get_study_bundle(file_path, rastrillado=False):
+    """
+    Full extraction of one study through crear_estudio (real extractors, all parties).
+    Returns plain JSON-able data: the extraction inputs are kept so scenarios can be
+    recomputed later without opening the workbook again. With `rastrillado`, direct
+    vote and recall come from the raked weights (cis_raking) instead of the raw tables.
+    """
+    try:
+        # Clase y comunidad del manifiesto del catálogo: no se vuelve a detectar el tipo
+        estudio = crear_estudio(file_path, clasificacion=clasificacion(file_path))
+        insumos = estudio.extraer_insumos(rastrillado)
+        bundle = {
+            "status": "success",
+            "archivo": os.path.basename(file_path),
+            "tipo": type(estudio).__name__,
+            "ficha": estudio.extraer_ficha_tecnica(),
+            "hoja_rv": estudio.get_hoja_rv(),
+            "estimacion_cis": estudio.extraer_estimacion_cis(),
+            "aldabon_gemini": estimar_aldabon_gemini(**insumos),
+            "k_factors": calcular_factores_k(insumos['recuerdo'], insumos['partidos_ref']),
+            "insumos": insumos
+        }
+        if rastrillado:
+            bundle["rastrillado"] = {k: v for k, v in estudio.rastrillar().items()
+                                     if k not in ('voto_directo', 'recuerdo')}
+        return bundle
+    except Exception as e:
+        return {"status": "error", "message": str(e)}
+
+def get_study_scenario(bundle, momentum=None):
+    """Re-estimates a cached study bundle with custom momentum (Λ). Pure arithmetic."""
+    insumos = bundle["insumos"]
+    momentum_aplicado = dict(insumos["config"]["momentum"])
+    momentum_aplicado.update(momentum or {})
+    return {
+        "status": "success",
+        "momentum": momentum_aplicado,
+        "aldabon_gemini": estimar_aldabon_gemini(custom_momentum=momentum, **insumos)
+    }
+
+def _scenario_matrix(modelo, spec, default, parties=None, n=None):
+    """
+    Builds an N × categories matrix from the request spec:
+    a dict (same values for every scenario), a list of dicts, or a list of rows
+    aligned with `parties`. Missing parties keep the study default.
+    """
+    if isinstance(spec, dict):
+        spec = [spec] * (n or 1)
+    if not isinstance(spec, list) or not spec:
+        raise ValueError("Se esperaba una lista no vacía de escenarios.")
+    matrix = np.tile(default, (len(spec), 1))
+    if isinstance(spec[0], dict):
+        for i, row in enumerate(spec):
+            for party, value in row.items():
+                if party in modelo.categorias:
+                    matrix[i, modelo.categorias.index(party)] = float(value)
+    else:
+        if not parties:
+            raise ValueError("Las filas sin nombre requieren la lista 'parties'.")
+        cols = [modelo.categorias.index(p) if p in modelo.categorias else -1 for p in parties]
+        values = np.asarray(spec, dtype=float)
+        if values.ndim != 2 or values.shape[1] != len(parties):
+            raise ValueError("Cada fila debe tener un valor por partido de 'parties'.")
+        for k, col in enumerate(cols):
+            if col >= 0:
+                matrix[:, col] = values[:, k]
+    if n is not None and len(matrix) != n:
+        raise ValueError("Momentum y fidelidad deben tener el mismo número de escenarios.")
+    if not np.all(np.isfinite(matrix)) or np.any(matrix <= 0):
+        raise ValueError("Los coeficientes deben ser números positivos.")
+    return matrix
+
+def batch_scenarios(modelo, momentum, fidelidad=None, parties=None):
+    """
+    Evaluates many momentum (and optionally fidelity) vectors in one vectorised pass.
+    Returns (categories, values N × categories with NaN where a category does not apply).
+    """
+    lam = _scenario_matrix(modelo, momentum, modelo.momentum, parties)
+    fid = None
+    if fidelidad is not None:
+        fid = _scenario_matrix(modelo, fidelidad, modelo.fidelidad, parties, n=len(lam))
+    values, _ = modelo.evaluar(lam, fid)
+    return modelo.categorias, values
+
+def get_study_model(bundle):
+    """Vectorised model (cis_escenarios.ModeloAldabon) for a cached study bundle."""
+    return construir_modelo(bundle["insumos"])
+
+def _test_vector(modelo):
+    """
+    Fixed scenario used to check client evaluators: Λ cycles through the three
+    abstention bands plus gains, Φ is lowered 5% so transvases are exercised.
+    Λ also covers 'En Blanco' when it only appears as a transvase destination.
+    """
+    ciclo = [0.75, 1.2, 0.95, 0.85, 1.1]
+    base = modelo.categorias[:modelo.n_base]
+    momentum = {p: ciclo[i % len(ciclo)] for i, p in enumerate(modelo.categorias[:modelo.i_abst])}
+    fidelidad = {p: round(float(f) * 0.95, 4) for p, f in zip(base, modelo.fidelidad)}
+    return momentum, fidelidad
+
+def get_study_model_state(bundle, modelo=None):
+    """
+    Exportable model state of a study (versioned JSON) for client-side re-estimation.
+    Includes a test vector whose expected output comes from the scalar Python engine;
+    the export is refused if the exported model does not reproduce it.
+    """
+    insumos = bundle["insumos"]
+    modelo = modelo or construir_modelo(insumos)
+    momentum, fidelidad = _test_vector(modelo)
+
+    config = dict(insumos["config"])
+    config["fidelidad"] = {**config["fidelidad"], **fidelidad}
+    esperado = estimar_aldabon_gemini(insumos["voto_directo"], insumos["recuerdo"],
+                                      insumos["partidos_ref"], config, custom_momentum=momentum)
+    valores, _ = modelo.evaluar(modelo.vector(momentum, modelo.momentum),
+                                modelo.vector(fidelidad, modelo.fidelidad))
+    if modelo.a_dicts(valores)[0] != esperado:
+        return {"status": "error",
+                "message": f"El modelo exportado (v{MODELO_VERSION}) no reproduce el motor Python."}
+
+    state = modelo.exportar()
+    state["status"] = "success"
+    state["test_vector"] = {"momentum": momentum, "fidelidad": fidelidad, "esperado": esperado}
+    return state
+
 if __name__ == "__main__":
     # Test local
     import json
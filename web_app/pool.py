@@ -0,0 +1,122 @@
+import os
+import threading
+from concurrent.futures import Future, InvalidStateError, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+
+class PoolSaturated(RuntimeError):
+    """Too many parses queued: the caller should answer 503 and let the client retry."""
+
+
+class ParseTimeout(RuntimeError):
+    """A parse exceeded its time budget. The worker may still finish, but nobody waits for it."""
+
+
+class BoundedParsePool:
+    """
+    Executor for workbook/PDF parsing with a bounded queue and a per-task time limit.
+
+    With processes=True the parses run in a ProcessPoolExecutor (one core each, no GIL
+    contention with the request threads); results are plain dicts, so they pickle back.
+    submit() raises PoolSaturated instead of queueing without limit, and the returned
+    Future fails with ParseTimeout once `timeout` seconds pass.
+    """
+
+    def __init__(self, max_workers=None, max_pending=16, timeout=120, processes=True):
+        self.max_workers = max_workers or os.cpu_count() or 2
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self.processes = processes
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._executor = self._new_executor()
+
+    def _new_executor(self):
+        if self.processes:
+            # CIS_MEMORIA_MB es por proceso: los workers se reparten el presupuesto
+            return ProcessPoolExecutor(max_workers=self.max_workers, initializer=_iniciar_worker,
+                                       initargs=(self.max_workers,))
+        return ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='cis-parse')
+
+    @property
+    def pending(self):
+        """Tasks submitted and not finished yet (running or queued)."""
+        with self._lock:
+            return self._pending
+
+    def submit(self, fn, *args):
+        with self._lock:
+            if self._pending >= self.max_pending:
+                raise PoolSaturated(f"Cola de parseo llena ({self.max_pending} tareas pendientes).")
+            self._pending += 1
+        try:
+            inner = self._submit(fn, *args)
+        except Exception:
+            with self._lock:
+                self._pending -= 1
+            raise
+
+        outer = Future()
+        timer = threading.Timer(self.timeout, _fail, (outer, ParseTimeout(
+            f"El parseo superó {self.timeout} s.")))
+        timer.daemon = True
+        timer.start()
+
+        def _done(f):
+            timer.cancel()
+            with self._lock:
+                self._pending -= 1
+            try:
+                outer.set_result(f.result())
+            except InvalidStateError:
+                pass  # ya se marcó como ParseTimeout
+            except Exception as e:
+                _fail(outer, e)
+        inner.add_done_callback(_done)
+        return outer
+
+    def _submit(self, fn, *args):
+        with self._lock:
+            executor = self._executor
+        try:
+            return executor.submit(fn, *args)
+        except BrokenProcessPool:
+            # Un worker murió (p. ej. OOM parseando un Excel): recrear el pool una vez.
+            # Solo la primera petición que lo ve roto lo sustituye; las demás usan el nuevo.
+            with self._lock:
+                if self._executor is executor:
+                    self._executor = self._new_executor()
+                    executor.shutdown(wait=False, cancel_futures=True)
+                executor = self._executor
+            return executor.submit(fn, *args)
+
+    def shutdown(self, wait=True):
+        with self._lock:
+            executor = self._executor
+        executor.shutdown(wait=wait, cancel_futures=True)
+
+
+def _iniciar_worker(procesos):
+    """Worker initializer: each process keeps 1/procesos of the CIS_MEMORIA_MB cache budget."""
+    from cis_memoria import repartir_presupuesto
+    repartir_presupuesto(procesos)
+
+
+def _fail(future, exc):
+    try:
+        future.set_exception(exc)
+    except InvalidStateError:
+        pass
+
+
+def pool_from_env():
+    """
+    Builds the parse pool from the environment:
+    CIS_POOL=process|thread, CIS_PARSE_WORKERS, CIS_PARSE_QUEUE, CIS_PARSE_TIMEOUT (seconds).
+    """
+    return BoundedParsePool(
+        max_workers=int(os.environ.get('CIS_PARSE_WORKERS', 0)) or None,
+        max_pending=int(os.environ.get('CIS_PARSE_QUEUE', 16)),
+        timeout=float(os.environ.get('CIS_PARSE_TIMEOUT', 120)),
+        processes=os.environ.get('CIS_POOL', 'process') == 'process',
+    )
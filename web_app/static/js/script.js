@@ -1,6 +1,9 @@
-document.addEventListener('DOMContentLoaded', function () {
-    fetchData();
-});
+if (typeof document !== 'undefined') {
+    document.addEventListener('DOMContentLoaded', function () {
+        fetchData();
+        initSimulator();
+    });
+}
 
 async function fetchData() {
     try {
@@ -104,3 +107,247 @@ function renderChart(data) {
         }
     });
 }
+
+// --- Simulador local de escenarios (modelo exportado por /api/studies/<id>/model) ---
+
+const MODEL_VERSION = 1;
+let simModel = null;      // Estado del modelo del estudio seleccionado
+let simLocal = false;     // true si el evaluador JS reproduce el vector de prueba del servidor
+let simChart = null;
+
+// round(x, 1) de Python: redondeo decimal exacto, empates exactos al par
+function pyRound1(x) {
+    if (Number.isInteger(x * 4) && !Number.isInteger(x * 2)) {
+        const t = Math.floor(x * 10);
+        return (t % 2 === 0 ? t : t + 1) / 10;
+    }
+    return Number(x.toFixed(1));
+}
+
+function porcentajeAbstencion(model, lam) {
+    for (const [umbral, pct] of model.umbrales_abstencion) {
+        if (lam >= umbral) return pct;
+    }
+    return model.umbrales_abstencion[model.umbrales_abstencion.length - 1][1];
+}
+
+// Evaluador de referencia: misma aritmética y mismo orden de operaciones que
+// cis_estudios.estimar_aldabon_gemini. momentum/fidelidad: {partido: valor} parciales.
+function evaluarModelo(model, momentum = {}, fidelidad = {}) {
+    const cats = model.categorias;
+    const blanco = cats.indexOf('En Blanco');
+    const abst = cats.indexOf('Abstención');
+    const lamOf = (i) => (cats[i] in momentum ? momentum[cats[i]] : model.momentum[i]);
+
+    // B. E_p = S_p × K_p × Φ_p (suelo en el voto directo)
+    const est = new Map();
+    const masa = new Map();
+    for (let i = 0; i < model.n_base; i++) {
+        const vd = model.voto_directo[i];
+        const k = model.k[i];
+        const phiBase = cats[i] in fidelidad ? fidelidad[cats[i]] : model.fidelidad[i];
+        const phi = Math.min(1.0, phiBase * k);
+        const baseVal = vd * k * phi;
+        est.set(i, Math.max(vd, baseVal));
+        if (baseVal < vd * k) masa.set(i, vd * k - baseVal);
+    }
+
+    // C. Transvases de la masa perdida
+    for (const [origen, m] of masa) {
+        if (m <= 0) continue;
+        for (const [o, destino, pct] of model.transvases) {
+            if (o === origen) est.set(destino, (est.get(destino) || 0.0) + m * pct);
+        }
+    }
+
+    // D. Momentum con matriz de sector
+    const deltas = [];
+    for (const [i, base] of est) {
+        deltas.push([i, base * (lamOf(i) - 1.0), lamOf(i)]);
+    }
+    const perdidasSector = new Map();
+    for (const [i, delta, lam] of deltas) {
+        if (delta < 0) {
+            const perdida = Math.abs(delta);
+            est.set(i, est.get(i) - perdida);
+            const pctAbst = porcentajeAbstencion(model, lam);
+            const pctSector = 1.0 - pctAbst;
+            est.set(abst, (est.get(abst) || 0) + perdida * pctAbst);
+            if (model.origenes_sector.includes(i)) {
+                perdidasSector.set(i, perdida * pctSector);
+            } else {
+                est.set(abst, est.get(abst) + perdida * pctSector);
+            }
+        } else if (delta > 0) {
+            est.set(i, est.get(i) + delta);
+            if (est.has(abst)) est.set(abst, Math.max(0, est.get(abst) - delta));
+        }
+    }
+    // Parte de sector de las pérdidas: pérdidas × matriz de sector, sumada al final
+    if (perdidasSector.size > 0) {
+        const incrementos = new Map();
+        for (const [o, destino, pct] of model.matriz_sector) {
+            if (!perdidasSector.has(o)) continue;
+            if (est.has(destino) || destino === blanco) {
+                incrementos.set(destino, (incrementos.get(destino) || 0) + perdidasSector.get(o) * pct);
+            }
+        }
+        for (let d = 0; d < cats.length; d++) {
+            if (incrementos.has(d)) est.set(d, (est.get(d) || 0) + incrementos.get(d));
+        }
+    }
+
+    // E. Normalización al 100% con ajuste de redondeo en la categoría mayor
+    const estimacion = {};
+    let total = 0;
+    for (const v of est.values()) total += v;
+    if (total > 0) {
+        for (const [i, v] of est) estimacion[cats[i]] = pyRound1(v * 100 / total);
+        let suma = 0;
+        for (const v of Object.values(estimacion)) suma += v;
+        if (Math.abs(suma - 100) > 0.01) {
+            let mayor = null;
+            for (const [p, v] of Object.entries(estimacion)) {
+                if (mayor === null || v > estimacion[mayor]) mayor = p;
+            }
+            estimacion[mayor] = pyRound1(estimacion[mayor] + (100 - suma));
+        }
+    }
+    return estimacion;
+}
+
+// Comprueba el evaluador JS contra el vector de prueba calculado por el motor Python
+function verificarModelo(model) {
+    if (model.version !== MODEL_VERSION || !model.test_vector) return false;
+    const tv = model.test_vector;
+    const obtenido = evaluarModelo(model, tv.momentum, tv.fidelidad);
+    const claves = Object.keys(tv.esperado);
+    return claves.length === Object.keys(obtenido).length &&
+        claves.every((p) => obtenido[p] === tv.esperado[p]);
+}
+
+async function fetchJSONWithRetry(url, options = {}) {
+    // El servidor responde 202 mientras el estudio se parsea en segundo plano
+    for (let intento = 0; intento < 30; intento++) {
+        const response = await fetch(url, options);
+        if (response.status !== 202) return response.json();
+        const wait = parseInt(response.headers.get('Retry-After') || '2', 10);
+        await new Promise((resolve) => setTimeout(resolve, wait * 1000));
+    }
+    throw new Error(`Timeout cargando ${url}`);
+}
+
+async function initSimulator() {
+    const select = document.getElementById('study-select');
+    if (!select) return;
+    try {
+        const data = await fetchJSONWithRetry('/api/studies');
+        data.studies.filter((s) => s.disponible).forEach((s) => {
+            const option = document.createElement('option');
+            option.value = s.id;
+            option.textContent = `${s.id} · ${s.nombre}`;
+            select.appendChild(option);
+        });
+        select.addEventListener('change', () => loadModel(select.value));
+        if (select.value) loadModel(select.value);
+    } catch (error) {
+        console.error('Error cargando estudios:', error);
+    }
+}
+
+async function loadModel(studyId) {
+    const status = document.getElementById('sim-status');
+    status.textContent = 'Cargando modelo...';
+    try {
+        const model = await fetchJSONWithRetry(`/api/studies/${studyId}/model`);
+        if (model.status !== 'success') throw new Error(model.message);
+        simModel = model;
+        simLocal = verificarModelo(model);
+        status.textContent = simLocal
+            ? 'Cálculo local (verificado contra el motor Python)'
+            : 'Cálculo en servidor (el modelo local no supera el vector de prueba)';
+        renderSliders(model);
+        updateSimulation();
+    } catch (error) {
+        status.textContent = `Error: ${error.message}`;
+    }
+}
+
+function renderSliders(model) {
+    const container = document.getElementById('momentum-sliders');
+    container.innerHTML = '';
+    model.categorias.slice(0, model.n_base).forEach((p, i) => {
+        const row = document.createElement('label');
+        row.className = 'slider-row';
+        row.innerHTML = `<span>${p}</span>
+            <input type="range" min="0.5" max="1.5" step="0.01" value="${model.momentum[i]}" data-party="${p}">
+            <output>${model.momentum[i].toFixed(2)}</output>`;
+        const input = row.querySelector('input');
+        input.addEventListener('input', () => {
+            row.querySelector('output').textContent = Number(input.value).toFixed(2);
+            updateSimulation();
+        });
+        container.appendChild(row);
+    });
+}
+
+function currentMomentum() {
+    const momentum = {};
+    document.querySelectorAll('#momentum-sliders input').forEach((input) => {
+        momentum[input.dataset.party] = Number(input.value);
+    });
+    return momentum;
+}
+
+async function updateSimulation() {
+    if (!simModel) return;
+    const momentum = currentMomentum();
+    let estimacion;
+    if (simLocal) {
+        estimacion = evaluarModelo(simModel, momentum);
+    } else {
+        const data = await fetchJSONWithRetry(`/api/studies/${simModel.study_id}/scenario`, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ momentum })
+        });
+        estimacion = data.aldabon_gemini || {};
+    }
+    renderSimulation(estimacion);
+}
+
+function renderSimulation(estimacion) {
+    const labels = Object.keys(estimacion);
+    const values = labels.map((p) => estimacion[p]);
+    if (simChart) {
+        simChart.data.labels = labels;
+        simChart.data.datasets[0].data = values;
+        simChart.update('none');
+        return;
+    }
+    const ctx = document.getElementById('simChart').getContext('2d');
+    simChart = new Chart(ctx, {
+        type: 'bar',
+        data: {
+            labels: labels,
+            datasets: [{
+                label: 'Escenario Aldabón-Gemini',
+                data: values,
+                backgroundColor: 'rgba(16, 185, 129, 0.8)',
+                borderColor: '#059669',
+                borderWidth: 2
+            }]
+        },
+        options: {
+            responsive: true,
+            maintainAspectRatio: false,
+            animation: false,
+            scales: { y: { beginAtZero: true, title: { display: true, text: 'Estimación (%)' } } }
+        }
+    });
+}
+
+// Permite usar el evaluador desde Node (verificación fuera del navegador)
+if (typeof module !== 'undefined') {
+    module.exports = { evaluarModelo, verificarModelo, pyRound1 };
+}
@@ -0,0 +1,120 @@
+"""
+Production entry point (threaded WSGI server).
+
+    cd web_app && python wsgi.py --port 8000
+    cd web_app && gunicorn -w 1 -k gthread --threads 16 wsgi:application
+
+Every request gets its own server thread (Flask runs each async view in an event loop
+of that thread), so a request waiting up to PARSE_WAIT_SECONDS for the parse pool never
+holds up the others, and concurrent parses really run side by side in the pool.
+Run a single process: the result cache lives in this process and is shared by every
+request, while workbook/PDF parsing fans out to the process pool (pool.py; tune with
+CIS_PARSE_WORKERS, CIS_PARSE_QUEUE, CIS_PARSE_TIMEOUT). Server threads: CIS_HTTP_THREADS.
+The warm cache is preloaded at start-up so the first users do not pay the parse.
+
+    cd web_app && python wsgi.py --comprobar-concurrencia
+
+checks that overlapping requests do not queue: three studies whose parse takes
+DEMORA_PRUEBA seconds must answer in about DEMORA_PRUEBA each, and /api/studies sent
+meanwhile must answer at once.
+"""
+import argparse
+import atexit
+import os
+import sys
+import threading
+import time
+import urllib.request
+
+import app as servidor
+from app import app, parse_pool, warm_all
+from pool import BoundedParsePool
+
+application = app
+
+# Hilos del servidor HTTP (peticiones simultáneas, incluidas las que esperan al pool)
+HTTP_THREADS = int(os.environ.get('CIS_HTTP_THREADS', 16))
+
+# Segundos que tarda el parseo simulado de --comprobar-concurrencia
+DEMORA_PRUEBA = 3.0
+
+
+def serve(host='0.0.0.0', port=8000, threads=HTTP_THREADS):
+    from waitress import serve as waitress_serve
+    warm_all()
+    atexit.register(parse_pool.shutdown, wait=False)
+    waitress_serve(app, host=host, port=port, threads=threads)
+
+
+def _bundle_lento(path):
+    """Parse stand-in for the concurrency check: DEMORA_PRUEBA seconds, then a minimal bundle."""
+    time.sleep(DEMORA_PRUEBA)
+    return {"status": "success", "archivo": os.path.basename(path)}
+
+
+def _get(url, resultados, clave, t0):
+    with urllib.request.urlopen(url, timeout=60) as respuesta:
+        respuesta.read()
+        resultados[clave] = (respuesta.status, time.perf_counter() - t0)
+
+
+def comprobar_concurrencia(threads=HTTP_THREADS) -> bool:
+    """Three overlapping slow study requests plus a cheap one, against a real server."""
+    from waitress import create_server
+    from cis_data_manager import list_study_ids
+
+    ids = []
+    for _, study_id in list_study_ids():
+        path, _ = servidor.get_study_file_by_id(study_id)
+        if path and os.path.exists(path) and study_id not in ids:
+            ids.append(study_id)
+    ids = ids[:3]
+    if len(ids) < 3:
+        print("Hacen falta al menos 3 estudios en el catálogo")
+        return False
+
+    servidor.get_study_bundle = _bundle_lento
+    servidor.parse_pool = BoundedParsePool(max_workers=len(ids), timeout=60)
+    server = create_server(app, host='127.0.0.1', port=0, threads=threads)
+    hilo_servidor = threading.Thread(target=server.run, daemon=True)
+    hilo_servidor.start()
+    base = f"http://127.0.0.1:{server.effective_port}"
+
+    resultados, hilos = {}, []
+    t0 = time.perf_counter()
+    for study_id in ids:
+        hilos.append(threading.Thread(target=_get, args=(f"{base}/api/studies/{study_id}", resultados, study_id, t0)))
+        hilos[-1].start()
+    time.sleep(0.3)
+    hilos.append(threading.Thread(target=_get, args=(f"{base}/api/studies", resultados, 'listado', t0)))
+    hilos[-1].start()
+    for h in hilos:
+        h.join()
+    server.close()
+    servidor.parse_pool.shutdown(wait=False)
+
+    ok = True
+    for clave, (estado, segundos) in resultados.items():
+        limite = 1.5 * DEMORA_PRUEBA if clave != 'listado' else 0.3 + 1.0
+        ok &= estado == 200 and segundos < limite
+        print(f"  {clave:>8}: HTTP {estado} a los {segundos:.2f} s (límite {limite:.1f} s)")
+    ok &= len(resultados) == len(hilos)
+    print("Concurrencia OK" if ok else "Las peticiones se encolan")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Servidor de producción CIS Aldabón-Gemini")
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--threads', type=int, default=HTTP_THREADS, help="Hilos del servidor HTTP")
+    parser.add_argument('--comprobar-concurrencia', action='store_true',
+                        help="Comprobar que las peticiones simultáneas no se encolan")
+    args = parser.parse_args()
+    if args.comprobar_concurrencia:
+        sys.exit(0 if comprobar_concurrencia(args.threads) else 1)
+    serve(args.host, args.port, args.threads)
+
+
+if __name__ == "__main__":
+    main()